@@ -4,7 +4,7 @@ import pandas as pd
 import plotly.graph_objects as go
 
 # BARU: Ganti import data_loader dengan elastic_client
-from src import config, styles, elastic_client as es
+from src import config, styles, prediction_service, elastic_client as es
 from src.components.sidebar import render  # Ganti dengan sidebar dinamis
 
 
@@ -16,6 +16,8 @@ def main():
         initial_sidebar_state="expanded",
     )
     styles.load_css()
+    # Muat & panaskan pipeline prediksi di background agar halaman prediksi langsung siap
+    prediction_service.start_warm_up()
 
     # --- BARU: Pengecekan Koneksi (tanpa menampilkan status di sidebar) ---
     ok, _ = es.ping()
@@ -0,0 +1,2 @@
+# StuntLytics/jobs
+# Job offline (dijalankan di luar Streamlit), mis.: python -m jobs.score_predictions
@@ -0,0 +1,164 @@
+# StuntLytics/jobs/build_fact_sheets.py
+# Hitung fact sheet ringkas untuk provinsi, setiap kabupaten/kota & setiap kecamatan, lalu simpan lokal
+# (src.fact_sheets.SHEETS_PATH) agar InsightNow tidak perlu query ES saat chat.
+# - Satu agregasi biasa (provinsi) + dua composite aggregation (kabupaten; kabupaten x kecamatan)
+#   dengan sub-agregasi yang sama: jumlah, stunting, rerata, % faktor risiko, persentil
+# - Tren 24 bulan dari satu composite (kabupaten, kecamatan, bulan) via get_kecamatan_month_matrix;
+#   tren kabupaten & provinsi = penjumlahan baris kecamatan (avg_prob dari jumlah & banyaknya nilai)
+# - Semua query lewat src.elastic_client; avg_prob memakai es.RISK_PROB_FIELD seperti ringkasan live
+#
+# Pemakaian:
+#   python -m jobs.build_fact_sheets [--page-size 500] [--months 24] [--output cache/fact_sheets.json]
+# Jadwalkan ulang (mis. harian) — sheet dianggap kedaluwarsa setelah FACT_SHEETS_MAX_AGE_HOURS.
+
+import argparse
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from src import elastic_client as es
+from src import fact_sheets
+
+log = logging.getLogger("build_fact_sheets")
+
+_PERCENTS = [5, 25, 50, 75, 95]
+_PERCENTILE_FIELDS = {"bmi": "BMI Pra-Hamil", "lila": "LiLA saat Hamil (cm)", "hb": "Hb (g/dL)", "z": "Z-Score TB/U"}
+
+SHEET_AGGS: Dict[str, Any] = {
+    "stunting": {"filter": es.stunting_any_filter()},
+    "avg_prob": {"avg": {"field": es.RISK_PROB_FIELD}},
+    "avg_bmi": {"avg": {"field": "BMI Pra-Hamil"}},
+    "avg_lila": {"avg": {"field": "LiLA saat Hamil (cm)"}},
+    "avg_hb": {"avg": {"field": "Hb (g/dL)"}},
+    **{name: {"filter": flt} for name, flt in es.RISK_AGGS.values()},
+    **{f"pct_{k}": {"percentiles": {"field": f, "percents": _PERCENTS}} for k, f in _PERCENTILE_FIELDS.items()},
+}
+
+
+def _sheet(aggs: Dict[str, Any], total: int, **labels: Any) -> Dict[str, Any]:
+    def pct(n: int) -> float:
+        return round(100.0 * n / total, 2) if total else 0.0
+
+    stunting = int(aggs["stunting"]["doc_count"])
+    return {
+        **labels,
+        "indikator_utama": {
+            "total_lahir": total,
+            "total_stunting": stunting,
+            "rasio_stunting": round(stunting / total, 4) if total else None,
+        },
+        "stat_rerata": {k: aggs[k]["value"] for k in ("avg_prob", "avg_bmi", "avg_lila", "avg_hb")},
+        "risiko_pct": {k: pct(aggs[name]["doc_count"]) for k, (name, _) in es.RISK_AGGS.items()},
+        "percentiles": {k: dict(aggs[f"pct_{k}"].get("values") or {}) for k in _PERCENTILE_FIELDS},
+    }
+
+
+def _trend(months, total: np.ndarray, stunting: np.ndarray, prob_sum: np.ndarray,
+           prob_count: np.ndarray) -> List[Dict[str, Any]]:
+    with np.errstate(divide="ignore", invalid="ignore"):
+        share = np.where(total > 0, stunting / total * 100, 0.0)
+        avg_prob = np.where(prob_count > 0, prob_sum / prob_count, np.nan)
+    return [
+        {
+            "periode": m.strftime("%Y-%m"),
+            "total": int(t),
+            "stunting": int(s),
+            "stunting_pct": round(float(p), 2),
+            "avg_prob": round(float(a), 4) if a == a else None,
+        }
+        for m, t, s, p, a in zip(months, total, stunting, share, avg_prob)
+        if t > 0
+    ]
+
+
+def _trends(months: int, page_size: int) -> Dict[str, Any]:
+    """Tren bulanan terakhir per kecamatan (kunci kab\x1fkec), per kabupaten, dan provinsi."""
+    m = es.get_kecamatan_month_matrix({}, page_size=page_size)
+    cols = m["months"][-months:]
+    series = [m[k][:, -months:] for k in ("total", "stunting", "prob_sum", "prob_count")]
+
+    kab_names, kab_row = np.unique(m["kabupaten"].astype(str), return_inverse=True)
+    kab_series = []
+    for arr in series:
+        summed = np.zeros((len(kab_names), arr.shape[1]), dtype=arr.dtype)
+        np.add.at(summed, kab_row, arr)
+        kab_series.append(summed)
+
+    return {
+        "kecamatan": {
+            f"{kab}\x1f{kec}": _trend(cols, *(arr[i] for arr in series))
+            for i, (kab, kec) in enumerate(zip(m["kabupaten"], m["kecamatan"]))
+        },
+        "kabupaten": {kab: _trend(cols, *(arr[i] for arr in kab_series)) for i, kab in enumerate(kab_names)},
+        "provinsi": _trend(cols, *(arr.sum(axis=0) for arr in series)),
+    }
+
+
+def run(output: str = fact_sheets.SHEETS_PATH, page_size: int = 500, months: int = fact_sheets.TREND_MONTHS) -> Dict[str, Any]:
+    started = time.perf_counter()
+    body = {"query": {"match_all": {}}}
+
+    data = es.search({**body, "size": 0, "track_total_hits": True, "aggs": SHEET_AGGS})
+    total = data["hits"]["total"]
+    provinsi = _sheet(data["aggregations"], int(total["value"] if isinstance(total, dict) else total), level="provinsi")
+
+    kabupaten: Dict[str, Dict[str, Any]] = {}
+    sources = [{"kabupaten": {"terms": {"field": "nama_kabupaten_kota"}}}]
+    for buckets, _ in es.iter_composite_pages(es.STUNTING_INDEX, body, sources, SHEET_AGGS, page_size=page_size):
+        for b in buckets:
+            kab = b["key"]["kabupaten"]
+            kabupaten[kab] = _sheet(b, b["doc_count"], level="kabupaten", kabupaten=kab)
+
+    kecamatan: Dict[str, List[Dict[str, Any]]] = {}
+    sources = sources + [{"kecamatan": {"terms": {"field": "Kecamatan"}}}]
+    for buckets, _ in es.iter_composite_pages(es.STUNTING_INDEX, body, sources, SHEET_AGGS, page_size=page_size):
+        for b in buckets:
+            kab, kec = b["key"]["kabupaten"], b["key"]["kecamatan"]
+            kecamatan.setdefault(kec, []).append(
+                _sheet(b, b["doc_count"], level="kecamatan", kabupaten=kab, kecamatan=kec)
+            )
+
+    trends = _trends(months, page_size)
+    provinsi["trend_bulanan"] = trends["provinsi"]
+    for kab, sheet in kabupaten.items():
+        sheet["trend_bulanan"] = trends["kabupaten"].get(kab, [])
+    for sheets in kecamatan.values():
+        for sheet in sheets:
+            sheet["trend_bulanan"] = trends["kecamatan"].get(f"{sheet['kabupaten']}\x1f{sheet['kecamatan']}", [])
+
+    now = datetime.now(timezone.utc)
+    fact_sheets.save({
+        "generated_at": now.isoformat(timespec="seconds"),
+        "generated_at_ts": now.timestamp(),
+        "provinsi": provinsi,
+        "kabupaten": kabupaten,
+        "kecamatan": kecamatan,
+    }, output)
+
+    stats = {
+        "kabupaten": len(kabupaten),
+        "kecamatan": sum(len(v) for v in kecamatan.values()),
+        "seconds": time.perf_counter() - started,
+        "output": output,
+    }
+    log.info("Fact sheet: %d kabupaten/kota, %d kecamatan -> %s (%.1f detik)",
+             stats["kabupaten"], stats["kecamatan"], output, stats["seconds"])
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Hitung fact sheet provinsi/kabupaten/kecamatan untuk InsightNow.")
+    parser.add_argument("--output", default=fact_sheets.SHEETS_PATH)
+    parser.add_argument("--page-size", type=int, default=500, help="bucket per halaman composite aggregation")
+    parser.add_argument("--months", type=int, default=fact_sheets.TREND_MONTHS, help="panjang tren bulanan")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    run(output=args.output, page_size=args.page_size, months=args.months)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# StuntLytics/jobs/build_kabupaten_geojson.py
+# Bangun batas kabupaten/kota (geojson/jawa-barat-kabupaten.geojson) dari poligon kecamatan.
+# - Sisi yang dipakai bersama dua kecamatan dibuang, sisa sisi (batas luar) dirangkai ulang
+# - Ring di dalam ring luar menjadi hole (mis. enklave kota di dalam kabupaten)
+# - Rangkaian sisi yang tidak menutup dihitung & dilaporkan; kabupaten yang kehilangan luas
+#   signifikan memakai poligon kecamatan apa adanya
+# Halaman Peta Risiko hanya membaca hasilnya (tidak pernah men-dissolve saat runtime).
+#
+# Pemakaian:
+#   python -m jobs.build_kabupaten_geojson [--input geojson/jawa-barat.geojson] [--output ...]
+# Jalankan ulang setiap kali geojson kecamatan berubah, lalu commit hasilnya.
+
+import argparse
+import json
+import logging
+import pathlib
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+log = logging.getLogger("build_kabupaten_geojson")
+
+GEOJSON_DIR = pathlib.Path(__file__).parents[1] / "geojson"
+INPUT_PATH = GEOJSON_DIR / "jawa-barat.geojson"
+OUTPUT_PATH = GEOJSON_DIR / "jawa-barat-kabupaten.geojson"
+
+# Presisi koordinat (derajat) untuk mencocokkan sisi bersama antar kecamatan
+DISSOLVE_PRECISION = 6
+# Batas toleransi: bila luas hasil dissolve < (1 - toleransi) x total luas kecamatan -> fallback
+AREA_TOLERANCE = 0.01
+
+
+def _iter_polygons(geometry: dict):
+    """Yield list ring (outer + holes) untuk Polygon/MultiPolygon."""
+    gtype = (geometry or {}).get("type")
+    coords = (geometry or {}).get("coordinates") or []
+    if gtype == "Polygon":
+        yield coords
+    elif gtype == "MultiPolygon":
+        for poly in coords:
+            yield poly
+
+
+def _ring_area(ring) -> float:
+    area = 0.0
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+        area += x1 * y2 - x2 * y1
+    return area / 2.0
+
+
+def _polygons_area(polygons: list) -> float:
+    """Luas MultiPolygon (ring luar dikurangi hole)."""
+    return sum(abs(_ring_area(poly[0])) - sum(abs(_ring_area(h)) for h in poly[1:]) for poly in polygons if poly)
+
+
+def _point_in_ring(pt, ring) -> bool:
+    x, y = pt
+    inside = False
+    for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+        if (y1 > y) != (y2 > y):
+            x_cross = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            if x < x_cross:
+                inside = not inside
+    return inside
+
+
+def _dissolve_rings(rings: list) -> Tuple[list, int]:
+    """Gabungkan ring-ring kecamatan: sisi yang dipakai bersama dua kecamatan dibuang,
+    sisi sisanya (batas luar) dirangkai ulang menjadi ring tertutup.
+    Kembalikan (ring tertutup, jumlah rangkaian yang tidak menutup & dibuang)."""
+
+    def _edge(a, b):
+        return (a, b) if a < b else (b, a)
+
+    edge_count: Counter = Counter()
+    for ring in rings:
+        pts = [(round(p[0], DISSOLVE_PRECISION), round(p[1], DISSOLVE_PRECISION)) for p in ring]
+        for a, b in zip(pts, pts[1:]):
+            if a != b:
+                edge_count[_edge(a, b)] += 1
+
+    boundary = [e for e, n in edge_count.items() if n == 1]
+    adjacency = defaultdict(list)
+    for a, b in boundary:
+        adjacency[a].append(b)
+        adjacency[b].append(a)
+
+    used, out, dropped = set(), [], 0
+    for a, b in boundary:
+        if _edge(a, b) in used:
+            continue
+        used.add(_edge(a, b))
+        ring, cur = [a], b
+        while cur != a:
+            ring.append(cur)
+            nxt = next((n for n in adjacency[cur] if _edge(cur, n) not in used), None)
+            if nxt is None:
+                break
+            used.add(_edge(cur, nxt))
+            cur = nxt
+        if cur == a and len(ring) >= 3:
+            out.append([list(p) for p in ring] + [list(a)])
+        else:
+            dropped += 1
+    return out, dropped
+
+
+def _rings_to_multipolygon(rings: list) -> list:
+    """Susun ring jadi koordinat MultiPolygon: ring di dalam ring luar = hole (mis. enklave kota)."""
+    placed = []  # (ring, vertex_set, depth, polygon_idx), terurut dari yang terluas
+    polygons: list = []
+    for ring in sorted(rings, key=lambda r: abs(_ring_area(r)), reverse=True):
+        parent = None
+        for cand in reversed(placed):
+            # Uji titik yang tidak berada di batas kandidat (ring bisa bersinggungan di satu titik)
+            probe = next((p for p in ring if tuple(p) not in cand[1]), ring[0])
+            if _point_in_ring(probe, cand[0]):
+                parent = cand
+                break
+        if parent is not None and parent[2] % 2 == 0:
+            polygons[parent[3]].append(ring)
+            placed.append((ring, {tuple(p) for p in ring}, parent[2] + 1, parent[3]))
+        else:
+            polygons.append([ring])
+            depth = 0 if parent is None else parent[2] + 1
+            placed.append((ring, {tuple(p) for p in ring}, depth, len(polygons) - 1))
+    return polygons
+
+
+def _group_key(name: str) -> str:
+    # "Kota Bandung" dan "Kabupaten Bandung" tetap terpisah; hanya spasi/huruf yang diseragamkan
+    return " ".join((name or "").upper().split())
+
+
+def dissolve_to_kabupaten(geojson: dict) -> Tuple[dict, Dict[str, Any]]:
+    """Dissolve poligon kecamatan menjadi satu fitur per kabupaten/kota (properti KABKOT).
+    Kembalikan (FeatureCollection, statistik {dropped_rings, fallback})."""
+    groups: dict = {}
+    for feature in geojson.get("features", []):
+        prop = feature.get("properties", {})
+        key = _group_key(prop.get("KABKOT", ""))
+        if not key:
+            continue
+        grp = groups.setdefault(key, {"name": prop.get("KABKOT", ""), "polygons": []})
+        grp["polygons"].extend(_iter_polygons(feature.get("geometry")))
+
+    features, stats = [], {"dropped_rings": {}, "fallback": []}
+    for grp in groups.values():
+        rings = [ring for poly in grp["polygons"] for ring in poly]
+        coords, dropped = [], 0
+        try:
+            dissolved, dropped = _dissolve_rings(rings)
+            coords = _rings_to_multipolygon(dissolved)
+        except Exception as e:
+            log.warning("Dissolve %s gagal: %s", grp["name"], e)
+        if dropped:
+            stats["dropped_rings"][grp["name"]] = dropped
+            log.warning("%s: %d rangkaian sisi tidak menutup dan dibuang", grp["name"], dropped)
+
+        source_area = _polygons_area(grp["polygons"])
+        if not coords or _polygons_area(coords) < source_area * (1 - AREA_TOLERANCE):
+            # Topologi tidak rapi / luas hilang -> pakai poligon kecamatan apa adanya
+            stats["fallback"].append(grp["name"])
+            log.warning("%s: memakai poligon kecamatan apa adanya (hasil dissolve kehilangan luas)", grp["name"])
+            coords = grp["polygons"]
+        features.append(
+            {
+                "type": "Feature",
+                "properties": {"KABKOT": grp["name"]},
+                "geometry": {"type": "MultiPolygon", "coordinates": coords},
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}, stats
+
+
+def run(input_path: pathlib.Path = INPUT_PATH, output_path: pathlib.Path = OUTPUT_PATH) -> Dict[str, Any]:
+    with open(input_path, "r", encoding="utf-8") as f:
+        kab_geojson, stats = dissolve_to_kabupaten(json.load(f))
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(kab_geojson, f, ensure_ascii=False)
+    log.info("%d kabupaten/kota -> %s (%d dengan ring dibuang, %d fallback)",
+             len(kab_geojson["features"]), output_path, len(stats["dropped_rings"]), len(stats["fallback"]))
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Dissolve geojson kecamatan menjadi batas kabupaten/kota.")
+    parser.add_argument("--input", type=pathlib.Path, default=INPUT_PATH)
+    parser.add_argument("--output", type=pathlib.Path, default=OUTPUT_PATH)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    run(args.input, args.output)
+
+
+if __name__ == "__main__":
+    main()
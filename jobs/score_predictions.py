@@ -0,0 +1,247 @@
+# StuntLytics/jobs/score_predictions.py
+# Skor seluruh dokumen index stunting dengan pipeline model lalu tulis balik probabilitasnya ke ES.
+# - Dokumen dialirkan via PIT + search_after (elastic_client.iter_pit_pages)
+# - Field ES dipetakan ke nama fitur pipeline (dicek terhadap mapping index sebelum mulai) &
+#   divalidasi dengan prediction_service.prepare_batch; jumlah tidak valid dicatat per fitur
+# - Chunk diskor paralel di process pool (pipeline dimuat sekali per worker)
+# - Hasil ditulis via _bulk partial update: probabilitas + versi model
+# - Resumable: dokumen yang sudah berversi model yang sama dilewati (kecuali --force); dokumen
+#   tidak valid ikut diberi versi dengan probabilitas null
+#
+# Pemakaian:
+#   python -m jobs.score_predictions [--workers 4] [--batch-size 2000] [--force] [--dry-run]
+# Setelah selesai, set RISK_PROB_FIELD="Probabilitas Stunting (model)" agar filter zona risiko
+# di dashboard memakai output model.
+
+import argparse
+import logging
+import os
+import time
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from src import elastic_client as es
+from src import prediction_service
+
+MODEL_PROB_FIELD = os.getenv("MODEL_PROB_FIELD", "Probabilitas Stunting (model)")
+MODEL_VERSION_FIELD = os.getenv("MODEL_VERSION_FIELD", "Versi Model Stunting")
+MODEL_SCORED_AT_FIELD = os.getenv("MODEL_SCORED_AT_FIELD", "Waktu Skor Model")
+
+# fitur pipeline -> kandidat field dokumen di index stunting (yang pertama ada di mapping dipakai).
+# Nama kedua dst. = label form prediksi; override per fitur: --field fitur="Nama Field".
+ES_FEATURE_CANDIDATES: Dict[str, List[str]] = {
+    "tinggi_badan_ibu_cm": ["Tinggi Badan Ibu (cm)"],
+    "lila_saat_hamil_cm": ["LiLA saat Hamil (cm)"],
+    "bmi_pra_hamil": ["BMI Pra-Hamil"],
+    "hb_g_dl": ["Hb (g/dL)"],
+    "kenaikan_bb_hamil_kg": ["Kenaikan BB saat Hamil (kg)", "Kenaikan BB Hamil (kg)"],
+    "usia_ibu_saat_hamil_tahun": ["Usia Ibu saat Hamil (tahun)"],
+    "jarak_kehamilan_sebelumnya_bulan": ["Jarak Kehamilan Sebelumnya (bulan)"],
+    "kunjungan_anc_x": ["Kunjungan ANC (x)", "Jumlah Kunjungan ANC"],
+    "jumlah_anak": ["Jumlah Anak", "Total Jumlah Anak Sebelumnya"],
+    "kepatuhan_ttd": ["Kepatuhan Konsumsi TTD", "Kepatuhan TTD"],
+    "pendidikan_ibu": ["Pendidikan Ibu"],
+    "jenis_pekerjaan_orang_tua": ["Jenis Pekerjaan Orang Tua"],
+    "status_pernikahan": ["Status Pernikahan"],
+    "kepesertaan_program_bantuan": ["Kepesertaan Program Bantuan"],
+    "akses_air_bersih": ["Akses Air Bersih", "Akses Air"],
+    "paparan_asap_rokok": ["Paparan Asap Rokok"],
+    "hipertensi_ibu": ["Riwayat Hipertensi Ibu", "Hipertensi Ibu"],
+    "diabetes_ibu": ["Riwayat Diabetes Ibu", "Diabetes Ibu"],
+}
+
+
+def resolve_feature_map(fields: set, overrides: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    """fitur -> field yang benar-benar ada di mapping index. Raise RuntimeError bila ada fitur tanpa field:
+    tanpa pemeriksaan ini setiap dokumen menjadi tidak valid dan job tidak menulis apa pun."""
+    resolved, missing = {}, []
+    for feat, candidates in ES_FEATURE_CANDIDATES.items():
+        options = [overrides[feat]] if overrides and feat in overrides else candidates
+        found = next((f for f in options if f in fields), None)
+        if found is None:
+            missing.append(f"{feat} ({' / '.join(options)})")
+        else:
+            resolved[feat] = found
+    if missing:
+        raise RuntimeError(
+            f"Field fitur tidak ditemukan di mapping index {es.STUNTING_INDEX}: " + "; ".join(missing)
+            + ". Periksa nama field lalu berikan --field fitur=\"Nama Field\"."
+        )
+    return resolved
+
+
+# Variasi nilai di index -> nilai kanonik form (dicocokkan case-insensitive)
+_YA_TIDAK_ALIASES = {
+    "layak": "Ya", "tidak layak": "Tidak", "ada": "Ya", "tidak ada": "Tidak",
+    "true": "Ya", "false": "Tidak", "1": "Ya", "0": "Tidak",
+}
+VALUE_ALIASES: Dict[str, Dict[str, str]] = {
+    "akses_air_bersih": _YA_TIDAK_ALIASES,
+    "paparan_asap_rokok": _YA_TIDAK_ALIASES,
+    "kepesertaan_program_bantuan": _YA_TIDAK_ALIASES,
+    "pendidikan_ibu": {"d3": "Diploma", "s2": "S2/S3", "s3": "S2/S3", "smk": "SMA"},
+}
+
+log = logging.getLogger("score_predictions")
+
+_PIPELINE = None  # per proses worker
+
+
+def model_version(path: str = prediction_service.PIPELINE_PATH) -> str:
+    """Versi model = hash isi file pipeline; berubah otomatis saat model dilatih ulang."""
+    return prediction_service.model_hash(path)
+
+
+def hits_to_frame(hits: List[Dict[str, Any]], feature_map: Dict[str, str]) -> pd.DataFrame:
+    """Hit ES -> tabel berkolom nama fitur pipeline (index = posisi hit)."""
+    rows = [h.get("_source", {}) for h in hits]
+    df = pd.DataFrame({feat: [r.get(field) for r in rows] for feat, field in feature_map.items()})
+    for feat, aliases in VALUE_ALIASES.items():
+        lowered = df[feat].astype("string").str.strip().str.lower()
+        df[feat] = lowered.map(aliases).fillna(df[feat].astype("string").str.strip()).astype(object)
+    return df
+
+
+def _init_worker(path: str):
+    global _PIPELINE
+    _PIPELINE, _ = prediction_service.load_inference_pipeline(path)
+
+
+def _score_chunk(features: pd.DataFrame) -> np.ndarray:
+    return _PIPELINE.predict_proba(features)[:, 1]
+
+
+def _build_body(force: bool, version: str, feature_map: Dict[str, str]) -> Dict[str, Any]:
+    body = es.build_query({})
+    if not force:
+        body["query"] = {"bool": {"must_not": [{"term": {MODEL_VERSION_FIELD: version}}]}}
+    body["_source"] = list(feature_map.values())
+    return body
+
+
+def _count_issues(issues: pd.Series, counter: Counter):
+    for text in issues[issues != ""]:
+        counter.update(text.split(", "))
+
+
+def run(
+    batch_size: int = 2000,
+    chunk_size: int = 1000,
+    workers: int = 4,
+    force: bool = False,
+    dry_run: bool = False,
+    pipeline_path: str = prediction_service.PIPELINE_PATH,
+    log_every: int = 10,
+    field_overrides: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    version = model_version(pipeline_path)
+    feature_map = resolve_feature_map(es.get_field_names(), field_overrides)
+    log.info("Model %s (versi %s) -> field '%s'", pipeline_path, version, MODEL_PROB_FIELD)
+    if not dry_run:
+        es.put_mapping({
+            MODEL_PROB_FIELD: {"type": "float"},
+            MODEL_VERSION_FIELD: {"type": "keyword"},
+            MODEL_SCORED_AT_FIELD: {"type": "date"},
+        })
+
+    stats = {"read": 0, "scored": 0, "invalid": 0, "written": 0, "failed": 0}
+    invalid_by_feature: Counter = Counter()
+    started = time.perf_counter()
+
+    body = _build_body(force, version, feature_map)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(pipeline_path,)) as pool:
+        for page_no, hits in enumerate(es.iter_pit_pages(body, batch_size=batch_size), start=1):
+            stats["read"] += len(hits)
+            prepared = prediction_service.prepare_batch(hits_to_frame(hits, feature_map))
+            valid = prepared["valid"].to_numpy()
+            features = prepared["features"][valid]
+            stats["invalid"] += int((~valid).sum())
+            _count_issues(prepared["issues"], invalid_by_feature)
+            if not valid.any():
+                # Hampir pasti field/nilai salah petakan, bukan data kotor: hentikan sebelum menandai
+                # seluruh index sebagai tidak valid
+                raise RuntimeError(
+                    f"Halaman {page_no}: seluruh {len(hits)} dokumen tidak valid. Tidak valid per fitur: "
+                    + ", ".join(f"{k}={v}" for k, v in invalid_by_feature.most_common())
+                )
+
+            chunks = [features.iloc[i:i + chunk_size] for i in range(0, len(features), chunk_size)]
+            proba = np.concatenate(list(pool.map(_score_chunk, chunks))) if chunks else np.empty(0)
+            stats["scored"] += len(proba)
+
+            scored_at = datetime.now(timezone.utc).isoformat()
+            probs = iter(proba)
+            # Dokumen tidak valid tetap diberi versi (probabilitas null) agar tidak dibaca ulang
+            # setiap run; --force atau model baru akan mencobanya lagi
+            updates = [
+                (h["_index"], h["_id"], {
+                    MODEL_PROB_FIELD: round(float(next(probs)), 6) if ok else None,
+                    MODEL_VERSION_FIELD: version,
+                    MODEL_SCORED_AT_FIELD: scored_at,
+                })
+                for h, ok in zip(hits, valid)
+            ]
+            if not dry_run:
+                res = es.bulk_update(updates)
+                stats["written"] += res["updated"]
+                stats["failed"] += res["failed"]
+
+            if page_no % log_every == 0:
+                elapsed = time.perf_counter() - started
+                log.info(
+                    "%d dibaca, %d diskor, %d tidak valid, %d ditulis (%.0f dok/detik)",
+                    stats["read"], stats["scored"], stats["invalid"], stats["written"], stats["read"] / elapsed,
+                )
+                if invalid_by_feature:
+                    log.info("Tidak valid per fitur: %s", dict(invalid_by_feature.most_common()))
+
+    seconds = time.perf_counter() - started
+    stats.update({
+        "seconds": seconds,
+        "docs_per_sec": stats["read"] / seconds if seconds > 0 else 0.0,
+        "version": version,
+        "invalid_by_feature": dict(invalid_by_feature),
+    })
+    log.info(
+        "Selesai: %d dibaca, %d diskor, %d tidak valid, %d ditulis, %d gagal dalam %.1f detik (%.0f dok/detik)",
+        stats["read"], stats["scored"], stats["invalid"], stats["written"], stats["failed"], seconds, stats["docs_per_sec"],
+    )
+    if invalid_by_feature:
+        log.warning("Dokumen tidak valid per fitur: %s", dict(invalid_by_feature.most_common()))
+    if stats["failed"]:
+        log.warning("Sebagian update gagal; jalankan ulang job untuk melanjutkan dokumen yang belum berversi %s.", version)
+    return stats
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Skor index stunting dengan pipeline model & tulis balik ke ES.")
+    parser.add_argument("--batch-size", type=int, default=2000, help="dokumen per halaman PIT")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="baris per tugas worker")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--pipeline", default=prediction_service.PIPELINE_PATH)
+    parser.add_argument("--force", action="store_true", help="skor ulang dokumen yang sudah berversi model ini")
+    parser.add_argument("--dry-run", action="store_true", help="skor tanpa menulis ke ES")
+    parser.add_argument("--field", action="append", default=[], metavar='FITUR="Nama Field"',
+                        help="paksa field index untuk satu fitur pipeline (boleh berulang)")
+    args = parser.parse_args(argv)
+    overrides = dict(item.split("=", 1) for item in args.field)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    run(
+        batch_size=args.batch_size,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        force=args.force,
+        dry_run=args.dry_run,
+        pipeline_path=args.pipeline,
+        field_overrides=overrides,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,11 @@
 import streamlit as st
 import os
-import json
-import openai  # Mengganti requests dengan library resmi OpenAI
-from src import styles, elastic_client as es
+from src import styles
 from src.components import sidebar
 
 
-# --- FUNGSI AKSES LLM (DI-UPGRADE KE OPENAI) ---
-def _get_openai_api_key():
-    # Mencari OPENAI_API_KEY
-    env_key = os.getenv("OPENAI_API_KEY", "")
-    if env_key:
-        return env_key
-    try:
-        return st.secrets.get("OPENAI_API_KEY", "")
-    except Exception:
-        return ""
-
-
 # stunting_app/components/insightnow.py
-import os, json, re
-import json
-import streamlit as st
-from openai import OpenAI
-from utils import es
+from src import chat_context, context_compaction, entity_index, fact_sheets, llm_cache, llm_client
 # from utils.filters import sidebar_filters
 from textwrap import dedent
 
@@ -114,137 +96,37 @@ Zona probabilitas stunting:
 
 
 # ================== OpenAI config ==================
-MODEL_ID = os.getenv("INSIGHT_MODEL_ID", "gpt-4.1-nano")
-OPENAI_API_KEY = _get_openai_api_key()  # perbaikan: panggil fungsi untuk mengambil API key
-
-# ================== Utils: alias & deteksi entitas ==================
-def _norm(s: str) -> str:
-    s = (s or "").lower().strip()
-    s = re.sub(r"[^a-z0-9\s]", " ", s)
-    s = re.sub(r"\s+", " ", s)
-    repl = {"kabupaten ": "kab ", "kab. ": "kab ", "kota ": "kota ", "kab ": "kab "}
-    for k, v in repl.items(): s = s.replace(k, v)
-    return s
-
-def build_alias_index(names: list) -> dict:
-    idx = {}
-    for n in names:
-        if not isinstance(n, str): continue
-        base = n.strip()
-        variants = {base, base.lower(), base.lower().title(), _norm(base)}
-        for v in variants: idx[v] = base
-    return idx
-
-def detect_wilayah_in_text(text: str, alias_idx: dict, max_matches: int = 3) -> list:
-    t = _norm(text); found, seen = [], set()
-    for alias, resmi in alias_idx.items():
-        if alias in t and resmi not in seen:
-            seen.add(resmi); found.append(resmi)
-            if len(found) >= max_matches: break
-    return found
-
-def detect_kecamatan_in_text(text: str, alias_idx: dict, max_matches: int = 5) -> list:
-    t = _norm(text); found, seen = [], set()
-    for alias, resmi in alias_idx.items():
-        if alias in t and resmi not in seen:
-            seen.add(resmi); found.append(resmi)
-            if len(found) >= max_matches: break
-    return found
-
-def _terms(index: str, field: str, size: int = 3000) -> list:
-    body = {"size": 0, "aggs": {"x": {"terms": {"field": field, "size": size}}}}
-    data = es._es_post(index, "/_search", body)
-    return [b["key"] for b in data["aggregations"]["x"]["buckets"]]
-
-def kecamatan_to_wilayah_map() -> dict:
-    body = {
-        "size": 0,
-        "aggs": {
-            "kec": {
-                "terms": {"field": "Kecamatan", "size": 5000},
-                "aggs": {
-                    "wil": {"top_hits": {"_source": {"includes": ["nama_kabupaten_kota","Wilayah"]}, "size": 1}}
-                }
-            }
-        }
-    }
-    data = es._es_post(es.STUNTING_INDEX, "/_search", body)
-    m = {}
-    for b in data["aggregations"]["kec"]["buckets"]:
-        try:
-            src = b["wil"]["hits"]["hits"][0]["_source"]
-            m[b["key"]] = src.get("nama_kabupaten_kota") or src.get("Wilayah")
-        except Exception:
-            pass
-    return m
-
-def balita_total(filters: dict) -> int | None:
-    must = []
-    if filters.get("wilayah"):
-        must.append({"terms": {"bps_nama_kabupaten_kota": filters["wilayah"]}})
-    if filters.get("date_from") or filters.get("date_to"):
-        yr = {}
-        if filters.get("date_from"): yr["gte"] = filters["date_from"][:4]
-        if filters.get("date_to"):   yr["lte"] = filters["date_to"][:4]
-        if yr: must.append({"range": {"tahun": yr}})
-    q = {"bool": {"must": must}} if must else {"match_all": {}}
-    body = {"query": q, "size": 0, "aggs": {"sum": {"sum": {"field": "jumlah_balita"}}}}
-    try:
-        data = es._es_post(es.BALITA_INDEX, "/_search", body)
-        return int(round(data["aggregations"]["sum"]["value"] or 0))
-    except Exception:
-        return None
-
-# ================== Router tambahan (tambahkan tren/top dsb) ==================
-def _route_extra(question: str, filters: dict) -> dict:
-    q = (question or "").lower()
-    extra = {}
+MODEL_ID = os.getenv("INSIGHT_MODEL_ID", llm_client.DEFAULT_MODEL)
+OPENAI_API_KEY = llm_client.get_api_key()
 
-    # Tren bulanan
-    if any(k in q for k in ["tren", "trend", "bulan", "bulanan"]):
-        extra["tren_bulanan"] = es.trend_monthly(filters)
-
-    # Top wilayah/kecamatan
-    if "top" in q and any(k in q for k in ["kab", "kabupaten", "kota"]):
-        extra["top_kabupaten"] = es.top_counts("Wilayah", filters, size=10).to_dict("records")
-    if "top" in q and "kec" in q:
-        extra["top_kecamatan"] = es.top_counts("Kecamatan", filters, size=10).to_dict("records")
-
-    # Metrik risiko spesifik
+# ================== Utils: deteksi entitas ==================
+# Kamus alias + automaton Aho-Corasick ada di src.entity_index (dibangun sekali per versi data,
+# baru saat pesan pertama masuk).
+def _entity_index():
     try:
-        s = es.summary_for_filters(filters, min_n_kec=20)
-        if any(w in q for w in ["anemia","hb"]):
-            extra["risiko_anemia_pct"] = s["risiko_pct"]["anemia_hb_lt_11"]
-        if any(w in q for w in ["bblr","berat lahir"]):
-            extra["risiko_bblr_pct"] = s["risiko_pct"]["bblr_lt_2500"]
-        if "lila" in q:
-            extra["risiko_lila_low_pct"] = s["risiko_pct"]["lila_lt_23_5"]
-        if "bmi" in q:
-            extra["risiko_bmi_low_pct"] = s["risiko_pct"]["bmi_lt_18_5"]
-        if "anc" in q:
-            extra["risiko_anc_low_pct"] = s["risiko_pct"]["anc_le_2"]
-        if "asi" in q:
-            extra["asi_eks_tidak_pct"] = s["risiko_pct"]["asi_eks_tidak"]
+        return entity_index.get_entity_index()
     except Exception:
-        pass
-
-    return extra
+        return None
 
 # ================== LLM helper ==================
-def _call_llm(messages: list) -> str:
+def _stream_llm(messages: list, question: str):
+    """Generator potongan jawaban (client OpenAI bersama di src.llm_client) untuk st.write_stream."""
     if not OPENAI_API_KEY:
-        return "⚠️ OPENAI_API_KEY belum diatur (env/secrets)."
+        yield "⚠️ OPENAI_API_KEY belum diatur (env/secrets)."
+        return
     try:
-        client = OpenAI(api_key=OPENAI_API_KEY)
-        resp = client.chat.completions.create(
+        yield from llm_client.stream_chat(
+            messages,
+            site="insightnow_chat",
             model=MODEL_ID,
-            messages=messages,
+            api_key=OPENAI_API_KEY,
+            cache=True,  # pertanyaan + konteks padat + riwayat sama -> jawaban dari src.llm_cache
+            cache_question=question,
             temperature=0.25,
             max_tokens=1200,
         )
-        return resp.choices[0].message.content
     except Exception as e:
-        return f"⚠️ Gagal memanggil OpenAI API: {e}"
+        yield f"\n\n⚠️ Gagal memanggil OpenAI API: {e}"
 
 # ================== System prompt builder ==================
 def _build_system_prompt(context_json: dict) -> str:
@@ -255,6 +137,9 @@ def _build_system_prompt(context_json: dict) -> str:
         + "- Jawab HANYA berdasarkan 'context_json' yang diberikan (bagian 'summary' dan 'extra').\n"
         + "- Jika 'extra.tren_bulanan' ADA, WAJIB jelaskan tren bulanan (naik/turun/stabil), bulan puncak & terendah, dan kisaran persentasenya.\n"
         + "- Jika 'extra.tren_bulanan' TIDAK ADA, gunakan 'summary.trend_bulanan' bila tersedia.\n"
+        + "- Tabel berbentuk {'kolom': [...], 'baris': [[...]]}; '*_pct' & 'pct' berskala 0-100; 'rasio_*', 'cakupan_*', 'akses_*' & 'avg_prob' berskala 0..1.\n"
+        + "- Jika 'summary.fact_sheets' ADA, isinya ringkasan per entitas (provinsi/kabupaten/kecamatan); bandingkan antar entitas.\n"
+        + "- Bagian yang tercantum di 'sama_dengan_sebelumnya' tidak berubah dari context_json sebelumnya di percakapan ini; pakai nilai tersebut.\n"
         + "- Jika metrik null/tidak tersedia, tulis 'tidak tersedia' tanpa mengarang."
     ).strip()
 
@@ -277,27 +162,6 @@ def render_page():
     flt = sidebar.render()
     st.caption("Chat selalu menghormati filter aktif.")
 
-    # ===== Kamus alias nama wilayah/kecamatan =====
-    try:
-        wilayah_names = _terms(es.STUNTING_INDEX, "nama_kabupaten_kota", 500) or \
-                        _terms(es.STUNTING_INDEX, "Wilayah", 500)
-    except Exception:
-        wilayah_names = []
-    alias_w = build_alias_index(wilayah_names)
-
-    try:
-        must = []
-        if flt.get("wilayah"):
-            must.append({"terms": {(flt.get("wilayah_field") or "nama_kabupaten_kota"): flt["wilayah"]}})
-        body = {"query": {"bool": {"must": must}}} if must else {"query": {"match_all": {}}}
-        body.update({"size": 0, "aggs": {"k": {"terms": {"field": "Kecamatan", "size": 5000}}}})
-        data = es._es_post(es.STUNTING_INDEX, "/_search", body)
-        kecamatan_names = [b["key"] for b in data["aggregations"]["k"]["buckets"]]
-    except Exception:
-        kecamatan_names = []
-    alias_k = build_alias_index(kecamatan_names)
-    kec2wil = kecamatan_to_wilayah_map()
-
     # ===== History =====
     if "ins_chat" not in st.session_state:
         st.session_state.ins_chat = []
@@ -337,12 +201,16 @@ def render_page():
         st.markdown(user_msg)
 
     # ===== Deteksi entitas =====
-    targets_w = detect_wilayah_in_text(user_msg, alias_w)
-    targets_k = detect_kecamatan_in_text(user_msg, alias_k)
-    if targets_k and not targets_w:
-        derived_w = sorted({kec2wil.get(k) for k in targets_k if kec2wil.get(k)})
-        if derived_w:
-            targets_w = derived_w
+    targets_w, targets_k = [], []
+    with st.spinner("Mengenali wilayah di pertanyaan…"):
+        idx = _entity_index()
+    if idx is not None:
+        targets_w = idx.detect_wilayah(user_msg)
+        targets_k = idx.detect_kecamatan(user_msg, within=flt.get("wilayah"))
+        if targets_k and not targets_w:
+            derived_w = idx.wilayah_for(targets_k, within=flt.get("wilayah"))
+            if derived_w:
+                targets_w = derived_w
 
     # ===== Filter khusus chat =====
     chat_filters = dict(flt)
@@ -353,37 +221,31 @@ def render_page():
     if targets_k:
         chat_filters["kecamatan"] = targets_k
 
-    # ===== Ringkasan & ekstra =====
-    with st.spinner("Mengambil ringkasan data…"):
-        summary = es.summary_for_filters(chat_filters, min_n_kec=20)
-        # tambahkan total balita (beban populasi)
-        try:
-            summary.setdefault("indikator_utama", {})["jumlah_balita"] = balita_total(chat_filters)
-        except Exception:
-            pass
-        # pastikan trend_bulanan ada minimal dari helper
-        try:
-            if "trend_bulanan" not in summary or not summary["trend_bulanan"]:
-                summary["trend_bulanan"] = es.trend_monthly(chat_filters)
-        except Exception:
-            pass
-
-    extra = _route_extra(user_msg, chat_filters)
-
     # ===== context_json untuk model =====
-    context = {"filters": chat_filters, "summary": summary, "extra": extra}
+    # Fact sheet pra-hitung (tanpa ES) bila filter chat bisa dilayani; selain itu ringkasan live
+    sheets = fact_sheets.sheets_for(chat_filters)
+    if sheets is not None:
+        context = fact_sheets.build_context(user_msg, chat_filters, sheets)
+    else:
+        with st.spinner("Mengambil ringkasan data…"):
+            context = chat_context.build_context(user_msg, chat_filters, min_n_kec=20)
+
+    # ===== Pesan ke model: konteks dipadatkan & riwayat dipangkas sesuai anggaran token =====
     system_msg = _build_system_prompt(context)
-    user_payload = f"Pertanyaan:\n{user_msg}\n\ncontext_json:\n{json.dumps(context, ensure_ascii=False)}"
-
-    # ===== Kirim ke model =====
-    recent = [m for m in st.session_state.ins_chat[-8:] if m["role"] in ("user","assistant")]
-    messages = [{"role": "system", "content": system_msg}, *recent, {"role": "user", "content": user_payload}]
-    with st.spinner("Meminta analisis dari LLM…"):
-        answer = _call_llm(messages)
-
-    # Tampilkan jawaban di gelembung assistant + simpan
+    history = st.session_state.ins_chat[:-1][-8:]
+    messages, sent = context_compaction.build_messages(system_msg, user_msg, context, history)
+    # payload disimpan di pesan user agar giliran berikutnya tidak mengirim ulang bagian yang sama
+    st.session_state.ins_chat[-1].update(payload=sent["payload"], ctx_hashes=sent["ctx_hashes"])
+    # Jawaban di-stream ke gelembung assistant begitu token pertama tiba, lalu disimpan
     with st.chat_message("assistant"):
-        st.markdown(answer)
+        answer = st.write_stream(_stream_llm(messages, user_msg))
+    m = llm_client.metrics().get("insightnow_chat")
+    if m and m["calls"]:
+        hit_rate = llm_cache.stats()["sites"].get("insightnow_chat", {}).get("hit_rate", 0.0)
+        st.caption(
+            f"TTFT p50 {m['ttft_ms']['p50']:.0f} ms · total p50 {m['total_ms']['p50']:.0f} ms "
+            f"({m['calls']} panggilan, cache hit {hit_rate:.0%})"
+        )
     st.session_state.ins_chat.append({"role": "assistant", "content": answer})
 
 
@@ -1,52 +1,28 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-import os
-import openai
-from src import styles, elastic_client as es
-from src.components import sidebar
-
-
-# --- FUNGSI BARU UNTUK INSIGHT AI ---
-def _get_openai_api_key():
-    # Mencari OPENAI_API_KEY
-    env_key = os.getenv("OPENAI_API_KEY", "")
-    if env_key:
-        return env_key
-    try:
-        return st.secrets.get("OPENAI_API_KEY", "")
-    except Exception:
-        return ""
+from typing import Iterator
+from src import styles, ai_worker, llm_client, llm_scheduler, streaming_stats, trend_service, elastic_client as es
+from src.components import sidebar, ai_panel
 
 
-def generate_ai_insight(
-    filters: dict, trend_df: pd.DataFrame, corr_series: pd.Series
-) -> str:
+def summarize_for_ai(trend_df: pd.DataFrame, corr_series: pd.Series) -> dict:
     """
-    Menghasilkan insight dari AI berdasarkan data tren dan korelasi yang terfilter.
+    Merangkum data tren & korelasi menjadi teks ringkas (bahan prompt & kunci cache).
     """
-    api_key = _get_openai_api_key()
-    if not api_key:
-        return "**Insight AI tidak tersedia.** `OPENAI_API_KEY` belum diatur."
-
-    try:
-        client = openai.OpenAI(api_key=api_key)
-    except Exception as e:
-        return f"Gagal menginisialisasi client OpenAI: {e}"
-
-    # --- Merangkum data untuk prompt ---
     # 1. Ringkasan Tren
     trend_summary = "Data tren tidak cukup untuk dianalisis."
     if not trend_df.empty and len(trend_df) > 1:
         # ======================================================================
         # FIX: Pastikan index adalah DatetimeIndex sebelum menggunakan strftime
         # ======================================================================
-        if not isinstance(trend_df.index, pd.DatetimeIndex):
-            trend_df.index = pd.to_datetime(trend_df.index)
+        trend_index = trend_df.index
+        if not isinstance(trend_index, pd.DatetimeIndex):
+            trend_index = pd.to_datetime(trend_index)
         # ======================================================================
 
-        start_date = trend_df.index[0].strftime("%Y-%m")
-        end_date = trend_df.index[-1].strftime("%Y-%m")
+        start_date = trend_index[0].strftime("%Y-%m")
+        end_date = trend_index[-1].strftime("%Y-%m")
         start_val = trend_df["Stunting %"].iloc[0]
         end_val = trend_df["Stunting %"].iloc[-1]
         max_val = trend_df["Stunting %"].max()
@@ -82,6 +58,13 @@ def generate_ai_insight(
             f"Faktor dengan korelasi negatif terkuat (kondisi lebih buruk): {neg_str}."
         )
 
+    return {"trend": trend_summary, "corr": corr_summary}
+
+
+def generate_ai_insight(filters: dict, summary: dict, api_key: str) -> Iterator[str]:
+    """
+    Menghasilkan insight dari AI berdasarkan ringkasan tren dan korelasi yang terfilter.
+    """
     # --- Membangun Prompt ---
     prompt = f"""
     Anda adalah seorang analis data senior di dinas kesehatan, bertugas memberikan ringkasan eksekutif.
@@ -90,29 +73,61 @@ def generate_ai_insight(
     {filters}
 
     **Ringkasan Data Analisis:**
-    1.  **Analisis Tren:** {trend_summary}
-    2.  **Analisis Korelasi:** {corr_summary}
+    1.  **Analisis Tren:** {summary["trend"]}
+    2.  **Analisis Korelasi:** {summary["corr"]}
 
     **Tugas Anda:**
     Berdasarkan **HANYA PADA DATA RINGKASAN DI ATAS**, berikan 2-3 poin insight utama dalam format bullet points (gunakan tanda `-`).
     Fokus pada temuan yang paling signifikan atau actionable. Jawaban harus singkat, padat, dan langsung ke intinya.
     """
 
+    system_prompt = "Anda adalah seorang analis data senior yang ahli memberikan ringkasan eksekutif."
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-nano",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Anda adalah seorang analis data senior yang ahli memberikan ringkasan eksekutif.",
-                },
+        yield from llm_client.stream_chat(
+            [
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt},
             ],
+            site="trend_insight",
+            model=llm_client.DEFAULT_MODEL,
+            api_key=api_key,
+            cache=True,
+            priority=llm_scheduler.BACKGROUND,  # ringkasan otomatis mengalah pada chat interaktif
             timeout=60,
         )
-        return response.choices[0].message.content
     except Exception as e:
-        return f"Gagal menghubungi server OpenAI: {e}"
+        raise RuntimeError(f"Gagal menghubungi server OpenAI: {e}")
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_streamed_correlations(filters: dict) -> pd.Series:
+    return streaming_stats.stream_zscore_correlations(filters)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def load_fastest_rising(filters: dict, window: int) -> pd.DataFrame:
+    return trend_service.fastest_rising(filters, window=window)
+
+
+def render_rising_kecamatan(filters: dict):
+    st.markdown("---")
+    st.markdown("**Kecamatan dengan Kenaikan Proporsi Stunting Tercepat**")
+    window = st.select_slider("Jendela rata-rata bergulir (bulan)", options=[2, 3, 6, 12], value=3)
+    try:
+        with st.spinner("Menghitung tren seluruh kecamatan..."):
+            df_rising = load_fastest_rising(filters, window)
+    except Exception as e:
+        st.error(f"Gagal menghitung tren kecamatan: {e}")
+        return
+    if df_rising.empty:
+        st.info("Tidak ada kecamatan dengan tren naik untuk filter saat ini.")
+        return
+    st.dataframe(df_rising, use_container_width=True, hide_index=True)
+    st.caption(
+        "Diurutkan menurut slope regresi % stunting bulanan (poin persen per bulan). "
+        "Hanya kecamatan dengan minimal 30 anak pada rentang terpilih."
+    )
 
 
 # --- RENDER HALAMAN ---
@@ -120,16 +135,34 @@ def render_page():
     st.subheader("Tren & Korelasi – Analitik Pendukung Kebijakan")
     filters = sidebar.render()
 
+    include_encoded = st.checkbox(
+        "Sertakan faktor kategorikal (Pendidikan Ibu, ASI Eksklusif, Akses Air Bersih, BBLR)",
+        help="Dihitung eksak atas seluruh data dengan streaming per kabupaten — lebih lambat dari mode standar.",
+    )
+
+    view = st.radio(
+        "Granularitas tren",
+        list(trend_service.VIEW_LABELS),
+        index=1,
+        format_func=trend_service.VIEW_LABELS.get,
+        horizontal=True,
+    )
+
     try:
-        df_trend = es.get_monthly_trend(filters)
-        df_corr_sample = es.get_numeric_sample_for_corr(filters)
+        df_trend = trend_service.stunting_percent(filters, view)
+        if include_encoded:
+            with st.spinner("Menghitung korelasi populasi penuh (streaming)..."):
+                corr_risk = load_streamed_correlations(filters)
+        else:
+            # Korelasi populasi penuh dihitung di ES (matrix_stats) — tanpa transfer dokumen mentah
+            corr_risk = es.get_zscore_correlations(filters)
     except Exception as e:
         st.error(f"Gagal mengambil data dari Elasticsearch: {e}")
         return
 
     c1, c2 = st.columns(2)
     with c1:
-        st.markdown("**Tren Proporsi Stunting per Bulan**")
+        st.markdown(f"**Tren Proporsi Stunting ({trend_service.VIEW_LABELS[view]})**")
         if not df_trend.empty:
             # Menggunakan df_trend langsung karena sudah memiliki index yang benar
             st.line_chart(df_trend)
@@ -138,76 +171,64 @@ def render_page():
 
     with c2:
         st.markdown("**Faktor Paling Berpengaruh (Korelasi thd Z-Score)**")
-        target_col = "ZScore TB/U"
-
-        # Inisialisasi corr_risk untuk memastikan variabel ada
-        corr_risk = pd.Series(dtype=float)
-
-        if (
-            not df_corr_sample.empty
-            and target_col in df_corr_sample.columns
-            and df_corr_sample.shape[1] > 1
-        ):
-            try:
-                corr = df_corr_sample.corr(numeric_only=True)
-                if target_col in corr:
-                    corr_risk = corr[target_col].drop(target_col, errors="ignore")
-                    if not corr_risk.empty:
-                        top_features = corr_risk.abs().nlargest(6)
-                        top_corr_values = corr_risk.loc[top_features.index]
-                        df_radar = pd.DataFrame(
-                            {
-                                "Faktor": top_corr_values.index,
-                                "Korelasi Asli": top_corr_values.values,
-                                "Kekuatan Korelasi": top_corr_values.abs().values,
-                            }
-                        )
-
-                        fig = px.line_polar(
-                            df_radar,
-                            r="Kekuatan Korelasi",
-                            theta="Faktor",
-                            line_close=True,
-                            template="plotly_dark",
-                            title="Kekuatan Pengaruh Faktor terhadap Z-Score TB/U",
-                            range_r=[0, 1],
-                        )
-                        fig.update_traces(
-                            fill="toself",
-                            fillcolor="rgba(239, 68, 68, 0.3)",
-                            line=dict(color="rgba(239, 68, 68, 0.8)"),
-                            hovertemplate="<b>%{theta}</b><br>Kekuatan: %{r:.2f}<br>Korelasi Asli: %{customdata[0]:.2f}<extra></extra>",
-                            customdata=df_radar[["Korelasi Asli"]],
-                        )
-                        st.plotly_chart(fig, use_container_width=True)
-                        st.caption(
-                            "Menunjukkan **kekuatan** pengaruh. Semakin rendah Z-Score, semakin tinggi risiko stunting."
-                        )
-                    else:
-                        st.warning(
-                            "Tidak ada cukup fitur lain untuk menghitung korelasi."
-                        )
-                else:
-                    st.warning(
-                        f"Kolom target '{target_col}' tidak dapat dihitung korelasinya (kemungkinan nilainya konstan)."
-                    )
-            except Exception as e:
-                st.error(f"Gagal menghitung korelasi: {e}")
+        if not corr_risk.empty:
+            top_features = corr_risk.abs().nlargest(6)
+            top_corr_values = corr_risk.loc[top_features.index]
+            df_radar = pd.DataFrame(
+                {
+                    "Faktor": top_corr_values.index,
+                    "Korelasi Asli": top_corr_values.values,
+                    "Kekuatan Korelasi": top_corr_values.abs().values,
+                }
+            )
+
+            fig = px.line_polar(
+                df_radar,
+                r="Kekuatan Korelasi",
+                theta="Faktor",
+                line_close=True,
+                template="plotly_dark",
+                title="Kekuatan Pengaruh Faktor terhadap Z-Score TB/U",
+                range_r=[0, 1],
+            )
+            fig.update_traces(
+                fill="toself",
+                fillcolor="rgba(239, 68, 68, 0.3)",
+                line=dict(color="rgba(239, 68, 68, 0.8)"),
+                hovertemplate="<b>%{theta}</b><br>Kekuatan: %{r:.2f}<br>Korelasi Asli: %{customdata[0]:.2f}<extra></extra>",
+                customdata=df_radar[["Korelasi Asli"]],
+            )
+            st.plotly_chart(fig, use_container_width=True)
+            st.caption(
+                "Menunjukkan **kekuatan** pengaruh (korelasi Pearson atas seluruh data terfilter). "
+                "Semakin rendah Z-Score, semakin tinggi risiko stunting."
+            )
         else:
             st.warning(
                 "Data tidak cukup untuk menghitung korelasi dengan filter saat ini."
             )
 
+    render_rising_kecamatan(filters)
+
     # --- BAGIAN BARU: INSIGHT OTOMATIS AI ---
     st.markdown("---")
     st.subheader("🤖 Insight Otomatis AI")
 
+    api_key = llm_client.get_api_key()
     if df_trend.empty and corr_risk.empty:
         st.info("Tidak ada data yang cukup untuk dianalisis oleh AI.")
+    elif not api_key:
+        st.markdown("**Insight AI tidak tersedia.** `OPENAI_API_KEY` belum diatur.")
     else:
-        with st.spinner("AI sedang menganalisis tren dan korelasi..."):
-            ai_insight = generate_ai_insight(filters, df_trend, corr_risk)
-            st.markdown(ai_insight)
+        summary = summarize_for_ai(df_trend, corr_risk)
+        ai_panel.render(
+            ai_worker.job_key("trend_insight", filters, summary),
+            generate_ai_insight,
+            filters,
+            summary,
+            api_key,
+            waiting_msg="AI sedang menganalisis tren dan korelasi...",
+        )
 
 
 # --- Main Execution ---
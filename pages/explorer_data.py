@@ -2,69 +2,38 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 from datetime import datetime
-import os
-import openai
 import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator
 
-from src import styles
+from src import styles, exporter, ai_worker, llm_client, llm_scheduler
 from src import elastic_client as es
-from src.components import sidebar
-
-
-# --- FUNGSI BARU UNTUK INSIGHT AI ---
-def _get_openai_api_key():
-    env_key = os.getenv("OPENAI_API_KEY", "")
-    if env_key:
-        return env_key
-    try:
-        return st.secrets.get("OPENAI_API_KEY", "")
-    except Exception:
-        return ""
+from src.components import sidebar, ai_panel
+
+
+def summarize_for_ai(profile: dict) -> dict:
+    """Statistik ringkas seluruh data terfilter (bundle["profile"]) sebagai bahan prompt & kunci cache."""
+    def r(value, ndigits):
+        return round(value, ndigits) if value is not None else "N/A"
+
+    return {
+        "Jumlah Data Terfilter": profile["n"],
+        "Statistik Z-Score": {k: r(v, 4) for k, v in profile["zscore"].items()},
+        "Distribusi Pendidikan Ibu (%)": profile["pendidikan_ibu"],
+        "Distribusi ASI Eksklusif (%)": profile["asi_eksklusif"],
+        "Distribusi Akses Air Bersih (%)": profile["akses_air"],
+        "Rata-rata Usia Anak (bulan)": r(profile["avg_usia"], 1),
+        "Rata-rata BMI Pra-Hamil": r(profile["avg_bmi"], 2),
+    }
 
 
 def generate_ai_summary(
-    main_filters: dict, advanced_filters: dict, df: pd.DataFrame
-) -> str:
+    main_filters: dict, advanced_filters: dict, summary: dict, api_key: str
+) -> Iterator[str]:
     """
-    Menghasilkan ringkasan cerdas dari AI berdasarkan data yang ditampilkan di explorer.
+    Menghasilkan ringkasan cerdas dari AI berdasarkan statistik data terfilter di explorer.
     """
-    api_key = _get_openai_api_key()
-    if not api_key:
-        return "**Ringkasan AI tidak tersedia.** `OPENAI_API_KEY` belum diatur."
-
-    try:
-        client = openai.OpenAI(api_key=api_key)
-    except Exception as e:
-        return f"Gagal menginisialisasi client OpenAI: {e}"
-
-    # --- Merangkum DataFrame menjadi statistik untuk prompt ---
-    if df.empty:
-        return "Tidak ada data untuk dianalisis."
-
-    summary = {
-        "Jumlah Data Terfilter": len(df),
-        "Statistik Z-Score": df["Z-Score"].describe().to_dict(),
-        "Distribusi Pendidikan Ibu (%)": (
-            df["Pendidikan Ibu"].value_counts(normalize=True) * 100
-        )
-        .round(2)
-        .to_dict(),
-        "Distribusi ASI Eksklusif (%)": (
-            df["ASI Eksklusif"].value_counts(normalize=True) * 100
-        )
-        .round(2)
-        .to_dict(),
-        "Distribusi Akses Air Bersih (%)": (
-            df["Akses Air Bersih"].value_counts(normalize=True) * 100
-        )
-        .round(2)
-        .to_dict(),
-        "Rata-rata Usia Anak (bulan)": round(df["Usia Anak (bulan)"].mean(), 1),
-        "Rata-rata BMI Pra-Hamil": round(df["BMI Pra-Hamil"].mean(), 2)
-        if "BMI Pra-Hamil" in df.columns
-        else "N/A",
-    }
-    summary_json = json.dumps(summary, indent=2, ensure_ascii=False)
+    summary_json = json.dumps(summary, indent=2, ensure_ascii=False, default=str)
 
     # --- Membangun Prompt ---
     prompt = f"""
@@ -83,21 +52,240 @@ def generate_ai_summary(
     Berdasarkan **HANYA PADA RINGKASAN STATISTIK DI ATAS**, berikan 2-3 poin analisis utama dalam format bullet points (`-`). Fokus pada karakteristik yang paling menonjol dari kelompok ini. Apa yang bisa disimpulkan tentang profil risiko mereka? Jawaban harus singkat, padat, dan berbasis data.
     """
 
+    system_prompt = "Anda adalah analis data kesehatan masyarakat yang ahli menganalisis sub-kelompok data."
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-nano",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Anda adalah analis data kesehatan masyarakat yang ahli menganalisis sub-kelompok data.",
-                },
+        yield from llm_client.stream_chat(
+            [
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt},
             ],
+            site="explorer_summary",
+            model=llm_client.DEFAULT_MODEL,
+            api_key=api_key,
+            cache=True,
+            priority=llm_scheduler.BACKGROUND,  # ringkasan otomatis mengalah pada chat interaktif
             timeout=90,
         )
-        return response.choices[0].message.content
     except Exception as e:
-        return f"Gagal menghubungi server OpenAI: {e}"
+        raise RuntimeError(f"Gagal menghubungi server OpenAI: {e}")
+
+
+# --- DATA EXPLORER (satu request: baris, chart, opsi filter, total) ---
+@st.cache_data(ttl=300, show_spinner="Mengambil data explorer...")
+def load_explorer_bundle(main_filters: dict, advanced_filters: dict, size: int) -> dict:
+    return es.get_explorer_bundle(main_filters, advanced_filters, size=size)
+
+
+# --- PAGINASI SERVER (PIT + search_after) ---
+EXPLORER_PAGE_SIZE = 50
+MODE_TOP = "Top 1.000 paling berisiko"
+MODE_PAGINATED = "Semua data (paginasi server)"
+
+
+@st.cache_resource
+def _prefetch_pool() -> ThreadPoolExecutor:
+    # Dipakai bersama semua sesi; hanya untuk prefetch satu halaman berikutnya
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="explorer-prefetch")
+
+
+def _filters_signature(main_filters: dict, advanced_filters: dict) -> str:
+    return json.dumps(
+        {"main": main_filters, "advanced": advanced_filters}, sort_keys=True, default=str
+    )
+
+
+def _close_cursor(cursor: dict):
+    if cursor.get("prefetch"):
+        cursor["prefetch"][1].cancel()
+    es.close_pit(cursor.get("pit_id"))
+
+
+def _new_cursor(signature: str) -> dict:
+    return {
+        "sig": signature,
+        "pit_id": None,
+        "afters": [None],  # afters[i] = search_after untuk mengambil halaman i
+        "page": 0,
+        "total": None,
+        "current": None,  # (index_halaman, hasil)
+        "prefetch": None,  # (index_halaman, Future)
+        "restarted": False,  # PIT kedaluwarsa -> kembali ke halaman pertama
+    }
+
+
+def _get_cursor(signature: str) -> dict:
+    """State cursor per sesi; direset (dan PIT lama ditutup) bila filter berubah.
+    Hanya halaman aktif + satu halaman prefetch yang disimpan -> memori tetap kecil."""
+    cursor = st.session_state.get("explorer_cursor")
+    if cursor is None or cursor["sig"] != signature:
+        if cursor is not None:
+            _close_cursor(cursor)
+        cursor = _new_cursor(signature)
+        st.session_state.explorer_cursor = cursor
+    return cursor
+
+
+def _fetch_page(cursor: dict, main_filters: dict, advanced_filters: dict) -> dict:
+    """Ambil halaman cursor["page"]. Bila PIT kedaluwarsa, cursor diulang dari halaman pertama:
+    search_after lama memuat nilai _shard_doc milik PIT lama dan tidak valid untuk PIT baru."""
+    if cursor["pit_id"] is None:
+        cursor["pit_id"] = es.open_pit()
+    try:
+        return es.get_explorer_page(
+            main_filters,
+            advanced_filters,
+            cursor["pit_id"],
+            search_after=cursor["afters"][cursor["page"]],
+            size=EXPLORER_PAGE_SIZE,
+            track_total_hits=cursor["total"] is None,
+        )
+    except ConnectionError as e:
+        if not es.is_pit_expired(e):
+            raise
+    _close_cursor(cursor)
+    cursor.update(_new_cursor(cursor["sig"]), restarted=True)
+    cursor["pit_id"] = es.open_pit()
+    return es.get_explorer_page(
+        main_filters, advanced_filters, cursor["pit_id"], size=EXPLORER_PAGE_SIZE, track_total_hits=True
+    )
+
+
+def _load_page(cursor: dict, main_filters: dict, advanced_filters: dict) -> dict:
+    idx = cursor["page"]
+    prefetch = cursor.get("prefetch")
+    result = None
+    if cursor["current"] and cursor["current"][0] == idx:
+        result = cursor["current"][1]
+    elif prefetch and prefetch[0] == idx:
+        try:
+            result = prefetch[1].result()
+        except Exception:
+            result = None
+    if result is None:
+        result = _fetch_page(cursor, main_filters, advanced_filters)
+        idx, prefetch = cursor["page"], cursor.get("prefetch")  # bisa direset bila PIT kedaluwarsa
+
+    cursor["pit_id"] = result["pit_id"] or cursor["pit_id"]
+    if result["total"] is not None:
+        cursor["total"] = result["total"]
+    if len(cursor["afters"]) == idx + 1 and result["search_after"] is not None:
+        cursor["afters"].append(result["search_after"])
+    cursor["current"] = (idx, result)
+
+    # Prefetch halaman berikutnya di background selagi user membaca halaman ini
+    nxt = idx + 1
+    if nxt < len(cursor["afters"]) and not (prefetch and prefetch[0] == nxt):
+        cursor["prefetch"] = (
+            nxt,
+            _prefetch_pool().submit(
+                es.get_explorer_page,
+                main_filters,
+                advanced_filters,
+                cursor["pit_id"],
+                search_after=cursor["afters"][nxt],
+                size=EXPLORER_PAGE_SIZE,
+            ),
+        )
+    elif nxt >= len(cursor["afters"]):
+        cursor["prefetch"] = None
+    return result
+
+
+def _goto_page(delta: int):
+    cursor = st.session_state.get("explorer_cursor")
+    if cursor is not None:
+        cursor["page"] = max(0, cursor["page"] + delta)
+
+
+def render_paginated_table(main_filters: dict, advanced_filters: dict) -> pd.DataFrame:
+    """Tabel explorer berhalaman; mengembalikan DataFrame halaman aktif."""
+    cursor = _get_cursor(_filters_signature(main_filters, advanced_filters))
+    result = _load_page(cursor, main_filters, advanced_filters)
+    df_page = result["df"]
+    if cursor.pop("restarted", False):
+        st.info("Sesi paginasi kedaluwarsa; tabel dimuat ulang dari halaman pertama.")
+
+    total = cursor["total"] or 0
+    n_pages = max(1, -(-total // EXPLORER_PAGE_SIZE))
+    start = cursor["page"] * EXPLORER_PAGE_SIZE
+    st.caption(
+        f"Halaman {cursor['page'] + 1:,} dari {n_pages:,} — baris {start + 1:,}–{start + len(df_page):,} "
+        f"dari {total:,} data sesuai filter (urut Z-Score terendah)."
+    )
+    if not df_page.empty:
+        st.dataframe(df_page, use_container_width=True, height=420)
+
+    nav_prev, _, nav_next = st.columns([1, 4, 1])
+    nav_prev.button(
+        "◀ Sebelumnya", on_click=_goto_page, args=(-1,), disabled=cursor["page"] == 0
+    )
+    nav_next.button(
+        "Berikutnya ▶",
+        on_click=_goto_page,
+        args=(1,),
+        disabled=cursor["page"] + 1 >= len(cursor["afters"]),
+    )
+    return df_page
+
+
+# --- EKSPOR STREAMING ---
+def render_export_panel(main_filters: dict, advanced_filters: dict):
+    st.markdown(
+        "Unduh **seluruh** data sesuai filter di atas. Data dialirkan per halaman ke file sementara, "
+        "sehingga ukuran ekspor tidak dibatasi memori."
+    )
+    col_fmt, col_gz, col_btn = st.columns([2, 1, 2])
+    with col_fmt:
+        fmt = st.selectbox("Format", exporter.available_formats(), key="export_fmt")
+    with col_gz:
+        compress = st.checkbox("Kompres (gzip)", key="export_gzip")
+    with col_btn:
+        prepare = st.button("Siapkan File Ekspor")
+
+    if prepare:
+        exporter.discard_export(st.session_state.pop("export_file", None))
+        try:
+            total = es.count_explorer_data(main_filters, advanced_filters)
+        except Exception:
+            total = None
+        bar = st.progress(0.0, text="Mempersiapkan ekspor...")
+
+        def _report(rows: int, total_rows, rows_per_sec: float):
+            frac = min(1.0, rows / total_rows) if total_rows else 0.0
+            done = f"{rows:,} / {total_rows:,}" if total_rows else f"{rows:,}"
+            bar.progress(frac, text=f"{done} baris • {rows_per_sec:,.0f} baris/detik")
+
+        export = exporter.stream_export(
+            es.iter_explorer_export(main_filters, advanced_filters),
+            fmt=fmt,
+            compress=compress,
+            total=total,
+            progress=_report,
+        )
+        bar.progress(1.0, text="Selesai.")
+        st.session_state.export_file = export
+
+    export = st.session_state.get("export_file")
+    if export and not exporter.exists(export):
+        # Sudah diunduh (file sekali pakai) atau dibersihkan karena kedaluwarsa
+        st.session_state.pop("export_file", None)
+        st.caption("File ekspor sudah diunduh. Siapkan ulang untuk mengunduh lagi.")
+    elif export:
+        st.success(
+            f"File siap: {export['rows']:,} baris, {export['bytes'] / 1e6:,.1f} MB "
+            f"dalam {export['seconds']:.1f} detik ({export['rows_per_sec']:,.0f} baris/detik)."
+        )
+        now_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+        ext = export["file_name"].split(".", 1)[1]
+        # Data berupa callable: file baru dibuka saat tombol diklik (bukan di setiap rerun) dan
+        # diserahkan sebagai handle file; file sementaranya dihapus saat itu juga
+        st.download_button(
+            "⬇️ Unduh File",
+            lambda: exporter.consume_export(export),
+            f"stuntlytics_export_{now_str}.{ext}",
+            export["mime"],
+        )
 
 
 # --- RENDER HALAMAN ---
@@ -106,46 +294,76 @@ def render_page():
     st.subheader("Explorer Data – Filter, Visualisasi & Ekspor")
     main_filters = sidebar.render()
 
+    # Nilai filter lanjutan & mode dibaca dari state widget (rerun sudah membawa nilai terbaru),
+    # sehingga baris tabel, chart, opsi filter & total bisa diambil dalam satu request sebelum widget dirender.
+    advanced_filters = {
+        "pendidikan_ibu": st.session_state.get("explorer_edu", []),
+        "asi_eksklusif": st.session_state.get("explorer_asi", "Semua"),
+        "akses_air": st.session_state.get("explorer_air", "Semua"),
+    }
+    table_mode = st.session_state.get("explorer_mode", MODE_TOP)
+    try:
+        bundle = load_explorer_bundle(
+            main_filters, advanced_filters, size=1000 if table_mode == MODE_TOP else 0
+        )
+        bundle_error = None
+    except Exception as e:
+        bundle, bundle_error = None, e
+
     # --- Filter Lanjutan (khusus halaman ini) ---
     st.markdown("##### Filter Lanjutan")
     c1, c2, c3 = st.columns(3)
     with c1:
-        try:
-            edu_opts = es.get_unique_field_values(main_filters, "Pendidikan Ibu")
-            if not edu_opts:
-                edu_opts = ["SD", "SMP", "SMA", "D3", "S1+"]
-            edu = st.multiselect("Pendidikan Ibu", edu_opts, [])
-        except Exception:
-            edu = st.multiselect(
-                "Pendidikan Ibu", ["SD", "SMP", "SMA", "D3", "S1+"], []
-            )  # Fallback
+        edu_opts = (bundle["options"]["pendidikan_ibu"] if bundle else []) or [
+            "SD",
+            "SMP",
+            "SMA",
+            "D3",
+            "S1+",
+        ]  # Fallback
+        # Pilihan aktif tetap valid walau opsi berubah karena filter utama berganti
+        edu_opts = list(dict.fromkeys(edu_opts + advanced_filters["pendidikan_ibu"]))
+        st.multiselect("Pendidikan Ibu", edu_opts, key="explorer_edu")
 
     with c2:
-        asi = st.select_slider(
-            "ASI Eksklusif", options=["Semua", "Ya", "Tidak"], value="Semua"
+        st.select_slider(
+            "ASI Eksklusif", options=["Semua", "Ya", "Tidak"], key="explorer_asi"
         )
     with c3:
-        air = st.select_slider(
-            "Akses Air Layak", options=["Semua", "Ada", "Tidak"], value="Semua"
+        st.select_slider(
+            "Akses Air Layak", options=["Semua", "Ada", "Tidak"], key="explorer_air"
         )
 
-    advanced_filters = {"pendidikan_ibu": edu, "asi_eksklusif": asi, "akses_air": air}
+    st.radio(
+        "Mode Tabel", [MODE_TOP, MODE_PAGINATED], horizontal=True, key="explorer_mode"
+    )
+
+    if bundle is None:
+        st.error(f"Gagal memproses data: {bundle_error}")
+        st.exception(bundle_error)
+        return
 
     # --- Pengambilan Data & Tampilan Tabel ---
     try:
-        df_explorer = es.get_explorer_data(main_filters, advanced_filters, size=1000)
-
-        st.caption(
-            "Menampilkan hingga 1.000 data teratas yang paling berisiko. Gunakan fitur ekspor di bawah untuk mengunduh data lebih lengkap."
-        )
+        if table_mode == MODE_PAGINATED:
+            df_explorer = render_paginated_table(main_filters, advanced_filters)
+            row_offset = st.session_state.explorer_cursor["page"] * EXPLORER_PAGE_SIZE
+        else:
+            df_explorer = bundle["rows"]
+            row_offset = 0
+            st.caption(
+                f"Menampilkan hingga 1.000 data teratas yang paling berisiko dari {bundle['total']:,} data sesuai filter. "
+                "Gunakan mode paginasi atau fitur ekspor di bawah untuk data lebih lengkap."
+            )
         if not df_explorer.empty:
             df_display = df_explorer.copy()
-            df_display["id_baris"] = range(len(df_display))
-            st.dataframe(
-                df_display.drop(columns=["id_baris"]),
-                use_container_width=True,
-                height=420,
-            )
+            df_display["id_baris"] = range(row_offset, row_offset + len(df_display))
+            if table_mode == MODE_TOP:
+                st.dataframe(
+                    df_display.drop(columns=["id_baris"]),
+                    use_container_width=True,
+                    height=420,
+                )
 
             # --- Chart Berjenjang ---
             st.markdown("---")
@@ -178,9 +396,7 @@ def render_page():
                 )
                 fig.update_layout(yaxis={"categoryorder": "total ascending"})
             else:
-                df_agg = es.get_top_counts_for_explorer_chart(
-                    main_filters, advanced_filters
-                )
+                df_agg = bundle["top_counts"]
                 if not df_agg.empty:
                     y_col = df_agg.columns[0]
                     title = f"Top 5 {y_col} (Jumlah Data)"
@@ -207,73 +423,32 @@ def render_page():
             if "fig" in locals() and fig is not None:
                 st.plotly_chart(fig, use_container_width=True)
 
-            # --- ZONA EKSPOR BARU ---
+            # --- ZONA EKSPOR (streaming, tanpa batas baris) ---
             st.markdown("---")
             with st.expander("📥 Buka Panel Ekspor Data"):
-                st.markdown(
-                    "Unduh data yang Anda lihat (sesuai filter di atas) dalam format CSV atau JSON."
-                )
-
-                # Menggabungkan semua filter untuk fungsi ekspor
-                all_filters = {**main_filters, **advanced_filters}
-
-                export_col1, export_col2 = st.columns(2)
-                with export_col1:
-                    if st.button("Siapkan File CSV (hingga 5.000 baris)"):
-                        with st.spinner("Mempersiapkan file CSV..."):
-                            df_export = es.get_explorer_data_for_export(
-                                main_filters, advanced_filters, size=5000
-                            )
-                            st.session_state.export_df = (
-                                df_export  # Simpan di session state
-                            )
-                            st.session_state.csv_ready = True
-                            st.success("File CSV siap!")
-
-                    if st.session_state.get("csv_ready"):
-                        now_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        csv_bytes = st.session_state.export_df.to_csv(
-                            index=False
-                        ).encode("utf-8")
-                        st.download_button(
-                            "⬇️ Unduh CSV",
-                            csv_bytes,
-                            f"stuntlytics_export_{now_str}.csv",
-                            "text/csv",
-                        )
-
-                with export_col2:
-                    if st.button("Siapkan File JSON (hingga 5.000 baris)"):
-                        with st.spinner("Mempersiapkan file JSON..."):
-                            # Kita bisa pakai data yang sama jika sudah di-fetch untuk CSV
-                            if "export_df" not in st.session_state:
-                                df_export = es.get_explorer_data_for_export(
-                                    main_filters, advanced_filters, size=5000
-                                )
-                                st.session_state.export_df = df_export
-                            st.session_state.json_ready = True
-                            st.success("File JSON siap!")
-
-                    if st.session_state.get("json_ready"):
-                        now_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        json_string = st.session_state.export_df.to_json(
-                            orient="records", indent=4, force_ascii=False
-                        )
-                        st.download_button(
-                            "⬇️ Unduh JSON",
-                            json_string,
-                            f"stuntlytics_export_{now_str}.json",
-                            "application/json",
-                        )
+                render_export_panel(main_filters, advanced_filters)
 
             # --- BAGIAN BARU: INSIGHT AI ---
             st.markdown("---")
             st.subheader("🤖 Ringkasan Cerdas AI")
-            with st.spinner("AI sedang menganalisis data yang ditampilkan..."):
-                ai_summary = generate_ai_summary(
-                    main_filters, advanced_filters, df_explorer
+            api_key = llm_client.get_api_key()
+            if not api_key:
+                st.markdown(
+                    "**Ringkasan AI tidak tersedia.** `OPENAI_API_KEY` belum diatur."
+                )
+            else:
+                summary = summarize_for_ai(bundle["profile"])
+                ai_panel.render(
+                    ai_worker.job_key(
+                        "explorer_summary", main_filters, advanced_filters, summary
+                    ),
+                    generate_ai_summary,
+                    main_filters,
+                    advanced_filters,
+                    summary,
+                    api_key,
+                    waiting_msg="AI sedang menganalisis data yang ditampilkan...",
                 )
-                st.markdown(ai_summary)
 
         else:
             st.info("Tidak ada data yang cocok dengan kriteria filter yang dipilih.")
@@ -1,38 +1,27 @@
 import streamlit as st
 import pandas as pd
-import os
-import openai  # Mengganti requests dengan library resmi OpenAI
-from src import prediction_service, styles, elastic_client as es
+import plotly.express as px
+from typing import Iterator
+from src import llm_client, prediction_service, styles, elastic_client as es
 
 
 # ==============================================================================
 # LOGIKA UNTUK FITUR REKOMENDASI AI (DI-UPGRADE KE OPENAI)
 # ==============================================================================
-def _get_openai_api_key():
-    # Mencari OPENAI_API_KEY
-    env_key = os.getenv("OPENAI_API_KEY", "")
-    if env_key:
-        return env_key
-    try:
-        return st.secrets.get("OPENAI_API_KEY", "")
-    except Exception:
-        return ""
+FAILED_MARKER = "Gagal menghubungi server OpenAI."
 
 
 def generate_recommendation(
     user_data: dict, prediction_proba: float, prediction_result: str
-) -> str:
-    api_key = _get_openai_api_key()
+) -> Iterator[str]:
+    """Generator potongan teks rekomendasi (streaming) untuk st.write_stream."""
+    api_key = llm_client.get_api_key()
     if not api_key:
-        return (
+        yield (
             "**Rekomendasi AI tidak tersedia.**\n\n"
             "API Key untuk OpenAI (`OPENAI_API_KEY`) belum di-set."
         )
-
-    try:
-        client = openai.OpenAI(api_key=api_key)
-    except Exception as e:
-        return f"Gagal menginisialisasi client OpenAI: {e}"
+        return
 
     # --- PROMPT ENGINEERING (Tetap Sama) ---
     friendly_names = {
@@ -93,22 +82,75 @@ def generate_recommendation(
     (Berikan 3 poin rekomendasi yang paling penting, praktis, dan dapat segera ditindaklanjuti oleh ibu hamil ini. Gunakan poin bernomor.)
     """
 
-    # --- PEMANGGILAN API BARU (Menggunakan OpenAI) ---
+    # --- PEMANGGILAN API (client OpenAI bersama, streaming) ---
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-nano",  # Menggunakan model yang diminta
-            messages=[
+        yield from llm_client.stream_chat(
+            [
                 {
                     "role": "system",
                     "content": "Anda adalah seorang ahli gizi dan kesehatan anak senior dari dinas kesehatan Indonesia.",
                 },
                 {"role": "user", "content": prompt},
             ],
+            site="family_recommendation",
+            model=llm_client.DEFAULT_MODEL,
+            api_key=api_key,
             timeout=45,
         )
-        return response.choices[0].message.content
     except Exception as e:
-        return f"Gagal menghubungi server OpenAI. Mohon coba lagi nanti. Error: {e}"
+        yield f"\n\n{FAILED_MARKER} Mohon coba lagi nanti. Error: {e}"
+
+
+FACTOR_LABELS = {
+    "hb_g_dl": "Kadar Hb (g/dL)",
+    "lila_saat_hamil_cm": "LiLA saat Hamil (cm)",
+    "bmi_pra_hamil": "BMI Pra-Hamil",
+    "kunjungan_anc_x": "Jumlah Kunjungan ANC",
+    "kenaikan_bb_hamil_kg": "Kenaikan BB saat Hamil (kg)",
+    "kepatuhan_ttd": "Kepatuhan Konsumsi TTD",
+    "akses_air_bersih": "Akses Air Bersih Layak",
+    "paparan_asap_rokok": "Paparan Asap Rokok",
+    "kepesertaan_program_bantuan": "Menerima Program Bantuan",
+}
+
+
+def render_what_if(pipeline, input_data: dict):
+    st.subheader("🔍 Analisis What-If")
+    try:
+        sweep = prediction_service.sensitivity_sweep(pipeline, input_data)
+    except Exception as e:
+        st.warning(f"Analisis what-if tidak tersedia: {e}")
+        return
+    st.caption(
+        f"{sweep['scenarios']} skenario dihitung dalam satu batch ({sweep['seconds'] * 1000:.0f} ms). "
+        "Tiap kurva mengubah satu faktor, faktor lain tetap seperti input."
+    )
+
+    df_num = sweep["numeric"].assign(faktor=lambda d: d["faktor"].map(FACTOR_LABELS))
+    fig = px.line(
+        df_num, x="nilai", y="probabilitas", facet_col="faktor", facet_col_wrap=3,
+        labels={"nilai": "", "probabilitas": "Risiko (%)", "faktor": ""},
+        template="plotly_dark", height=450,
+    )
+    fig.update_xaxes(matches=None, showticklabels=True)
+    fig.for_each_annotation(lambda a: a.update(text=a.text.split("=")[-1]))
+    fig.add_hline(y=sweep["baseline"], line_dash="dot", line_color="rgba(239, 68, 68, 0.8)")
+    st.plotly_chart(fig, use_container_width=True)
+
+    df_cat = sweep["categorical"].assign(faktor=lambda d: d["faktor"].map(FACTOR_LABELS))
+    fig = px.bar(
+        df_cat, x="probabilitas", y="faktor", color="nilai", barmode="group", orientation="h",
+        labels={"probabilitas": "Risiko (%)", "faktor": "", "nilai": "Pilihan"},
+        template="plotly_dark", height=320,
+    )
+    fig.add_vline(x=sweep["baseline"], line_dash="dot", line_color="rgba(239, 68, 68, 0.8)")
+    st.plotly_chart(fig, use_container_width=True)
+
+
+def _is_failed_recommendation(text: str) -> bool:
+    # Pesan gagal/tidak tersedia dari generate_recommendation tidak di-cache agar bisa dicoba lagi
+    # (kegagalan bisa terjadi di tengah stream, jadi cek isi, bukan hanya awalan)
+    return FAILED_MARKER in text or text.startswith("**Rekomendasi AI tidak tersedia")
 
 
 # --- BAGIAN UTAMA APLIKASI STREAMLIT (TIDAK ADA PERUBAHAN) ---
@@ -127,6 +169,22 @@ def render_page():
         )
         return
 
+    t = prediction_service.timings()
+    if "load_seconds" in t:
+        first = t.get("first_predict_seconds")
+        st.caption(
+            f"Model dimuat dalam {t['load_seconds']:.2f} detik ({t['source']})"
+            + (f" · prediksi pertama {first * 1000:.0f} ms" if first is not None else "")
+        )
+
+    tab_single, tab_batch = st.tabs(["Individu", "Batch (CSV/Excel)"])
+    with tab_single:
+        render_single(pipeline)
+    with tab_batch:
+        render_batch(pipeline)
+
+
+def render_single(pipeline):
     with st.form(key="prediction_form"):
         st.markdown("##### 1. Data Ibu & Kehamilan")
         col1, col2, col3 = st.columns(3)
@@ -237,7 +295,17 @@ def render_page():
             "diabetes_ibu": diabetes_ibu,
         }
 
-        prediction_result = prediction_service.run_prediction(pipeline, input_data)
+        # Submit identik (input ternormalisasi + versi model sama) dilayani dari cache
+        key = prediction_service.cache_key(input_data)
+        cached = prediction_service.cached_result(key) or {}
+        if "probability" in cached:
+            prediction_result = {"probability": cached["probability"], "result": cached["result"], "error": None}
+        else:
+            prediction_result = prediction_service.run_prediction(pipeline, input_data)
+            if not prediction_result["error"]:
+                prediction_service.store_result(
+                    key, probability=prediction_result["probability"], result=prediction_result["result"]
+                )
 
         st.markdown("---")
         st.subheader("Hasil Analisis")
@@ -251,17 +319,93 @@ def render_page():
                     value=f"{prediction_result['probability']:.2f}%",
                 )
                 st.write(f"Kategori: **{prediction_result['result']}**")
+                if "probability" in cached:
+                    st.caption("⚡ Hasil dari cache (input identik)")
 
             with col2:
                 st.subheader("💡 Rekomendasi AI")
-                with st.spinner("AI sedang menganalisis dan membuat rekomendasi..."):
-                    recommendation = generate_recommendation(
-                        input_data,
-                        prediction_result["probability"],
-                        prediction_result["result"],
+                recommendation = cached.get("recommendation")
+                if recommendation is None:
+                    # Token ditampilkan begitu tiba; teks utuh dikembalikan untuk di-cache
+                    recommendation = st.write_stream(
+                        generate_recommendation(
+                            input_data,
+                            prediction_result["probability"],
+                            prediction_result["result"],
+                        )
                     )
+                    if not _is_failed_recommendation(recommendation):
+                        prediction_service.store_result(key, recommendation=recommendation)
+                else:
                     st.markdown(recommendation)
 
+            render_what_if(pipeline, input_data)
+
+
+def _read_upload(uploaded) -> pd.DataFrame:
+    if uploaded.name.lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(uploaded)
+    return pd.read_csv(uploaded, sep=None, engine="python")
+
+
+def render_batch(pipeline):
+    st.caption(
+        "Unggah data banyak ibu hamil sekaligus (satu baris per ibu). "
+        "Nama kolom mengikuti template; nilai kategori mengikuti pilihan pada form individu."
+    )
+    template = pd.DataFrame(columns=prediction_service.FEATURE_COLUMNS)
+    st.download_button(
+        "📄 Unduh template CSV",
+        template.to_csv(index=False).encode("utf-8"),
+        file_name="template_prediksi_batch.csv",
+        mime="text/csv",
+    )
+
+    uploaded = st.file_uploader("File CSV / Excel", type=["csv", "xlsx", "xls"], key="batch_upload")
+    if uploaded is None:
+        return
+    try:
+        raw = _read_upload(uploaded)
+    except Exception as e:
+        st.error(f"Gagal membaca file: {e}")
+        return
+    st.write(f"{len(raw):,} baris terbaca.")
+
+    upload_id = (uploaded.name, uploaded.size)
+    if st.button("🔬 Prediksi Semua Baris", key="batch_run"):
+        bar = st.progress(0.0, text="Memprediksi...")
+        out = prediction_service.run_batch_prediction(
+            pipeline,
+            raw,
+            progress=lambda done, total: bar.progress(done / max(total, 1), text=f"{done:,}/{total:,} baris"),
+        )
+        bar.empty()
+        # Simpan di session agar hasil tetap tampil saat rerun (mis. klik tombol unduh)
+        st.session_state["batch_result"] = (upload_id, out)
+
+    stored = st.session_state.get("batch_result")
+    if not stored or stored[0] != upload_id:
+        return
+    out = stored[1]
+    if out["error"]:
+        st.error(f"Gagal melakukan prediksi: {out['error']}")
+        return
+
+    c1, c2, c3, c4 = st.columns(4)
+    c1.metric("Baris Diprediksi", f"{out['scored']:,}")
+    c2.metric("Baris Tidak Valid", f"{out['invalid']:,}")
+    c3.metric("Risiko Stunting", f"{int((out['result']['Kategori'] == 'Risiko Stunting').sum()):,}")
+    c4.metric("Kecepatan", f"{out['rows_per_sec']:,.0f} baris/detik")
+
+    result = out["result"]
+    st.dataframe(result, use_container_width=True, hide_index=True)
+    st.download_button(
+        "⬇️ Unduh Hasil (CSV)",
+        result.to_csv(index=False).encode("utf-8"),
+        file_name="hasil_prediksi_batch.csv",
+        mime="text/csv",
+    )
+
 
 # --- Main Execution ---
 if "page_config_set" not in st.session_state:
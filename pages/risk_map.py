@@ -11,6 +11,8 @@ from src.components import sidebar
 
 # --- Konfigurasi & Fungsi Helper ---
 GEOJSON_PATH = pathlib.Path(__file__).parents[1] / "geojson" / "jawa-barat.geojson"
+# Batas kabupaten/kota hasil dissolve kecamatan: python -m jobs.build_kabupaten_geojson
+KAB_GEOJSON_PATH = GEOJSON_PATH.with_name("jawa-barat-kabupaten.geojson")
 
 
 @st.cache_data(show_spinner="Memuat data GeoJSON...")
@@ -19,6 +21,16 @@ def load_geojson():
         return json.load(f)
 
 
+@st.cache_data(show_spinner="Memuat batas kabupaten/kota...")
+def load_kabupaten_geojson():
+    """GeoJSON level kabupaten/kota untuk tampilan provinsi (dibuat offline oleh
+    jobs.build_kabupaten_geojson). None bila file belum dibuat."""
+    if not KAB_GEOJSON_PATH.exists():
+        return None
+    with open(KAB_GEOJSON_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
 def _normalize_name(v: str) -> str:
     if not v:
         return ""
@@ -31,6 +43,14 @@ def _normalize_name(v: str) -> str:
     return " ".join(s.split())
 
 
+def _normalize_kabkot(v: str) -> str:
+    """Seperti _normalize_name, tapi tetap membedakan Kota vs Kabupaten (mis. Kota/Kab. Bandung)."""
+    if not v:
+        return ""
+    base = _normalize_name(v)
+    return f"KOTA {base}" if v.upper().strip().startswith("KOTA") else base
+
+
 def _prevalence_to_color(prevalence: float):
     if prevalence is None or pd.isna(prevalence):
         return [200, 200, 200, 80]
@@ -81,6 +101,37 @@ def _enrich_geojson(geojson: dict, agg_df: pd.DataFrame):
     return geojson
 
 
+def _enrich_kabupaten_geojson(geojson: dict, kab_df: pd.DataFrame):
+    lookup = {}
+    if not kab_df.empty:
+        lookup = {_normalize_kabkot(r.kabupaten): r for r in kab_df.itertuples()}
+
+    for feature in geojson.get("features", []):
+        prop = feature.get("properties", {})
+        rec = lookup.get(_normalize_kabkot(prop.get("KABKOT", "")))
+        if rec and rec.total_anak > 0:
+            prevalence = (rec.jumlah_stunting / rec.total_anak) * 100
+            prop.update(
+                {
+                    "prevalensi_stunting": round(prevalence, 2),
+                    "jumlah_stunting": int(rec.jumlah_stunting),
+                    "total_anak_terdata": int(rec.total_anak),
+                }
+            )
+            prop["fill_color"] = _prevalence_to_color(prevalence)
+        else:
+            prop.update(
+                {
+                    "prevalensi_stunting": "N/A",
+                    "jumlah_stunting": 0,
+                    "total_anak_terdata": 0,
+                }
+            )
+            prop["fill_color"] = _prevalence_to_color(None)
+        feature["properties"] = prop
+    return geojson
+
+
 # --- HELPER BARU UNTUK FOKUS PETA ---
 def filter_geojson_features(geojson, selected_kab, selected_kec):
     if not selected_kab and not selected_kec:
@@ -144,21 +195,41 @@ def compute_view_state(features):
 # --- RENDER HALAMAN ---
 def render_page():
     st.subheader("Peta Risiko Stunting Jawa Barat")
-    st.caption(
-        "Peta diwarnai berdasarkan Tingkat Prevalensi Stunting (jumlah kasus / total anak) per kecamatan."
-    )
-
     main_filters = sidebar.render()
 
+    # Level-of-detail: tampilan provinsi pakai batas kabupaten/kota (jauh lebih ringan),
+    # poligon kecamatan baru dipakai setelah kabupaten/kota dipilih.
+    kab_geojson = load_kabupaten_geojson() if not main_filters["wilayah"] else None
+    kabupaten_view = kab_geojson is not None
+    if not main_filters["wilayah"] and not kabupaten_view:
+        st.info(
+            "Batas kabupaten/kota belum dibuat; peta provinsi memakai poligon kecamatan. "
+            "Jalankan `python -m jobs.build_kabupaten_geojson`."
+        )
+    if kabupaten_view:
+        st.caption(
+            "Peta diwarnai berdasarkan Tingkat Prevalensi Stunting (jumlah kasus / total anak) per kabupaten/kota. "
+            "Pilih Kabupaten/Kota di sidebar untuk melihat detail per kecamatan."
+        )
+    else:
+        st.caption(
+            "Peta diwarnai berdasarkan Tingkat Prevalensi Stunting (jumlah kasus / total anak) per kecamatan."
+        )
+
     try:
-        agg_df = es.get_risk_map_data(main_filters)
-        geojson_data = load_geojson()
-        enriched_geojson = _enrich_geojson(geojson_data, agg_df)
+        if kabupaten_view:
+            agg_df = es.get_risk_map_data(main_filters, level="kabupaten")
+            enriched_geojson = _enrich_kabupaten_geojson(kab_geojson, agg_df)
+            features_to_display = enriched_geojson["features"]
+        else:
+            agg_df = es.get_risk_map_data(main_filters)
+            geojson_data = load_geojson()
+            enriched_geojson = _enrich_geojson(geojson_data, agg_df)
 
-        # Logika BARU: filter fitur dan hitung view state
-        features_to_display = filter_geojson_features(
-            enriched_geojson, main_filters["wilayah"], main_filters["kecamatan"]
-        )
+            # Logika BARU: filter fitur dan hitung view state
+            features_to_display = filter_geojson_features(
+                enriched_geojson, main_filters["wilayah"], main_filters["kecamatan"]
+            )
         view_state = compute_view_state(features_to_display)
 
         display_geojson = {"type": "FeatureCollection", "features": features_to_display}
@@ -179,13 +250,18 @@ def render_page():
             update_triggers={"get_fill_color": display_geojson},
         )
 
-        tooltip_html = """
+        kecamatan_line = (
+            ""
+            if kabupaten_view
+            else '<h5 style="margin: 0 0 10px 0;">Kec. {KECAMATAN}</h5>'
+        )
+        tooltip_html = f"""
         <div style="background-color: #333; color: white; padding: 10px; border-radius: 5px; border: 1px solid #555;">
-            <h4 style="margin: 0 0 5px 0;">{KABKOT}</h4>
-            <h5 style="margin: 0 0 10px 0;">Kec. {KECAMATAN}</h5>
-            <p style="margin: 0;"><strong>Tingkat Prevalensi:</strong> {prevalensi_stunting}%</p>
-            <p style="margin: 0;"><strong>Kasus Stunting:</strong> {jumlah_stunting}</p>
-            <p style="margin: 0;"><strong>Total Anak Terdata:</strong> {total_anak_terdata}</p>
+            <h4 style="margin: 0 0 5px 0;">{{KABKOT}}</h4>
+            {kecamatan_line}
+            <p style="margin: 0;"><strong>Tingkat Prevalensi:</strong> {{prevalensi_stunting}}%</p>
+            <p style="margin: 0;"><strong>Kasus Stunting:</strong> {{jumlah_stunting}}</p>
+            <p style="margin: 0;"><strong>Total Anak Terdata:</strong> {{total_anak_terdata}}</p>
         </div>
         """
 
@@ -0,0 +1,101 @@
+# StuntLytics/src/ai_worker.py
+# Worker background untuk generate teks AI (ringkasan/insight).
+# State bersifat process-wide (modul hanya di-import sekali), jadi job untuk slice data yang sama
+# dijalankan sekali untuk semua sesi dan rerun halaman tidak lagi memblokir render.
+# Hasil hanya ditahan sebentar (serah-terima ke rerun berikutnya); cache jangka panjang jawaban LLM
+# adalah src.llm_cache (stream_chat(cache=True)), sehingga job ulang untuk slice yang sama selesai
+# dalam hitungan milidetik dan submit(wait=...) langsung mengembalikannya.
+# fn boleh berupa generator potongan teks (streaming LLM): teks parsial bisa dibaca via partial(key).
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+DEFAULT_TTL = 120  # detik; hasil sukses (serah-terima, bukan cache)
+FAILURE_TTL = 60  # detik; error disimpan sebentar agar tidak di-retry tiap rerun
+MAX_ENTRIES = 512
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="ai-worker")
+_LOCK = threading.Lock()
+_RESULTS: "OrderedDict[str, Tuple[float, bool, str]]" = OrderedDict()  # key -> (expires_at, ok, text)
+_PENDING: Dict[str, Future] = {}
+_PARTIAL: Dict[str, str] = {}  # key -> teks yang sudah diterima selama job berjalan
+
+
+def job_key(kind: str, *parts: Any) -> str:
+    """Hash stabil dari jenis job + ringkasan statistik + filter (tanggal dsb. di-str-kan)."""
+    raw = json.dumps([kind, *parts], sort_keys=True, default=str, ensure_ascii=False)
+    return f"{kind}:{hashlib.sha256(raw.encode('utf-8')).hexdigest()}"
+
+
+def _store(key: str, ok: bool, text: str, ttl: float):
+    with _LOCK:
+        _RESULTS[key] = (time.time() + ttl, ok, text)
+        _RESULTS.move_to_end(key)
+        while len(_RESULTS) > MAX_ENTRIES:
+            _RESULTS.popitem(last=False)
+        _PENDING.pop(key, None)
+        _PARTIAL.pop(key, None)
+
+
+def _run(key: str, fn: Callable[..., Any], args: tuple, ttl: float):
+    try:
+        text = fn(*args)
+        if not isinstance(text, str):  # generator potongan teks
+            parts = []
+            for delta in text:
+                parts.append(delta)
+                with _LOCK:
+                    _PARTIAL[key] = "".join(parts)
+            text = "".join(parts)
+        _store(key, True, text, ttl)
+    except Exception as e:
+        _store(key, False, str(e), FAILURE_TTL)
+
+
+def result(key: str) -> Optional[Tuple[bool, str]]:
+    """(ok, teks) jika sudah ada & belum kedaluwarsa; None jika belum selesai / belum pernah diminta."""
+    with _LOCK:
+        hit = _RESULTS.get(key)
+        if hit is None:
+            return None
+        expires_at, ok, text = hit
+        if expires_at < time.time():
+            del _RESULTS[key]
+            return None
+        return ok, text
+
+
+def partial(key: str) -> Optional[str]:
+    """Teks parsial job streaming yang masih berjalan (None jika belum ada potongan)."""
+    with _LOCK:
+        return _PARTIAL.get(key)
+
+
+def is_pending(key: str) -> bool:
+    with _LOCK:
+        return key in _PENDING
+
+
+def submit(key: str, fn: Callable[..., Any], *args: Any, ttl: float = DEFAULT_TTL,
+           wait: float = 0.0) -> Optional[Tuple[bool, str]]:
+    """Kembalikan hasil bila ada; jika tidak, jadwalkan fn(*args) di background (sekali per key)
+    dan tunggu paling lama `wait` detik (cukup untuk hit llm_cache) sebelum mengembalikan None."""
+    hit = result(key)
+    if hit is not None:
+        return hit
+    with _LOCK:
+        future = _PENDING.get(key)
+        if future is None:
+            future = _PENDING[key] = _EXECUTOR.submit(_run, key, fn, args, ttl)
+    if wait > 0:
+        try:
+            future.result(timeout=wait)
+        except Exception:
+            return None
+        return result(key)
+    return None
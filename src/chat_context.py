@@ -0,0 +1,138 @@
+# StuntLytics/src/chat_context.py
+# Penyusun context_json untuk giliran chat InsightNow.
+# - Tiap potongan data (kartu, coverage, agregasi, ranking kecamatan, top, tren, balita)
+#   dihitung paling banyak SEKALI per giliran; potongan yang independen diquery paralel
+# - Hasil di-memo per filter chat kanonik (TTL) — pertanyaan lanjutan tentang kecamatan
+#   yang sama tidak memukul ES lagi
+# - Router "extra" diturunkan dari ringkasan yang sudah ada, bukan query ulang
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from utils import es
+
+from . import trend_service
+
+CACHE_TTL = 300  # detik
+MAX_ENTRIES = 32
+MAX_WORKERS = 6
+
+_LOCK = threading.Lock()
+_CACHE: "OrderedDict[str, tuple]" = OrderedDict()  # kunci -> (waktu, parts)
+
+
+def canonical_filters(filters: Dict[str, Any], min_n_kec: int = 20) -> str:
+    """Kunci stabil: nilai kosong dibuang, list diurutkan (urutan pilihan tidak berpengaruh)."""
+    clean = {}
+    for k, v in filters.items():
+        if v in (None, "", [], {}):
+            continue
+        clean[k] = sorted(v, key=str) if isinstance(v, (list, tuple, set)) else v
+    return json.dumps({"f": clean, "min_n_kec": min_n_kec}, sort_keys=True, default=str)
+
+
+def balita_total(filters: Dict[str, Any]) -> Optional[int]:
+    must = []
+    if filters.get("wilayah"):
+        must.append({"terms": {"bps_nama_kabupaten_kota": filters["wilayah"]}})
+    if filters.get("date_from") or filters.get("date_to"):
+        yr = {}
+        if filters.get("date_from"): yr["gte"] = filters["date_from"][:4]
+        if filters.get("date_to"):   yr["lte"] = filters["date_to"][:4]
+        if yr: must.append({"range": {"tahun": yr}})
+    q = {"bool": {"must": must}} if must else {"match_all": {}}
+    body = {"query": q, "size": 0, "aggs": {"sum": {"sum": {"field": "jumlah_balita"}}}}
+    try:
+        data = es._es_post(es.BALITA_INDEX, "/_search", body)
+        return int(round(data["aggregations"]["sum"]["value"] or 0))
+    except Exception:
+        return None
+
+
+def trend_or_empty(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Tren bulanan (bucket dasar di-cache oleh trend_service); [] bila gagal."""
+    try:
+        return trend_service.trend_records(filters, "month")
+    except Exception:
+        return []
+
+
+PARTS: Dict[str, Callable[[Dict[str, Any], int], Any]] = {
+    **es.SUMMARY_PARTS,
+    "trend": lambda f, n: trend_or_empty(f),
+    "balita": lambda f, n: balita_total(f),
+}
+
+
+def _fetch_parts(filters: Dict[str, Any], min_n_kec: int) -> Dict[str, Any]:
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {name: pool.submit(fn, filters, min_n_kec) for name, fn in PARTS.items()}
+        return {name: fut.result() for name, fut in futures.items()}
+
+
+def get_parts(filters: Dict[str, Any], min_n_kec: int = 20) -> Dict[str, Any]:
+    key = canonical_filters(filters, min_n_kec)
+    now = time.time()
+    with _LOCK:
+        hit = _CACHE.get(key)
+        if hit and now - hit[0] < CACHE_TTL:
+            _CACHE.move_to_end(key)
+            return hit[1]
+    parts = _fetch_parts(filters, min_n_kec)
+    with _LOCK:
+        _CACHE[key] = (time.time(), parts)
+        _CACHE.move_to_end(key)
+        while len(_CACHE) > MAX_ENTRIES:
+            _CACHE.popitem(last=False)
+    return parts
+
+
+def clear_cache():
+    with _LOCK:
+        _CACHE.clear()
+
+
+# Kata kunci pertanyaan -> (kunci extra, kunci summary["risiko_pct"])
+_RISK_KEYWORDS = [
+    (("anemia", "hb"), "risiko_anemia_pct", "anemia_hb_lt_11"),
+    (("bblr", "berat lahir"), "risiko_bblr_pct", "bblr_lt_2500"),
+    (("lila",), "risiko_lila_low_pct", "lila_lt_23_5"),
+    (("bmi",), "risiko_bmi_low_pct", "bmi_lt_18_5"),
+    (("anc",), "risiko_anc_low_pct", "anc_le_2"),
+    (("asi",), "asi_eks_tidak_pct", "asi_eks_tidak"),
+]
+
+
+def route_extra(question: str, summary: Dict[str, Any], trend: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Tambahan sesuai kata kunci pertanyaan, diambil dari ringkasan/tren yang sudah dihitung."""
+    q = (question or "").lower()
+    extra: Dict[str, Any] = {}
+
+    # Tren bulanan (seri penuh, summary hanya memuat 24 bulan terakhir)
+    if any(k in q for k in ["tren", "trend", "bulan", "bulanan"]):
+        extra["tren_bulanan"] = trend
+
+    # Top wilayah/kecamatan
+    if "top" in q and any(k in q for k in ["kab", "kabupaten", "kota"]):
+        extra["top_kabupaten"] = summary.get("top10_kabupaten", [])
+    if "top" in q and "kec" in q:
+        extra["top_kecamatan"] = summary.get("top10_kecamatan", [])
+
+    # Metrik risiko spesifik
+    risiko = summary.get("risiko_pct", {})
+    for words, key, src in _RISK_KEYWORDS:
+        if any(w in q for w in words) and src in risiko:
+            extra[key] = risiko[src]
+    return extra
+
+
+def build_context(question: str, filters: Dict[str, Any], min_n_kec: int = 20) -> Dict[str, Any]:
+    """context_json = {filters, summary, extra}; ES hanya dipanggil saat filter belum ada di cache."""
+    parts = get_parts(filters, min_n_kec)
+    summary = es.summary_for_filters(filters, parts["trend"], min_n_kec=min_n_kec, parts=parts)
+    summary["indikator_utama"]["jumlah_balita"] = parts["balita"]  # beban populasi
+    return {"filters": filters, "summary": summary, "extra": route_extra(question, summary, parts["trend"])}
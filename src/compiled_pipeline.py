@@ -0,0 +1,431 @@
+# StuntLytics/src/compiled_pipeline.py
+# Kompilasi pipeline sklearn terlatih menjadi fungsi inferensi NumPy murni.
+# Untuk satu baris form, Pipeline.predict_proba sebagian besar waktunya habis di validasi kolom,
+# dispatch ColumnTransformer dan pembuatan DataFrame — bukan di matematikanya.
+# - Didukung: ColumnTransformer (+ Pipeline bersarang) berisi SimpleImputer, StandardScaler,
+#   MinMaxScaler, RobustScaler, MaxAbsScaler, OneHotEncoder, passthrough/drop;
+#   model LogisticRegression/linear biner, DecisionTree, RandomForest/ExtraTrees, GradientBoosting biner
+# - Peta kategori -> indeks dihitung sekali saat kompilasi
+# - Hasil kompilasi diverifikasi numerik terhadap pipeline asli; komponen lain -> UnsupportedPipeline
+# - Batch besar (baris x pohon x kedalaman > FALLBACK_CELLS) diteruskan ke pipeline sklearn bila
+#   `fallback` diisi: traversal pohon sklearn (Cython) lebih cepat untuk batch besar, NumPy untuk form
+#
+# Ekspor artefak (jalankan ulang setiap kali pipeline dilatih ulang):
+#   python -m src.compiled_pipeline [--pipeline models/stunting_pipeline.joblib] [--out ...compiled.joblib]
+#   juga menulis salinan mmap (<pipeline>.mmap.joblib) untuk prediction_service, kecuali --no-mmap
+
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+log = logging.getLogger("compiled_pipeline")
+
+COMPILED_SUFFIX = ".compiled.joblib"
+# Perkiraan titik impas vs sklearn (diukur pada pipeline bentuk FEATURE_SCHEMA): RF 50 pohon kedalaman 8
+# ~1000 baris, GBDT 50 pohon ~2000 baris, RF 200 pohon tanpa batas kedalaman ~100 baris, linear ~4000 baris
+FALLBACK_CELLS = 400_000
+_LINEAR_ROW_CELLS = 100
+
+
+class UnsupportedPipeline(Exception):
+    """Komponen pipeline tidak bisa dikompilasi; pemanggil memakai pipeline sklearn asli."""
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-z))
+
+
+# ------------------- Transformer -> operasi blok kolom -------------------
+def _scale_op(t) -> Tuple[str, np.ndarray, np.ndarray]:
+    """Semua scaler didukung dinyatakan sebagai (x - offset) / scale."""
+    name = type(t).__name__
+    k = t.n_features_in_
+    if name == "StandardScaler":
+        offset = t.mean_ if t.with_mean and t.mean_ is not None else np.zeros(k)
+        scale = t.scale_ if t.with_std and t.scale_ is not None else np.ones(k)
+    elif name == "MinMaxScaler":
+        # x * scale_ + min_  ==  (x - (-min_/scale_)) / (1/scale_)
+        if t.clip:
+            raise UnsupportedPipeline("MinMaxScaler(clip=True) belum didukung")
+        offset, scale = -t.min_ / t.scale_, 1.0 / t.scale_
+    elif name == "RobustScaler":
+        offset = t.center_ if t.with_centering and t.center_ is not None else np.zeros(k)
+        scale = t.scale_ if t.with_scaling and t.scale_ is not None else np.ones(k)
+    elif name == "MaxAbsScaler":
+        offset, scale = np.zeros(k), t.scale_
+    else:
+        raise UnsupportedPipeline(name)
+    return ("scale", np.asarray(offset, dtype=float), np.asarray(scale, dtype=float))
+
+
+def _is_missing(v: Any) -> bool:
+    return v is None or v is pd.NA or (isinstance(v, float) and v != v)
+
+
+def _transformer_ops(t) -> List[tuple]:
+    name = type(t).__name__
+    if t == "passthrough":
+        return []
+    if name == "Pipeline":
+        return [op for _, step in t.steps for op in _transformer_ops(step)]
+    if name == "FunctionTransformer" and t.func is None:  # bentuk 'passthrough' setelah fit
+        return []
+    if name == "SimpleImputer":
+        if getattr(t, "add_indicator", False):
+            raise UnsupportedPipeline("SimpleImputer(add_indicator=True) belum didukung")
+        if not _is_missing(t.missing_values) and not (isinstance(t.missing_values, float) and np.isnan(t.missing_values)):
+            raise UnsupportedPipeline("SimpleImputer dengan missing_values non-NaN belum didukung")
+        return [("impute", list(t.statistics_))]
+    if name == "OneHotEncoder":
+        if getattr(t, "_infrequent_enabled", False):
+            raise UnsupportedPipeline("OneHotEncoder dengan kategori infrequent belum didukung")
+        maps, sizes = [], []
+        drop_idx = t.drop_idx_ if t.drop_idx_ is not None else [None] * len(t.categories_)
+        for cats, drop in zip(t.categories_, drop_idx):
+            mapping: Dict[Any, int] = {}
+            nan_idx = -1
+            pos = 0
+            for i, c in enumerate(cats):
+                if drop is not None and i == drop:
+                    continue
+                if _is_missing(c):
+                    nan_idx = pos
+                else:
+                    mapping[c] = pos
+                pos += 1
+            maps.append((mapping, nan_idx, cats[drop] if drop is not None else None))
+            sizes.append(pos)
+        return [("onehot", maps, sizes, t.handle_unknown)]
+    return [_scale_op(t)]
+
+
+def _missing_mask(col: np.ndarray) -> np.ndarray:
+    return pd.isna(col) if col.dtype == object else np.isnan(col)
+
+
+def _category_codes(values: np.ndarray, mapping: Dict[Any, int], nan_idx: int) -> np.ndarray:
+    """Kode one-hot per baris (-1 = tidak dikenal / kategori drop) via satu lookup hash ter-vektorisasi."""
+    index = pd.Index(list(mapping), dtype=object)
+    positions = index.get_indexer(values)
+    codes = np.where(positions >= 0, np.fromiter(mapping.values(), dtype=np.int64, count=len(mapping))[positions], -1)
+    codes[_missing_mask(values)] = nan_idx
+    return codes
+
+
+def _apply_ops(block: np.ndarray, ops: List[tuple]) -> np.ndarray:
+    """block: array (n, k) object/float -> array float hasil transformasi berurutan."""
+    for op in ops:
+        kind = op[0]
+        if kind == "impute":
+            block = block.copy()
+            for j, fill in enumerate(op[1]):
+                col = block[:, j]
+                col[_missing_mask(col)] = fill
+        elif kind == "scale":
+            block = (block.astype(float) - op[1]) / op[2]
+        elif kind == "onehot":
+            maps, sizes, handle_unknown = op[1], op[2], op[3]
+            n = block.shape[0]
+            out = np.zeros((n, sum(sizes)))
+            offset = 0
+            rows = np.arange(n)
+            for j, ((mapping, nan_idx, dropped), size) in enumerate(zip(maps, sizes)):
+                values = block[:, j].astype(object)
+                codes = _category_codes(values, mapping, nan_idx)
+                if handle_unknown == "error":
+                    unknown = (codes < 0) & ~_missing_mask(values)
+                    if dropped is not None:
+                        unknown &= values != dropped
+                    if unknown.any():
+                        v = values[np.flatnonzero(unknown)[0]]
+                        raise ValueError(f"Kategori tidak dikenal pada kolom ke-{j}: {v!r}")
+                hit = codes >= 0
+                out[rows[hit], offset + codes[hit]] = 1.0
+                offset += size
+            block = out
+    return block.astype(float)
+
+
+# ------------------- Model -> fungsi probabilitas -------------------
+def _tree_arrays(tree) -> Dict[str, np.ndarray]:
+    t = tree.tree_
+    value = t.value[:, 0, :].astype(float)
+    arrays = {
+        "left": t.children_left.astype(np.int64),
+        "right": t.children_right.astype(np.int64),
+        "feature": t.feature.astype(np.int64),
+        "threshold": t.threshold.astype(float),
+        "value": value,
+    }
+    missing_left = getattr(t, "missing_go_to_left", None)
+    arrays["missing_left"] = (
+        np.asarray(missing_left, dtype=bool) if missing_left is not None else np.ones(len(value), dtype=bool)
+    )
+    return arrays
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    depth = np.zeros(len(left), dtype=np.int64)
+    for i in range(len(left)):  # node sklearn selalu bernomor lebih kecil dari anak-anaknya
+        if left[i] >= 0:
+            depth[left[i]] = depth[right[i]] = depth[i] + 1
+    return int(depth.max())
+
+
+def _stack_trees(trees: List[Dict[str, np.ndarray]], leaf_score) -> Dict[str, Any]:
+    """Gabungkan semua pohon jadi satu larik node (indeks global) agar seluruh pohon ditelusuri bersamaan.
+
+    Daun menunjuk ke dirinya sendiri (ambang +inf) sehingga baris yang sudah sampai daun tetap diam;
+    leaf_score(value) -> skor per node yang langsung dijumlahkan antar pohon.
+    """
+    roots, left, right, feature, threshold, missing_left, score = [], [], [], [], [], [], []
+    offset, depth = 0, 0
+    for t in trees:
+        k = len(t["left"])
+        idx = np.arange(offset, offset + k)
+        leaf = t["left"] < 0
+        roots.append(offset)
+        left.append(np.where(leaf, idx, t["left"] + offset))
+        right.append(np.where(leaf, idx, t["right"] + offset))
+        feature.append(np.where(leaf, 0, t["feature"]))
+        threshold.append(np.where(leaf, np.inf, t["threshold"]))
+        missing_left.append(t["missing_left"] | leaf)
+        score.append(leaf_score(t["value"]))
+        depth = max(depth, _tree_depth(t["left"], t["right"]))
+        offset += k
+    return {
+        "roots": np.asarray(roots, dtype=np.int64),
+        "left": np.concatenate(left), "right": np.concatenate(right),
+        "feature": np.concatenate(feature), "threshold": np.concatenate(threshold),
+        "missing_left": np.concatenate(missing_left), "score": np.concatenate(score), "depth": depth,
+    }
+
+
+def _stacked_sum(stacked: Dict[str, Any], X: np.ndarray, chunk_cells: int = 1 << 21) -> np.ndarray:
+    """Jumlah skor daun semua pohon per baris; baris diproses per potongan agar matriks (baris x pohon) tetap kecil."""
+    n, n_trees = X.shape[0], len(stacked["roots"])
+    out = np.empty(n)
+    step = max(1, chunk_cells // max(n_trees, 1))
+    for start in range(0, n, step):
+        Xc = X[start:start + step]
+        rows = np.arange(Xc.shape[0])[:, None]
+        node = np.broadcast_to(stacked["roots"], (Xc.shape[0], n_trees)).copy()
+        for _ in range(stacked["depth"]):
+            x = Xc[rows, stacked["feature"][node]]
+            go_left = np.where(np.isnan(x), stacked["missing_left"][node], x <= stacked["threshold"][node])
+            node = np.where(go_left, stacked["left"][node], stacked["right"][node])
+        out[start:start + step] = stacked["score"][node].sum(axis=1)
+    return out
+
+
+def _stack_model_trees(m: Dict[str, Any]) -> Dict[str, Any]:
+    if m["kind"] == "forest":
+        return _stack_trees(m["trees"], lambda value: value[:, 1] / value.sum(axis=1))
+    lr = m["learning_rate"]
+    return _stack_trees(m["trees"], lambda value: lr * value[:, 0])
+
+
+def _gbdt_init(init) -> float:
+    """Skor mentah awal GradientBoosting dari estimator init_ (log-odds prior kelas positif)."""
+    if isinstance(init, str) and init == "zero":
+        return 0.0
+    if type(init).__name__ == "DummyClassifier" and init.strategy == "prior":
+        p = float(init.class_prior_[1])
+        if 0.0 < p < 1.0:
+            return float(np.log(p / (1 - p)))
+    raise UnsupportedPipeline(f"GradientBoostingClassifier(init={type(init).__name__}) belum didukung")
+
+
+def _compile_model(model) -> Dict[str, Any]:
+    name = type(model).__name__
+    classes = getattr(model, "classes_", None)
+    if classes is None or len(classes) != 2:
+        raise UnsupportedPipeline(f"{name}: hanya klasifikasi biner yang didukung")
+
+    if hasattr(model, "coef_") and hasattr(model, "intercept_") and not hasattr(model, "estimators_"):
+        if name not in ("LogisticRegression", "LogisticRegressionCV", "SGDClassifier") or (
+            name == "SGDClassifier" and model.loss not in ("log_loss", "log")
+        ):
+            raise UnsupportedPipeline(f"{name}: model linear tanpa probabilitas logistik")
+        return {"kind": "linear", "coef": np.asarray(model.coef_[0], dtype=float), "intercept": float(model.intercept_[0])}
+
+    if name == "DecisionTreeClassifier":
+        compiled = {"kind": "forest", "trees": [_tree_arrays(model)]}
+    elif name in ("RandomForestClassifier", "ExtraTreesClassifier"):
+        compiled = {"kind": "forest", "trees": [_tree_arrays(est) for est in model.estimators_]}
+    elif name == "GradientBoostingClassifier":
+        if model.loss not in ("log_loss", "deviance"):
+            raise UnsupportedPipeline(f"GradientBoostingClassifier(loss={model.loss}) belum didukung")
+        init = _gbdt_init(model.init_)
+        trees = [_tree_arrays(est) for est in model.estimators_[:, 0]]
+        compiled = {"kind": "gbdt", "trees": trees, "init": init, "learning_rate": float(model.learning_rate)}
+    else:
+        raise UnsupportedPipeline(name)
+    compiled["stacked"] = _stack_model_trees(compiled)
+    return compiled
+
+
+# ------------------- Pipeline terkompilasi -------------------
+class CompiledPipeline:
+    """Inferensi NumPy murni dengan antarmuka predict_proba seperti pipeline sklearn."""
+
+    def __init__(self, blocks: List[Tuple[List[str], List[tuple]]], post_ops: List[tuple], model: Dict[str, Any],
+                 columns: List[str]):
+        self.blocks = blocks  # [(kolom input, ops)] sesuai urutan output ColumnTransformer
+        self.post_ops = post_ops  # transformasi atas matriks penuh (setelah ColumnTransformer)
+        self.model = model
+        self.columns = columns
+        self.fallback = None  # pipeline sklearn asli untuk batch besar; tidak ikut disimpan ke artefak
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["fallback"] = None
+        return state
+
+    def _batch_cells(self, n: int) -> int:
+        m = self.model
+        if m["kind"] == "linear":
+            return n * _LINEAR_ROW_CELLS
+        stacked = m.get("stacked")
+        depth = stacked["depth"] if stacked else 1
+        return n * len(m["trees"]) * max(depth, 1)
+
+    # --- matriks desain ---
+    def _design(self, columns: Dict[str, np.ndarray], n: int) -> np.ndarray:
+        parts = []
+        for cols, ops in self.blocks:
+            raw = np.empty((n, len(cols)), dtype=object)
+            for j, c in enumerate(cols):
+                raw[:, j] = columns[c]
+            if not any(op[0] in ("onehot", "impute") for op in ops):
+                raw = raw.astype(float)
+            parts.append(_apply_ops(raw, ops))
+        X = np.hstack(parts) if parts else np.empty((n, 0))
+        return _apply_ops(X, self.post_ops) if self.post_ops else X
+
+    def _positive(self, X: np.ndarray) -> np.ndarray:
+        m = self.model
+        if m["kind"] == "linear":
+            return _sigmoid(X @ m["coef"] + m["intercept"])
+        # pohon sklearn membandingkan fitur dalam float32; samakan agar split di ambang identik
+        X = X.astype(np.float32).astype(float)
+        if "stacked" not in m:  # artefak lama: gabungkan pohon sekali saat pertama dipakai
+            m["stacked"] = _stack_model_trees(m)
+        total = _stacked_sum(m["stacked"], X)
+        if m["kind"] == "forest":
+            return total / len(m["trees"])
+        return _sigmoid(m["init"] + total)
+
+    # --- API publik ---
+    def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
+        fallback = getattr(self, "fallback", None)
+        if fallback is not None and self._batch_cells(len(X)) > FALLBACK_CELLS:
+            return fallback.predict_proba(X)
+        return self._predict_compiled(X)
+
+    def _predict_compiled(self, X: pd.DataFrame) -> np.ndarray:
+        missing = [c for c in self.columns if c not in X.columns]
+        if missing:
+            raise ValueError("Kolom tidak ditemukan: " + ", ".join(missing))
+        columns = {c: X[c].to_numpy(dtype=object) for c in self.columns}
+        p = self._positive(self._design(columns, len(X)))
+        return np.column_stack([1 - p, p])
+
+    def predict_one(self, row: Dict[str, Any]) -> float:
+        """Probabilitas kelas positif untuk satu baris dict — tanpa membangun DataFrame."""
+        columns = {c: np.array([row.get(c)], dtype=object) for c in self.columns}
+        return float(self._positive(self._design(columns, 1))[0])
+
+
+def _column_names(ct, cols) -> List[str]:
+    names = list(getattr(ct, "feature_names_in_", []))
+    if isinstance(cols, str):
+        return [cols]
+    if isinstance(cols, slice):
+        return names[cols]
+    cols = list(np.asarray(cols).ravel()) if not isinstance(cols, list) else cols
+    if cols and isinstance(cols[0], (bool, np.bool_)):
+        return [n for n, keep in zip(names, cols) if keep]
+    if cols and isinstance(cols[0], (int, np.integer)):
+        if not names:
+            raise UnsupportedPipeline("ColumnTransformer tanpa nama kolom (feature_names_in_)")
+        return [names[i] for i in cols]
+    return [str(c) for c in cols]
+
+
+def compile_pipeline(pipeline: Any) -> CompiledPipeline:
+    """Bangun CompiledPipeline dari Pipeline sklearn terlatih; UnsupportedPipeline jika ada komponen tak didukung."""
+    if type(pipeline).__name__ != "Pipeline":
+        raise UnsupportedPipeline(f"{type(pipeline).__name__}: bukan sklearn Pipeline")
+    steps = [s for _, s in pipeline.steps if s is not None and s != "passthrough"]
+    if not steps:
+        raise UnsupportedPipeline("Pipeline kosong")
+    *transforms, model = steps
+    if not transforms or type(transforms[0]).__name__ != "ColumnTransformer":
+        raise UnsupportedPipeline("Langkah pertama harus ColumnTransformer")
+
+    ct = transforms[0]
+    blocks: List[Tuple[List[str], List[tuple]]] = []
+    used: List[str] = []
+    for _, trans, cols in ct.transformers_:
+        if trans == "drop":
+            continue
+        names = _column_names(ct, cols)
+        if not names:
+            continue
+        blocks.append((names, _transformer_ops(trans)))
+        used.extend(names)
+    post_ops = [op for t in transforms[1:] for op in _transformer_ops(t)]
+    if any(op[0] == "onehot" for op in post_ops):
+        raise UnsupportedPipeline("OneHotEncoder setelah ColumnTransformer belum didukung")
+
+    columns = list(dict.fromkeys(used))
+    return CompiledPipeline(blocks, post_ops, _compile_model(model), columns)
+
+
+def verify(compiled: CompiledPipeline, pipeline: Any, sample: pd.DataFrame, atol: float = 1e-9) -> float:
+    """Bandingkan probabilitas dengan pipeline asli; ValueError jika selisih maks > atol. Return selisih maks."""
+    expected = pipeline.predict_proba(sample)[:, 1]
+    got = compiled._predict_compiled(sample)[:, 1]
+    single = np.array([compiled.predict_one(r) for r in sample.head(20).to_dict("records")])
+    diff = max(float(np.max(np.abs(expected - got))), float(np.max(np.abs(expected[: len(single)] - single))))
+    if not diff <= atol:
+        raise ValueError(f"Hasil kompilasi menyimpang dari pipeline asli (selisih maks {diff:.3g})")
+    return diff
+
+
+def compile_verified(pipeline: Any, sample: pd.DataFrame, atol: float = 1e-9) -> CompiledPipeline:
+    compiled = compile_pipeline(pipeline)
+    verify(compiled, pipeline, sample, atol)
+    return compiled
+
+
+def main(argv: Optional[Sequence[str]] = None):
+    import joblib
+
+    from src import prediction_service
+
+    parser = argparse.ArgumentParser(description="Kompilasi pipeline sklearn ke inferensi NumPy murni.")
+    parser.add_argument("--pipeline", default=prediction_service.PIPELINE_PATH)
+    parser.add_argument("--out", default=None, help="default: <pipeline>.compiled.joblib")
+    parser.add_argument("--no-mmap", dest="mmap", action="store_false",
+                        help="jangan tulis salinan tanpa kompresi (<pipeline>.mmap.joblib)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    pipeline = joblib.load(args.pipeline)
+    if args.mmap:
+        mmap_out = prediction_service.export_mmap_artifact(
+            args.pipeline, prediction_service.mmap_path(args.pipeline), pipeline
+        )
+        log.info("Salinan mmap -> %s", mmap_out)
+    compiled = compile_verified(pipeline, prediction_service.verification_sample())
+    out = args.out or prediction_service.compiled_path(args.pipeline)
+    joblib.dump(compiled, out, compress=0)
+    log.info("Pipeline terkompilasi & terverifikasi -> %s", out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# StuntLytics/src/components/ai_panel.py
+# Panel teks AI non-blocking: tampilkan placeholder/teks parsial, hasil muncul otomatis setelah worker selesai.
+# - fn dijalankan di worker background (src.ai_worker) sekali per key, jadi rerun halaman tidak
+#   memblokir; jawaban disimpan di src.llm_cache (fn memanggil stream_chat(cache=True)) sehingga sesi
+#   lain / restart dengan slice data yang sama langsung dapat hasil (ditunggu sebentar: CACHE_WAIT)
+# - key = ai_worker.job_key(jenis, filter, ringkasan statistik): cukup berisi semua input prompt
+# - fn boleh mengembalikan str atau generator potongan teks (streaming); exception ditampilkan
+#   sebagai peringatan (pesan exception = teks yang tampil)
+import streamlit as st
+from typing import Any, Callable
+
+from src import ai_worker
+
+CACHE_WAIT = 0.3  # detik; cukup untuk hit llm_cache sehingga panel langsung tampil tanpa polling
+
+
+def render(
+    key: str,
+    fn: Callable[..., str],
+    *args: Any,
+    waiting_msg: str = "AI sedang menganalisis...",
+    poll_seconds: float = 1.0,
+):
+    """Render hasil job AI `key`; jika belum ada, jadwalkan fn(*args) dan poll tanpa memblokir halaman."""
+    hit = ai_worker.submit(key, fn, *args, wait=CACHE_WAIT)
+    if hit is not None:
+        _show(hit)
+        return
+
+    fragment = getattr(st, "fragment", None)
+    if fragment is None:  # Streamlit lama: tanpa polling otomatis
+        st.info(f"⏳ {waiting_msg}")
+        st.button("🔄 Tampilkan hasil AI", key=f"ai_refresh_{key}")
+        return
+
+    @fragment(run_every=poll_seconds)
+    def _poll():
+        if ai_worker.result(key) is None and ai_worker.is_pending(key):
+            text = ai_worker.partial(key)
+            if text:
+                st.markdown(text + " ▌")  # job streaming: tampilkan teks yang sudah diterima
+            else:
+                st.info(f"⏳ {waiting_msg}")
+        else:
+            # Hasil sudah di cache -> rerun penuh sekali agar panel dirender statis (polling berhenti)
+            st.rerun()
+
+    _poll()
+
+
+def _show(hit):
+    ok, text = hit
+    if ok:
+        st.markdown(text)
+    else:
+        st.warning(text)
@@ -0,0 +1,251 @@
+# StuntLytics/src/context_compaction.py
+# Pemadatan context_json InsightNow agar muat dalam anggaran token per giliran.
+# - Hanya bagian ringkasan yang relevan dengan maksud pertanyaan yang dikirim (ditambah inti)
+# - Angka dibulatkan, list-of-dict diubah jadi tabel kolom/baris (kunci tidak diulang per baris)
+# - Bagian yang identik dengan konteks yang masih ada di riwayat percakapan tidak dikirim ulang
+# - Anggaran token (INSIGHT_TOKEN_BUDGET) dibagi antara riwayat & konteks; bagian berprioritas
+#   rendah dipangkas lebih dulu, lalu tren dipotong ke bulan terbaru sampai muat anggaran
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+TOKEN_BUDGET = int(os.getenv("INSIGHT_TOKEN_BUDGET", "3000"))  # riwayat + konteks (tanpa system prompt)
+HISTORY_SHARE = 0.4  # porsi anggaran maksimum untuk riwayat chat
+
+try:  # opsional: hitungan token persis bila tiktoken terpasang
+    import tiktoken
+
+    _ENCODER = tiktoken.get_encoding("o200k_base")
+except Exception:
+    _ENCODER = None
+
+
+def estimate_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _ENCODER is not None:
+        return len(_ENCODER.encode(text))
+    return len(text) // 4 + 1  # ~4 karakter per token (teks campuran Indonesia/JSON)
+
+
+# Maksud pertanyaan -> kata kunci
+INTENTS: Dict[str, Tuple[str, ...]] = {
+    "tren": ("tren", "trend", "bulan", "musim", "naik", "turun", "waktu"),
+    "risiko": ("risiko", "faktor", "anemia", "hb", "bblr", "berat lahir", "lila", "bmi", "anc", "asi"),
+    "wilayah": ("kecamatan", "kec ", "kabupaten", "kota", "top", "wilayah", "hotspot", "peringkat", "vs", "banding"),
+    "sosial": ("pendidikan", "pekerjaan", "bantuan", "upah", "ump", "ekonomi", "sosial"),
+    "lingkungan": ("air", "sanitasi", "rokok", "imunisasi", "lingkungan"),
+    "distribusi": ("distribusi", "sebaran", "persentil", "median", "usia", "histogram"),
+}
+
+# Bagian summary -> maksud yang membutuhkannya (None = selalu dikirim)
+SECTIONS: Dict[str, Optional[Tuple[str, ...]]] = {
+    "sumber_data": None,
+    "fact_sheets": None,  # beberapa entitas dari src.fact_sheets; isinya dipilih per maksud juga
+    "indikator_utama": None,
+    "stat_rerata": None,
+    "risiko_pct": ("risiko", "ringkas"),
+    "kecamatan_rank": ("wilayah", "ringkas"),
+    "top10_kabupaten": ("wilayah",),
+    "top10_kecamatan": ("wilayah",),
+    "trend_bulanan": ("tren", "ringkas"),
+    "distribusi": ("sosial", "lingkungan", "distribusi"),
+    "percentiles": ("risiko", "distribusi"),
+    "histogram": ("distribusi",),
+}
+# Urutan pemangkasan saat melewati anggaran (paling awal dibuang lebih dulu)
+_DROP_ORDER = ["histogram", "percentiles", "distribusi", "top10_kecamatan", "top10_kabupaten",
+               "kecamatan_rank", "trend_bulanan", "risiko_pct"]
+# Sebelum trend_bulanan dibuang, semua tabel tren (summary, fact_sheets, extra) dipotong ke N bulan
+# terbaru secara bertahap; bila masih melewati anggaran: extra, isi fact_sheets, lalu bagian inti
+_TREND_STEPS = (12, 6, 3)
+_CORE_DROP_ORDER = ["fact_sheets", "stat_rerata", "indikator_utama"]
+
+
+def detect_intents(question: str) -> List[str]:
+    q = f" {(question or '').lower()} "
+    found = [name for name, words in INTENTS.items() if any(w in q for w in words)]
+    return found or ["ringkas"]
+
+
+def _round(x: Any) -> Any:
+    if isinstance(x, float):
+        return round(x, 3) if abs(x) < 1 else round(x, 1)
+    if isinstance(x, dict):
+        return {k: _round(v) for k, v in x.items() if v is not None}
+    if isinstance(x, (list, tuple)):
+        return [_round(v) for v in x]
+    return x
+
+
+def _table(records: List[Dict[str, Any]], cols: List[str]) -> Dict[str, Any]:
+    return {"kolom": cols, "baris": [[r.get(c) for c in cols] for r in records]}
+
+
+def _compact_section(name: str, value: Any, intents: Optional[set] = None) -> Any:
+    if name == "fact_sheets":
+        return [
+            {k: _compact_section(k, v) for k, v in sheet.items()
+             if k not in SECTIONS or SECTIONS[k] is None or (intents or set()) & set(SECTIONS[k])}
+            for sheet in value
+        ]
+    if name == "distribusi":
+        return {k: {str(b["key"]): b["pct"] for b in v} for k, v in value.items()}
+    if name == "histogram":
+        return {k: {str(b["bin_start"]): b["pct"] for b in v} for k, v in value.items()}
+    if name == "percentiles":
+        return {k: [v.get(p) for p in ("5.0", "25.0", "50.0", "75.0", "95.0")] for k, v in value.items()}
+    if name == "trend_bulanan":
+        cols = [c for c in ("periode", "total", "stunting_pct", "avg_prob") if any(r.get(c) is not None for r in value)]
+        return _table(value, cols)
+    if name == "kecamatan_rank":
+        cols = ["Kecamatan", "Wilayah", "n", "stunting_pct"]
+        return {"min_n": value.get("min_n"), "top": _table(value.get("top", []), cols),
+                "bottom": _table(value.get("bottom", []), cols)}
+    if name in ("top10_kabupaten", "top10_kecamatan") and value:
+        return _table(value, list(value[0].keys()))
+    return value
+
+
+def _tail_trends(obj: Any, n: int) -> Any:
+    """Salinan obj dengan setiap tabel tren (kolom berisi "periode") dipotong ke n baris terbaru."""
+    if isinstance(obj, dict):
+        if "periode" in obj.get("kolom", ()) and isinstance(obj.get("baris"), list):
+            return {**obj, "baris": obj["baris"][-n:]}
+        return {k: _tail_trends(v, n) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_tail_trends(v, n) for v in obj]
+    return obj
+
+
+def _hash(obj: Any) -> str:
+    raw = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def compact_filters(filters: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: (str(v) if not isinstance(v, (list, int, float, str)) else v)
+            for k, v in filters.items() if v not in (None, "", [], {}) and not k.endswith("_field")}
+
+
+def compact_context(
+    question: str,
+    context: Dict[str, Any],
+    seen: Optional[Dict[str, str]] = None,
+    budget: int = TOKEN_BUDGET,
+) -> Tuple[str, Dict[str, str]]:
+    """context_json padat untuk satu giliran.
+    `seen` = {bagian: hash} yang masih terlihat di riwayat; bagian identik diganti referensi.
+    Kembalikan (json, {bagian: hash} yang datanya dikirim di giliran ini; referensi tidak termasuk).
+    """
+    seen = seen or {}
+    intents = set(detect_intents(question))
+    summary = context.get("summary", {})
+    extra = _round(dict(context.get("extra", {})))
+    if "tren_bulanan" in extra:  # seri penuh di extra menggantikan 24 bulan di summary
+        extra["tren_bulanan"] = _compact_section("trend_bulanan", extra["tren_bulanan"])
+    for key in ("top_kabupaten", "top_kecamatan"):
+        if key in extra:
+            extra[key] = _compact_section("top10_kabupaten", extra[key])
+
+    sections: Dict[str, Any] = {}
+    for name, needs in SECTIONS.items():
+        if name not in summary or (needs is not None and not intents & set(needs)):
+            continue
+        if name == "trend_bulanan" and "tren_bulanan" in extra:
+            continue
+        sections[name] = _round(_compact_section(name, summary[name], intents))
+
+    hashes = {name: _hash(value) for name, value in sections.items()}
+    repeated = [name for name, h in hashes.items() if seen.get(name) == h]
+
+    def render(names: List[str]) -> str:
+        payload: Dict[str, Any] = {
+            "filters": compact_filters(context.get("filters", {})),
+            "summary": {n: sections[n] for n in names if n not in repeated},
+            "extra": extra,
+        }
+        if repeated:
+            payload["sama_dengan_sebelumnya"] = [n for n in repeated if n in names]
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    names = list(sections)
+    text = render(names)
+    for name in _DROP_ORDER:
+        if name == "trend_bulanan":  # potong tren ke bulan terbaru dulu sebelum dibuang
+            for n in _TREND_STEPS:
+                if estimate_tokens(text) <= budget:
+                    break
+                sections = {k: _tail_trends(v, n) for k, v in sections.items()}
+                extra = _tail_trends(extra, n)
+                text = render(names)
+        if estimate_tokens(text) <= budget:
+            break
+        if name in names:
+            names.remove(name)
+            text = render(names)
+    for key in sorted(extra, key=lambda k: -len(json.dumps(extra[k], default=str))):
+        if estimate_tokens(text) <= budget:
+            break
+        del extra[key]
+        text = render(names)
+    if "fact_sheets" in names and estimate_tokens(text) > budget:
+        # beberapa entitas: sisakan bagian inti per sheet sebelum membuang sheet
+        core = {k for k, needs in SECTIONS.items() if needs is None} | {"level", "kabupaten", "kecamatan"}
+        sections["fact_sheets"] = [{k: v for k, v in sheet.items() if k in core} for sheet in sections["fact_sheets"]]
+        text = render(names)
+        while len(sections["fact_sheets"]) > 1 and estimate_tokens(text) > budget:
+            sections["fact_sheets"] = sections["fact_sheets"][:-1]
+            text = render(names)
+    for name in _CORE_DROP_ORDER:
+        if estimate_tokens(text) <= budget:
+            break
+        if name in names:
+            names.remove(name)
+            text = render(names)
+    # Hanya bagian yang datanya ada di payload ini; referensi tidak dihitung agar bagian dikirim ulang
+    # begitu pesan yang memuat datanya terpangkas dari riwayat. Hash mengikuti isi yang benar-benar
+    # dikirim (bagian terpotong tidak dianggap identik dengan versi penuh).
+    return text, {n: _hash(sections[n]) for n in names if n not in repeated}
+
+
+def fit_history(messages: List[Dict[str, Any]], budget: int) -> List[Dict[str, Any]]:
+    """Pesan riwayat terbaru yang muat anggaran (yang tertua dibuang lebih dulu)."""
+    kept: List[Dict[str, Any]] = []
+    used = 0
+    for m in reversed(messages):
+        cost = estimate_tokens(m["content"])
+        if used + cost > budget:
+            break
+        kept.append(m)
+        used += cost
+    return list(reversed(kept))
+
+
+def build_messages(
+    system_msg: str,
+    question: str,
+    context: Dict[str, Any],
+    history: List[Dict[str, Any]],
+    budget: int = TOKEN_BUDGET,
+) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+    """Susun pesan ke LLM dalam anggaran token.
+    `history` = riwayat sebelumnya; pesan user boleh membawa "payload" (pertanyaan + konteks yang
+    pernah dikirim) dan "ctx_hashes". Kembalikan (messages, {"payload", "ctx_hashes", "tokens"}).
+    """
+    turns = [{"role": m["role"], "content": m.get("payload", m["content"]), "ctx_hashes": m.get("ctx_hashes", {})}
+             for m in history if m["role"] in ("user", "assistant")]
+    turns = fit_history(turns, int(budget * HISTORY_SHARE))
+    seen: Dict[str, str] = {}
+    for m in turns:
+        seen.update(m["ctx_hashes"])
+    history_tokens = sum(estimate_tokens(m["content"]) for m in turns)
+
+    context_json, hashes = compact_context(question, context, seen, budget - history_tokens)
+    payload = f"Pertanyaan:\n{question}\n\ncontext_json:\n{context_json}"
+    messages = [{"role": "system", "content": system_msg},
+                *({"role": m["role"], "content": m["content"]} for m in turns),
+                {"role": "user", "content": payload}]
+    return messages, {"payload": payload, "ctx_hashes": hashes, "tokens": history_tokens + estimate_tokens(payload)}
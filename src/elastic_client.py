@@ -5,12 +5,18 @@
 # - Tanpa pemakaian ".keyword" di source; untuk terms agg diasumsikan field bertipe keyword.
 #   (Jika mapping text, aktifkan fielddata/normalizer atau tambahkan subfield keyword di ES.)
 
+import json
 import os
 import time
 import requests
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
 from typing import Dict, Any, List, Optional, Tuple
 
+# Faktor risiko biner (kunci risiko_count/risiko_pct -> (nama agregasi, filter)): satu definisi di utils/es.py
+from utils.es import RISK_AGGS
+
 try:
     from pathlib import Path
     from dotenv import load_dotenv
@@ -27,26 +33,224 @@ NUTRITION_INDEX = os.getenv("NUTRITION_INDEX", "jabar-tenaga-gizi")
 # ==== kandidat field tanpa ".keyword" (selaras dengan utils/es.py) ====
 CANDIDATES_WILAYAH = ["nama_kabupaten_kota", "Wilayah", "bps_nama_kabupaten_kota"]
 CANDIDATES_KECAMATAN = ["Kecamatan", "bps_nama_kecamatan"]
+# Field desa/kelurahan di index stunting (dipakai peta risiko level desa)
+DESA_FIELD = os.getenv("DESA_FIELD", "Desa")
+# Field probabilitas untuk filter zona risiko; isi "Probabilitas Stunting (model)" setelah
+# job jobs/score_predictions menulis hasil model ke index
+RISK_PROB_FIELD = os.getenv("RISK_PROB_FIELD", "Probabilitas Stunting (simulasi)")
 
 # ------------------- HTTP helpers -------------------
 _SESSION = requests.Session()
 
 
-def _es_post(index: str, path: str, body: Dict[str, Any], timeout: int = 60, retries: int = 1) -> Dict[str, Any]:
-    url = f"{ES_URL}/{index}{path}"
+class ESResponseError(ConnectionError):
+    """ES membalas dengan status error; status & jenis error (termasuk root_cause) ikut dibawa."""
+
+    def __init__(self, message: str, status: int, error_types: List[str]):
+        super().__init__(message)
+        self.status = status
+        self.error_types = error_types
+
+
+def _error_types(response: requests.Response) -> List[str]:
+    try:
+        error = response.json().get("error") or {}
+    except ValueError:
+        return []
+    if not isinstance(error, dict):
+        return []
+    causes = [error] + list(error.get("root_cause") or []) + [error.get("caused_by") or {}]
+    return [c["type"] for c in causes if isinstance(c, dict) and c.get("type")]
+
+
+def is_pit_expired(exc: BaseException) -> bool:
+    """True bila error berasal dari PIT yang sudah kedaluwarsa / ditutup."""
+    return isinstance(exc, ESResponseError) and "search_context_missing_exception" in exc.error_types
+
+
+def _es_post(index: str, path: str, body: Optional[Dict[str, Any]], timeout: int = 60, retries: int = 1) -> Dict[str, Any]:
+    # index kosong -> endpoint level cluster (mis. pencarian dengan PIT: POST /_search)
+    url = f"{ES_URL}/{index}{path}" if index else f"{ES_URL}{path}"
     last = None
     for attempt in range(retries + 1):
         try:
             r = _SESSION.post(url, json=body, timeout=timeout)
             r.raise_for_status()
             return r.json()
+        except requests.exceptions.HTTPError as e:
+            last = e
+            if e.response is not None and e.response.status_code < 500:
+                # 4xx: request-nya yang salah (query, PIT kedaluwarsa) -> tidak di-retry
+                raise ESResponseError(
+                    f"Elasticsearch menolak request ke {url}: {e}",
+                    e.response.status_code,
+                    _error_types(e.response),
+                )
         except requests.exceptions.RequestException as e:
             last = e
-            if attempt < retries:
-                time.sleep(0.5 * (2 ** attempt))
+        if attempt < retries:
+            time.sleep(0.5 * (2 ** attempt))
     raise ConnectionError(f"Gagal menghubungi Elasticsearch di {url}: {last}")
 
 
+def search(body: Dict[str, Any], index: str = STUNTING_INDEX, timeout: int = 60) -> Dict[str, Any]:
+    """POST <index>/_search (retry & error handling sama dengan semua query di modul ini)."""
+    return _es_post(index, "/_search", body, timeout=timeout)
+
+
+def iter_composite_pages(
+    index: str,
+    body: Dict[str, Any],
+    sources: List[Dict[str, Any]],
+    sub_aggs: Optional[Dict[str, Any]] = None,
+    page_size: int = 1000,
+    first_page_aggs: Optional[Dict[str, Any]] = None,
+):
+    """Paginasi composite aggregation via after_key.
+    Yield (buckets, aggregations) per halaman; first_page_aggs (mis. cardinality) hanya ikut di halaman pertama.
+    """
+    after = None
+    while True:
+        composite: Dict[str, Any] = {"sources": sources, "size": page_size}
+        if after:
+            composite["after"] = after
+        agg: Dict[str, Any] = {"composite": composite}
+        if sub_aggs:
+            agg["aggs"] = sub_aggs
+        page_body = dict(body)
+        page_body["size"] = 0
+        page_body["aggs"] = {"pages": agg}
+        if after is None and first_page_aggs:
+            page_body["aggs"].update(first_page_aggs)
+
+        data = _es_post(index, "/_search", page_body)
+        aggs = data.get("aggregations", {})
+        buckets = aggs.get("pages", {}).get("buckets", [])
+        if buckets:
+            yield buckets, aggs
+        after = aggs.get("pages", {}).get("after_key")
+        if not buckets or not after:
+            break
+
+
+def _es_msearch(index: str, bodies: List[Dict[str, Any]], timeout: int = 60) -> List[Dict[str, Any]]:
+    """Multi-search: banyak query dalam satu request (dieksekusi paralel oleh ES). Return list responses."""
+    lines = []
+    for body in bodies:
+        lines.append(json.dumps({"index": index}))
+        lines.append(json.dumps(body, default=str))
+    payload = "\n".join(lines) + "\n"
+    url = f"{ES_URL}/_msearch"
+    try:
+        r = _SESSION.post(url, data=payload.encode("utf-8"), timeout=timeout,
+                          headers={"Content-Type": "application/x-ndjson"})
+        r.raise_for_status()
+        return r.json().get("responses", [])
+    except requests.exceptions.RequestException as e:
+        raise ConnectionError(f"Gagal menghubungi Elasticsearch di {url}: {e}")
+
+
+def bulk_update(updates: List[Tuple[str, str, Dict[str, Any]]], timeout: int = 120) -> Dict[str, int]:
+    """Partial update massal via _bulk. updates = [(index, _id, doc)]. Return {"updated", "failed"}."""
+    if not updates:
+        return {"updated": 0, "failed": 0}
+    lines = []
+    for index, doc_id, doc in updates:
+        lines.append(json.dumps({"update": {"_index": index, "_id": doc_id}}))
+        lines.append(json.dumps({"doc": doc}, default=str))
+    payload = "\n".join(lines) + "\n"
+    url = f"{ES_URL}/_bulk"
+    try:
+        r = _SESSION.post(url, data=payload.encode("utf-8"), timeout=timeout,
+                          headers={"Content-Type": "application/x-ndjson"})
+        r.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        raise ConnectionError(f"Gagal menghubungi Elasticsearch di {url}: {e}")
+    items = r.json().get("items", [])
+    failed = sum(1 for it in items if it.get("update", {}).get("status", 500) >= 300)
+    return {"updated": len(items) - failed, "failed": failed}
+
+
+def put_mapping(properties: Dict[str, Any], index: str = STUNTING_INDEX):
+    """Tambahkan field baru ke mapping index (idempoten untuk definisi yang sama)."""
+    url = f"{ES_URL}/{index}/_mapping"
+    r = _SESSION.put(url, json={"properties": properties}, timeout=30)
+    r.raise_for_status()
+
+
+def get_field_names(index: str = STUNTING_INDEX) -> set:
+    """Semua nama field yang ter-mapping di index (objek bertingkat -> nama bertitik)."""
+    url = f"{ES_URL}/{index}/_mapping"
+    try:
+        r = _SESSION.get(url, timeout=30)
+        r.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        raise ConnectionError(f"Gagal menghubungi Elasticsearch di {url}: {e}")
+
+    names: set = set()
+
+    def walk(props: Dict[str, Any], prefix: str = ""):
+        for name, spec in props.items():
+            names.add(prefix + name)
+            walk(spec.get("properties", {}), f"{prefix}{name}.")
+
+    for idx in r.json().values():
+        walk(idx.get("mappings", {}).get("properties", {}))
+    return names
+
+
+def open_pit(index: str = STUNTING_INDEX, keep_alive: str = "5m") -> str:
+    """Buka point-in-time (snapshot konsisten) untuk paginasi search_after."""
+    data = _es_post(index, f"/_pit?keep_alive={keep_alive}", None)
+    return data["id"]
+
+
+def close_pit(pit_id: Optional[str]) -> None:
+    """Tutup PIT (best-effort; PIT tetap kedaluwarsa sendiri setelah keep_alive)."""
+    if not pit_id:
+        return
+    try:
+        _SESSION.delete(f"{ES_URL}/_pit", json={"id": pit_id}, timeout=10)
+    except requests.exceptions.RequestException:
+        pass
+
+
+def iter_pit_pages(
+    body: Dict[str, Any],
+    batch_size: int = 2000,
+    index: str = STUNTING_INDEX,
+    keep_alive: str = "2m",
+):
+    """Alirkan seluruh hasil query per halaman (list hits) dengan PIT + search_after.
+    Sort body dipertahankan (ditambah tiebreaker _shard_doc); PIT selalu ditutup di akhir.
+    """
+    pit_id = open_pit(index, keep_alive=keep_alive)
+    sort = list(body.get("sort") or []) + [{"_shard_doc": "asc"}]
+    search_after = None
+    try:
+        while True:
+            page_body = dict(body)
+            page_body.update({
+                "size": batch_size,
+                "sort": sort,
+                "pit": {"id": pit_id, "keep_alive": keep_alive},
+                "track_total_hits": False,
+            })
+            if search_after is not None:
+                page_body["search_after"] = search_after
+            data = _es_post("", "/_search", page_body)
+            pit_id = data.get("pit_id", pit_id)
+            hits = data.get("hits", {}).get("hits", [])
+            if not hits:
+                break
+            yield hits
+            if len(hits) < batch_size:
+                break
+            search_after = hits[-1]["sort"]
+    finally:
+        close_pit(pit_id)
+
+
 def ping() -> Tuple[bool, str]:
     try:
         r = _SESSION.get(ES_URL, timeout=5)
@@ -91,13 +295,13 @@ def build_query(filters: Dict[str, Any]) -> Dict[str, Any]:
         ranges: List[Dict[str, Any]] = []
         for rl in filters["risk_level"]:
             if rl == "Zona 3 (>=0.70)":
-                ranges.append({"range": {"Probabilitas Stunting (simulasi)": {"gte": 0.70}}})
+                ranges.append({"range": {RISK_PROB_FIELD: {"gte": 0.70}}})
             elif rl == "Zona 2 (0.40-<0.70)":
-                ranges.append({"range": {"Probabilitas Stunting (simulasi)": {"gte": 0.40, "lt": 0.70}}})
+                ranges.append({"range": {RISK_PROB_FIELD: {"gte": 0.40, "lt": 0.70}}})
             elif rl == "Zona 1 (0.10-<0.40)":
-                ranges.append({"range": {"Probabilitas Stunting (simulasi)": {"gte": 0.10, "lt": 0.40}}})
+                ranges.append({"range": {RISK_PROB_FIELD: {"gte": 0.10, "lt": 0.40}}})
             elif rl == "Zona 0 (<0.10)":
-                ranges.append({"range": {"Probabilitas Stunting (simulasi)": {"lt": 0.10}}})
+                ranges.append({"range": {RISK_PROB_FIELD: {"lt": 0.10}}})
         if ranges:
             must.append({"bool": {"should": ranges, "minimum_should_match": 1}})
 
@@ -108,7 +312,7 @@ def build_query(filters: Dict[str, Any]) -> Dict[str, Any]:
 _STUNTING_BINER = ["Stunting", "Ya", "YA", "ya", "1", "true", "TRUE", "True"]
 
 
-def _stunting_any_filter() -> Dict[str, Any]:
+def stunting_any_filter() -> Dict[str, Any]:
     return {
         "bool": {
             "should": [
@@ -150,7 +354,7 @@ def get_main_page_summary(filters: Dict[str, Any]) -> Dict[str, Any]:
             "size": 0,
             "track_total_hits": True,
             "aggs": {
-                "stunting_count": {"filter": _stunting_any_filter()},
+                "stunting_count": {"filter": stunting_any_filter()},
                 "imunisasi_lengkap": {
                     "filter": {"bool": {"should": [
                         {"terms": {"Imunisasi (lengkap/tidak lengkap)": ["lengkap", "Lengkap", "complete", "Complete"]}},
@@ -253,212 +457,569 @@ def get_main_page_summary(filters: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-# ------------------- Correlation trend (mirror utils/es.py) -------------------
-
-def get_monthly_trend(filters: Dict[str, Any]) -> pd.DataFrame:
+# ------------------- Sampel bertingkat (stratified) -------------------
+
+def _allocate_sample(counts: np.ndarray, weights: np.ndarray, size: int) -> np.ndarray:
+    """Alokasi proporsional (count x bobot) dengan pembulatan largest-remainder, dibatasi count stratum."""
+    alloc = np.zeros(len(counts), dtype=np.int64)
+    remaining = min(int(size), int(counts.sum()))
+    share = counts * weights
+    while remaining > 0:
+        open_ = alloc < counts
+        if not open_.any() or share[open_].sum() <= 0:
+            break
+        quota = np.where(open_, share, 0.0)
+        quota = quota / quota.sum() * remaining
+        add = np.minimum(np.floor(quota).astype(np.int64), counts - alloc)
+        if add.sum() == 0:
+            # sisa kecil: beri satu ke stratum dengan sisa pecahan terbesar
+            order = np.argsort(-(quota - np.floor(quota)))
+            add = np.zeros_like(alloc)
+            for i in order[:remaining]:
+                if open_[i]:
+                    add[i] = 1
+        alloc += add
+        remaining -= int(add.sum())
+    return alloc
+
+
+def get_stratified_sample(
+    filters: Dict[str, Any],
+    size: int = 2000,
+    seed: int = 42,
+    strata_field: str = "nama_kabupaten_kota",
+    by_month: bool = True,
+    weights: Optional[Dict[str, float]] = None,
+    fields: Optional[List[str]] = None,
+    batch: int = 100,
+    max_workers: int = 4,
+) -> pd.DataFrame:
+    """Sampel acak bertingkat per kabupaten (x bulan) — tidak bias ke urutan ingest index.
+    - Ukuran per stratum proporsional terhadap jumlah dokumen x weights[kabupaten] (default 1).
+    - Tiap stratum diambil acak dengan random_score(seed) -> hasil reproducible.
+    - Query per stratum dikirim via _msearch (batch), beberapa batch berjalan paralel.
+    Kolom tambahan: _stratum dan _bobot (N_stratum / n_sampel) untuk estimasi populasi berbobot.
+    """
     body = build_query(filters)
-    body.update({
-        "size": 0,
-        "aggs": {
-            "per_month": {
-                "date_histogram": {"field": "Tanggal", "calendar_interval": "month", "format": "yyyy-MM"},
-                "aggs": {
-                    "stunting_any": {"filter": _stunting_any_filter()},
-                    "total_in_month": {"filter": {"match_all": {}}},
-                },
-            }
-        },
-    })
-    res = _es_post(STUNTING_INDEX, "/_search", body)
-    rows: List[Dict[str, Any]] = []
-    for b in res["aggregations"]["per_month"]["buckets"]:
-        total = b["total_in_month"]["doc_count"]
-        stunting = b["stunting_any"]["doc_count"]
-        percent = (stunting / total * 100) if total > 0 else 0
-        rows.append({"Bulan": b["key_as_string"], "Stunting %": round(percent, 2)})
-    return pd.DataFrame(rows).set_index("Bulan")
+    sources: List[Dict[str, Any]] = [{"strata": {"terms": {"field": strata_field}}}]
+    if by_month:
+        sources.append({"bulan": {"date_histogram": {"field": "Tanggal", "calendar_interval": "month"}}})
+
+    strata: List[Dict[str, Any]] = []
+    for buckets, _ in iter_composite_pages(STUNTING_INDEX, body, sources, page_size=1000):
+        strata.extend({"key": b["key"], "count": b["doc_count"]} for b in buckets)
+    if not strata:
+        return pd.DataFrame()
+
+    counts = np.array([s["count"] for s in strata], dtype=np.int64)
+    w = np.array([(weights or {}).get(s["key"]["strata"], 1.0) for s in strata], dtype=float)
+    alloc = _allocate_sample(counts, w, size)
+
+    queries, meta = [], []
+    for s, n_k in zip(strata, alloc):
+        if n_k <= 0:
+            continue
+        q = build_query(filters)
+        if "match_all" in q["query"]:
+            q["query"] = {"bool": {"must": []}}
+        must = q["query"]["bool"].setdefault("must", [])
+        must.append({"term": {strata_field: s["key"]["strata"]}})
+        if by_month:
+            start = pd.Timestamp(s["key"]["bulan"], unit="ms")
+            end = start + pd.offsets.MonthBegin(1)
+            must.append({"range": {"Tanggal": {
+                "gte": int(start.value // 10**6), "lt": int(end.value // 10**6), "format": "epoch_millis"}}})
+        queries.append({
+            "size": int(n_k),
+            "_source": fields or True,
+            "query": {"function_score": {
+                "query": q["query"],
+                "random_score": {"seed": seed, "field": "_seq_no"},
+                "boost_mode": "replace",
+            }},
+        })
+        stratum = s["key"]["strata"] + (f" | {start:%Y-%m}" if by_month else "")
+        meta.append((stratum, s["count"] / n_k))
+
+    batches = [range(i, min(i + batch, len(queries))) for i in range(0, len(queries), batch)]
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as pool:
+        responses = pool.map(lambda idx: _es_msearch(STUNTING_INDEX, [queries[i] for i in idx]), batches)
+        frames = []
+        for idx, resp in zip(batches, responses):
+            for i, r in zip(idx, resp):
+                hits = r.get("hits", {}).get("hits", [])
+                if not hits:
+                    continue
+                df = pd.DataFrame([h.get("_source", {}) for h in hits])
+                df["_stratum"], df["_bobot"] = meta[i]
+                frames.append(df)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
 
 # ------------------- Numeric sample for correlation -------------------
 
-def get_numeric_sample_for_corr(filters: Dict[str, Any], size: int = 5000) -> pd.DataFrame:
-    body = build_query(filters)
-    body.update({"size": size})
-    data = _es_post(STUNTING_INDEX, "/_search", body)
-    hits = data.get("hits", {}).get("hits", [])
-    df_sample = pd.DataFrame([h.get("_source", {}) for h in hits])
+def get_numeric_sample_for_corr(
+    filters: Dict[str, Any], size: int = 5000, stratified: bool = True, seed: int = 42
+) -> pd.DataFrame:
+    if stratified:
+        df_sample = get_stratified_sample(filters, size=size, seed=seed)
+        df_sample = df_sample.drop(columns=["_stratum", "_bobot"], errors="ignore")
+    else:
+        body = build_query(filters)
+        body.update({"size": size})
+        data = _es_post(STUNTING_INDEX, "/_search", body)
+        hits = data.get("hits", {}).get("hits", [])
+        df_sample = pd.DataFrame([h.get("_source", {}) for h in hits])
     if df_sample.empty:
         return pd.DataFrame()
     return df_sample.select_dtypes(include=["number"]).copy()
 
 
-# ------------------- Explorer Data -------------------
+# ------------------- Korelasi populasi penuh (matrix_stats) -------------------
+
+CORR_TARGET_FIELD = "Z-Score TB/U"
+CORR_NUMERIC_FIELDS = [
+    "Z-Score TB/U",
+    "Berat Lahir (gram)",
+    "Usia Anak (bulan)",
+    "Tinggi Badan Ibu (cm)",
+    "Usia Ibu saat Hamil (tahun)",
+    "BMI Pra-Hamil",
+    "Hb (g/dL)",
+    "LiLA saat Hamil (cm)",
+    "Kunjungan ANC (x)",
+    "Upah Keluarga (Rp/bulan)",
+    "Jumlah Anak",
+    "Probabilitas Stunting (simulasi)",
+]
+
+
+def get_correlation_matrix(filters: Dict[str, Any], fields: Optional[List[str]] = None) -> pd.DataFrame:
+    """Matriks korelasi Pearson atas SEMUA dokumen terfilter, dihitung server-side (matrix_stats).
+    Dokumen yang tidak punya salah satu field diabaikan oleh ES; field tak ter-mapping tidak muncul.
+    """
+    body = build_query(filters)
+    body.update({"size": 0, "aggs": {"corr": {"matrix_stats": {"fields": fields or CORR_NUMERIC_FIELDS}}}})
+    data = _es_post(STUNTING_INDEX, "/_search", body)
+    stats = data.get("aggregations", {}).get("corr", {}).get("fields", [])
+    if not stats:
+        return pd.DataFrame()
+    names = [f["name"] for f in stats]
+    corr = pd.DataFrame({f["name"]: f.get("correlation", {}) for f in stats})
+    return corr.reindex(index=names, columns=names).astype(float)
 
-def _apply_advanced_filters_to_query(body: dict, advanced_filters: dict) -> dict:
-    has_advanced = any(
-        (isinstance(advanced_filters.get(k), list) and advanced_filters.get(k))
-        or (
-            not isinstance(advanced_filters.get(k), list)
-            and advanced_filters.get(k)
-            and advanced_filters.get(k) != "Semua"
-        )
-        for k in advanced_filters
-    )
-    if not has_advanced:
-        return body
 
-    if "match_all" in body["query"]:
-        body["query"] = {"bool": {"must": []}}
+def get_zscore_correlations(
+    filters: Dict[str, Any], target: str = CORR_TARGET_FIELD, fields: Optional[List[str]] = None
+) -> pd.Series:
+    """Korelasi tiap faktor terhadap target (default Z-Score TB/U) — Series yang dipakai radar chart."""
+    corr = get_correlation_matrix(filters, fields)
+    if corr.empty or target not in corr.columns:
+        return pd.Series(dtype=float)
+    return corr[target].drop(target, errors="ignore").dropna()
+
+
+# ------------------- Explorer Data -------------------
 
-    must = body["query"]["bool"].setdefault("must", [])
+def _advanced_filter_clauses(advanced_filters: dict) -> List[Dict[str, Any]]:
+    """Klausa filter lanjutan explorer (Pendidikan Ibu, ASI Eksklusif, Akses Air)."""
+    clauses: List[Dict[str, Any]] = []
 
     if advanced_filters.get("pendidikan_ibu"):
-        must.append({"terms": {"Pendidikan Ibu": advanced_filters["pendidikan_ibu"]}})
+        clauses.append({"terms": {"Pendidikan Ibu": advanced_filters["pendidikan_ibu"]}})
 
-    if advanced_filters.get("asi_eksklusif") != "Semua":
-        val = (["Ya", "ya", "True", "true", "1"] if advanced_filters["asi_eksklusif"] == "Ya"
+    asi = advanced_filters.get("asi_eksklusif") or "Semua"
+    if asi != "Semua":
+        val = (["Ya", "ya", "True", "true", "1"] if asi == "Ya"
                else ["Tidak", "tidak", "False", "false", "0"])
-        must.append({"bool": {"should": [
+        clauses.append({"bool": {"should": [
             {"terms": {"ASI Eksklusif": val}},
             {"terms": {"ASI Eksklusif (ya/tidak)": val}},
         ], "minimum_should_match": 1}})
 
-    if advanced_filters.get("akses_air") != "Semua":
-        val = (["Layak", "Ada", "Ya", "Bersih", "Aman"] if advanced_filters["akses_air"] == "Ada"
+    air = advanced_filters.get("akses_air") or "Semua"
+    if air != "Semua":
+        val = (["Layak", "Ada", "Ya", "Bersih", "Aman"] if air == "Ada"
                else ["Tidak Layak", "Tidak", "Tidak Ada"])
-        must.append({"bool": {"should": [
+        clauses.append({"bool": {"should": [
             {"terms": {"Akses Air": val}},
             {"terms": {"Akses Air Bersih": val}},
         ], "minimum_should_match": 1}})
 
-    return body
+    return clauses
 
 
-def get_explorer_data(filters: dict, advanced_filters: dict, size: int = 1000) -> pd.DataFrame:
-    body = build_query(filters)
-    body = _apply_advanced_filters_to_query(body, advanced_filters)
+def _apply_advanced_filters_to_query(body: dict, advanced_filters: dict) -> dict:
+    clauses = _advanced_filter_clauses(advanced_filters)
+    if not clauses:
+        return body
 
-    source_fields = [
-        "Tanggal",
-        "nama_kabupaten_kota",
-        "Kecamatan",
-        "Status Stunting (Biner)",
-        "Z-Score TB/U",
-        "Usia Anak (bulan)",
-        "Berat Lahir (gram)",
-        "ASI Eksklusif",
-        "Status Imunisasi Anak",
-        "Pendidikan Ibu",
-        "Akses Air Bersih",
-    ]
+    if "match_all" in body["query"]:
+        body["query"] = {"bool": {"must": []}}
+
+    body["query"]["bool"].setdefault("must", []).extend(clauses)
+    return body
 
-    body["_source"] = source_fields
-    body["size"] = size
-    body["sort"] = [{"Z-Score TB/U": "asc"}]
 
+def get_unique_field_values(filters: dict, field: str, size: int = 50) -> List[str]:
+    """Opsi unik sebuah field (terms agg) sesuai filter utama, terurut."""
+    body = build_query(filters)
+    body.update({"size": 0, "aggs": {"opts": {"terms": {"field": field, "size": size}}}})
     data = _es_post(STUNTING_INDEX, "/_search", body)
+    buckets = data.get("aggregations", {}).get("opts", {}).get("buckets", [])
+    return sorted(str(b["key"]) for b in buckets)
+
+
+EXPLORER_FIELDS = [
+    "Tanggal",
+    "nama_kabupaten_kota",
+    "Kecamatan",
+    "Status Stunting (Biner)",
+    "Z-Score TB/U",
+    "Usia Anak (bulan)",
+    "Berat Lahir (gram)",
+    "ASI Eksklusif",
+    "Status Imunisasi Anak",
+    "Pendidikan Ibu",
+    "Akses Air Bersih",
+]
+
+EXPLORER_RENAME = {
+    "nama_kabupaten_kota": "Kabupaten/Kota",
+    "Status Stunting (Biner)": "Status Stunting",
+    "Z-Score TB/U": "Z-Score",
+    "Status Imunisasi Anak": "Imunisasi",
+}
+
+# Urutan paling berisiko dulu; _shard_doc = tiebreaker unik & murah selama memakai PIT
+EXPLORER_PIT_SORT = [
+    {"Z-Score TB/U": {"order": "asc", "missing": "_last"}},
+    {"_shard_doc": "asc"},
+]
+
+
+def get_explorer_page(
+    filters: dict,
+    advanced_filters: dict,
+    pit_id: str,
+    search_after: Optional[List[Any]] = None,
+    size: int = 50,
+    keep_alive: str = "5m",
+    track_total_hits: bool = False,
+) -> Dict[str, Any]:
+    """Satu halaman explorer via PIT + search_after (urut Z-Score naik).
+    Return dict: df, search_after (cursor halaman berikutnya / None), pit_id (bisa diperbarui ES),
+    total (hanya jika track_total_hits).
+    """
+    body = build_query(filters)
+    body = _apply_advanced_filters_to_query(body, advanced_filters)
+    body.update({
+        "_source": EXPLORER_FIELDS,
+        "size": size,
+        "sort": EXPLORER_PIT_SORT,
+        "pit": {"id": pit_id, "keep_alive": keep_alive},
+        "track_total_hits": track_total_hits,
+    })
+    if search_after is not None:
+        body["search_after"] = search_after
+
+    data = _es_post("", "/_search", body)
     hits = data.get("hits", {}).get("hits", [])
     df = pd.DataFrame([h.get("_source", {}) for h in hits])
-
     if not df.empty:
-        df = df.rename(columns={
-            "nama_kabupaten_kota": "Kabupaten/Kota",
-            "Status Stunting (Biner)": "Status Stunting",
-            "Z-Score TB/U": "Z-Score",
-            "Status Imunisasi Anak": "Imunisasi",
-        })
-    return df
+        df = df.rename(columns=EXPLORER_RENAME)
+
+    return {
+        "df": df,
+        "search_after": hits[-1].get("sort") if len(hits) == size else None,
+        "pit_id": data.get("pit_id", pit_id),
+        "total": data.get("hits", {}).get("total", {}).get("value") if track_total_hits else None,
+    }
+
+
+# Profil data terfilter untuk ringkasan AI explorer (dihitung atas seluruh hit, bukan halaman aktif)
+EXPLORER_PROFILE_AGGS: Dict[str, Any] = {
+    "zscore": {"extended_stats": {"field": "Z-Score TB/U"}},
+    "zscore_pct": {"percentiles": {"field": "Z-Score TB/U", "percents": [25, 50, 75]}},
+    "pendidikan": {"terms": {"field": "Pendidikan Ibu", "size": 20}},
+    "asi": {"terms": {"field": "ASI Eksklusif", "size": 10}},
+    "air": {"terms": {"field": "Akses Air Bersih", "size": 10}},
+    "avg_usia": {"avg": {"field": "Usia Anak (bulan)"}},
+    "avg_bmi": {"avg": {"field": "BMI Pra-Hamil"}},
+}
+
+
+def _explorer_profile(aggs: Dict[str, Any]) -> Dict[str, Any]:
+    def shares(name: str) -> Dict[str, float]:
+        buckets = aggs.get(name, {}).get("buckets", [])
+        n = sum(b["doc_count"] for b in buckets)
+        return {str(b["key"]): round(100.0 * b["doc_count"] / n, 2) for b in buckets} if n else {}
+
+    z = aggs.get("zscore", {})
+    pct = aggs.get("zscore_pct", {}).get("values", {})
+    return {
+        "n": int(aggs.get("doc_count", 0)),
+        "zscore": {
+            "count": z.get("count", 0),
+            "mean": z.get("avg"),
+            "std": z.get("std_deviation"),
+            "min": z.get("min"),
+            "25%": pct.get("25.0"),
+            "50%": pct.get("50.0"),
+            "75%": pct.get("75.0"),
+            "max": z.get("max"),
+        },
+        "pendidikan_ibu": shares("pendidikan"),
+        "asi_eksklusif": shares("asi"),
+        "akses_air": shares("air"),
+        "avg_usia": aggs.get("avg_usia", {}).get("value"),
+        "avg_bmi": aggs.get("avg_bmi", {}).get("value"),
+    }
 
 
-def get_top_counts_for_explorer_chart(filters: dict, advanced_filters: dict) -> pd.DataFrame:
-    """Chart berjenjang 5 besar; jika ada filters['wilayah'] -> agregasi kecamatan, else kabupaten."""
+def get_explorer_bundle(filters: dict, advanced_filters: dict, size: int = 1000, top_n: int = 5) -> Dict[str, Any]:
+    """Semua kebutuhan halaman explorer dalam SATU request _search:
+    - rows: hits teratas (urut Z-Score naik), filter utama + lanjutan
+    - top_counts: top-N kabupaten (atau kecamatan jika ada filters['wilayah']), filter utama + lanjutan
+    - options: opsi filter lanjutan (Pendidikan Ibu) — hanya filter utama, agar pilihan tidak "mengunci" dirinya
+    - total: jumlah hit setelah filter lanjutan
+    - profile: statistik seluruh data terfilter (bahan ringkasan AI), bukan hanya baris yang tampil
+    Filter lanjutan dipasang sebagai post_filter (untuk hits) dan filter agg (untuk chart & profile).
+    """
     if filters.get("wilayah"):
         agg_field, level_label = "Kecamatan", "Kecamatan"
     else:
         agg_field, level_label = "nama_kabupaten_kota", "Kabupaten/Kota"
 
+    advanced = _advanced_filter_clauses(advanced_filters)
+    advanced_query = {"bool": {"filter": advanced}} if advanced else {"match_all": {}}
+
     body = build_query(filters)
-    body = _apply_advanced_filters_to_query(body, advanced_filters)
-    body["size"] = 0
-    body["aggs"] = {"counts_by_region": {"terms": {"field": agg_field, "size": 5}}}
+    body.update({
+        "size": size,
+        "_source": EXPLORER_FIELDS,
+        "sort": [{"Z-Score TB/U": "asc"}],
+        "track_total_hits": True,
+        "post_filter": advanced_query,
+        "aggs": {
+            "advanced": {
+                "filter": advanced_query,
+                "aggs": {
+                    "counts_by_region": {"terms": {"field": agg_field, "size": top_n}},
+                    **EXPLORER_PROFILE_AGGS,
+                },
+            },
+            "pendidikan_opts": {"terms": {"field": "Pendidikan Ibu", "size": 50}},
+        },
+    })
 
     data = _es_post(STUNTING_INDEX, "/_search", body)
-    buckets = data.get("aggregations", {}).get("counts_by_region", {}).get("buckets", [])
+    hits = data.get("hits", {}).get("hits", [])
+    aggs = data.get("aggregations", {})
+
+    rows = pd.DataFrame([h.get("_source", {}) for h in hits])
+    if not rows.empty:
+        rows = rows.rename(columns=EXPLORER_RENAME)
 
-    if not buckets:
-        return pd.DataFrame(columns=[level_label, "Jumlah Data"])
+    buckets = aggs.get("advanced", {}).get("counts_by_region", {}).get("buckets", [])
+    top_counts = pd.DataFrame(
+        [{level_label: b["key"], "Jumlah Data": b["doc_count"]} for b in buckets],
+        columns=[level_label, "Jumlah Data"],
+    )
 
-    df = pd.DataFrame(buckets).rename(columns={"key": level_label, "doc_count": "Jumlah Data"})
-    return df
+    return {
+        "rows": rows,
+        "top_counts": top_counts,
+        "profile": _explorer_profile(aggs.get("advanced", {})),
+        "options": {
+            "pendidikan_ibu": sorted(str(b["key"]) for b in aggs.get("pendidikan_opts", {}).get("buckets", [])),
+        },
+        "total": data.get("hits", {}).get("total", {}).get("value", 0),
+    }
 
 
 # ------------------- Ekspor data explorer -------------------
 
-def get_explorer_data_for_export(filters: dict, advanced_filters: dict, size: int = 5000) -> pd.DataFrame:
+EXPORT_FIELDS = [
+    "Tanggal",
+    "nama_kabupaten_kota",
+    "Kecamatan",
+    "Status Stunting (Biner)",
+    "Z-Score TB/U",
+    "Probabilitas Stunting (simulasi)",
+    "Usia Anak (bulan)",
+    "Berat Lahir (gram)",
+    "ASI Eksklusif",
+    "Status Imunisasi Anak",
+    "Pendidikan Ibu",
+    "Akses Air Bersih",
+    "Kepesertaan Program Bantuan",
+    "Upah Keluarga (Rp/bulan)",
+    "Jumlah Anak",
+    "Tinggi Badan Ibu (cm)",
+    "BMI Pra-Hamil",
+    "Hb (g/dL)",
+    "LiLA saat Hamil (cm)",
+    "Kunjungan ANC (x)",
+    "Paparan Asap Rokok",
+    "Jenis Pekerjaan Orang Tua",
+]
+
+
+def count_explorer_data(filters: dict, advanced_filters: dict) -> int:
     body = build_query(filters)
     body = _apply_advanced_filters_to_query(body, advanced_filters)
-    source_fields = [
-        "Tanggal",
-        "nama_kabupaten_kota",
-        "Kecamatan",
-        "Status Stunting (Biner)",
-        "Z-Score TB/U",
-        "Probabilitas Stunting (simulasi)",
-        "Usia Anak (bulan)",
-        "Berat Lahir (gram)",
-        "ASI Eksklusif",
-        "Status Imunisasi Anak",
-        "Pendidikan Ibu",
-        "Akses Air Bersih",
-        "Kepesertaan Program Bantuan",
-        "Upah Keluarga (Rp/bulan)",
-        "Jumlah Anak",
-        "Tinggi Badan Ibu (cm)",
-        "BMI Pra-Hamil",
-        "Hb (g/dL)",
-        "LiLA saat Hamil (cm)",
-        "Kunjungan ANC (x)",
-        "Paparan Asap Rokok",
-        "Jenis Pekerjaan Orang Tua",
-    ]
-    body["_source"] = source_fields
-    body["size"] = size
-    body["sort"] = [{"Z-Score TB/U": "asc"}]
+    data = _es_post(STUNTING_INDEX, "/_count", {"query": body["query"]})
+    return int(data.get("count", 0))
 
-    data = _es_post(STUNTING_INDEX, "/_search", body)
-    hits = data.get("hits", {}).get("hits", [])
-    return pd.DataFrame([h.get("_source", {}) for h in hits])
+
+def iter_explorer_export(filters: dict, advanced_filters: dict, batch_size: int = 2000):
+    """Alirkan SELURUH data explorer terfilter per chunk DataFrame (kolom tetap = EXPORT_FIELDS)."""
+    body = build_query(filters)
+    body = _apply_advanced_filters_to_query(body, advanced_filters)
+    body["_source"] = EXPORT_FIELDS
+    body["sort"] = [{"Z-Score TB/U": {"order": "asc", "missing": "_last"}}]
+    for hits in iter_pit_pages(body, batch_size=batch_size):
+        yield pd.DataFrame([h.get("_source", {}) for h in hits]).reindex(columns=EXPORT_FIELDS)
 
 
-# ------------------- Risk Map (kabupaten & kecamatan) -------------------
+# ------------------- Risk Map (kabupaten / kecamatan / desa) -------------------
+
+RISK_MAP_LEVELS: Dict[str, List[Tuple[str, str]]] = {
+    "kabupaten": [("kabupaten", "nama_kabupaten_kota")],
+    "kecamatan": [("kabupaten", "nama_kabupaten_kota"), ("kecamatan", "Kecamatan")],
+    "desa": [("kabupaten", "nama_kabupaten_kota"), ("kecamatan", "Kecamatan"), ("desa", DESA_FIELD)],
+}
+
+
+def _grow(arr: np.ndarray, capacity: int) -> np.ndarray:
+    out = np.empty(capacity, dtype=arr.dtype) if arr.dtype == object else np.zeros(capacity, dtype=arr.dtype)
+    out[: len(arr)] = arr
+    return out
+
+
+def get_risk_map_data(filters: dict, level: str = "kecamatan", page_size: int = 2000) -> pd.DataFrame:
+    """Agregasi total anak & kasus stunting untuk peta risiko.
+    Memakai composite aggregation yang dipaginasi (after_key), sehingga tidak ada batas jumlah bucket
+    dan beban memori cluster per request tetap kecil.
+    - level="kabupaten": satu baris per kabupaten/kota (tampilan provinsi).
+    - level="kecamatan": satu baris per (kabupaten, kecamatan).
+    - level="desa": satu baris per (kabupaten, kecamatan, desa) — field dari env DESA_FIELD.
+    Halaman dialirkan ke array kolom yang dialokasikan di depan (estimasi cardinality), lalu dibungkus DataFrame.
+    """
+    levels = RISK_MAP_LEVELS.get(level)
+    if not levels:
+        raise ValueError(f"Level peta tidak dikenal: {level}")
 
-def get_risk_map_data(filters: dict) -> pd.DataFrame:
     body = build_query(filters)
-    body["size"] = 0
-    body["aggs"] = {
-        "by_kab": {
-            "terms": {"field": "nama_kabupaten_kota", "size": 100},
-            "aggs": {
-                "by_kec": {
-                    "terms": {"field": "Kecamatan", "size": 5000},
-                    "aggs": {"stunting_count": {"filter": _stunting_any_filter()}}
-                }
-            }
-        }
+    sources = [{col: {"terms": {"field": field}}} for col, field in levels]
+    sub_aggs = {"stunting_count": {"filter": stunting_any_filter()}}
+    # Estimasi jumlah baris dari field terdalam (nama kecamatan/desa bisa berulang antar wilayah -> batas bawah)
+    first_page_aggs = {"est_rows": {"cardinality": {"field": levels[-1][1]}}}
+
+    capacity, n = 0, 0
+    keys: Dict[str, np.ndarray] = {}
+    total = stunting = np.zeros(0, dtype=np.int64)
+
+    for buckets, aggs in iter_composite_pages(
+        STUNTING_INDEX, body, sources, sub_aggs, page_size=page_size, first_page_aggs=first_page_aggs
+    ):
+        if capacity == 0:
+            est = int(aggs.get("est_rows", {}).get("value") or 0)
+            capacity = max(len(buckets), int(est * 1.1))
+            keys = {col: np.empty(capacity, dtype=object) for col, _ in levels}
+            total = np.zeros(capacity, dtype=np.int64)
+            stunting = np.zeros(capacity, dtype=np.int64)
+        if n + len(buckets) > capacity:
+            capacity = max(capacity * 2, n + len(buckets))
+            keys = {col: _grow(arr, capacity) for col, arr in keys.items()}
+            total = _grow(total, capacity)
+            stunting = _grow(stunting, capacity)
+
+        for i, b in enumerate(buckets, start=n):
+            for col, _ in levels:
+                keys[col][i] = b["key"][col]
+            total[i] = b["doc_count"]
+            stunting[i] = b["stunting_count"]["doc_count"]
+        n += len(buckets)
+
+    columns = [col for col, _ in levels] + ["total_anak", "jumlah_stunting"]
+    if n == 0:
+        return pd.DataFrame(columns=columns)
+
+    data = {col: arr[:n] for col, arr in keys.items()}
+    data["total_anak"] = total[:n]
+    data["jumlah_stunting"] = stunting[:n]
+    return pd.DataFrame(data, columns=columns)
+
+
+# ------------------- Matriks tren kecamatan x bulan -------------------
+def get_kecamatan_month_matrix(filters: dict, page_size: int = 2000) -> Dict[str, Any]:
+    """Total & kasus stunting per (kabupaten, kecamatan) x bulan dari SATU composite aggregation
+    (terms + date_histogram, dipaginasi via after_key) — bukan satu query tren per kecamatan.
+    Return dict:
+      - kabupaten, kecamatan: array object (baris)
+      - months: DatetimeIndex bulanan kontinu (kolom; bulan tanpa data = 0)
+      - total, stunting: array int64 padat berukuran (n_kecamatan, n_bulan)
+      - prob_sum (float64), prob_count (int64): jumlah & banyaknya RISK_PROB_FIELD per sel,
+        agar rerata probabilitas bisa dijumlahkan ke level kabupaten/provinsi
+    """
+    body = build_query(filters)
+    sources = [
+        {"kabupaten": {"terms": {"field": "nama_kabupaten_kota"}}},
+        {"kecamatan": {"terms": {"field": "Kecamatan"}}},
+        {"bulan": {"date_histogram": {"field": "Tanggal", "calendar_interval": "month"}}},
+    ]
+    sub_aggs = {
+        "stunting_count": {"filter": stunting_any_filter()},
+        "prob": {"stats": {"field": RISK_PROB_FIELD}},
     }
 
-    data = _es_post(STUNTING_INDEX, "/_search", body)
-
-    rows: List[Dict[str, Any]] = []
-    kab_buckets = data.get("aggregations", {}).get("by_kab", {}).get("buckets", [])
-    for kab_b in kab_buckets:
-        kab_name = kab_b["key"]
-        for kec_b in kab_b.get("by_kec", {}).get("buckets", []):
-            rows.append({
-                "kabupaten": kab_name,
-                "kecamatan": kec_b["key"],
-                "total_anak": kec_b["doc_count"],
-                "jumlah_stunting": kec_b["stunting_count"]["doc_count"],
-            })
+    keys: List[np.ndarray] = []
+    months: List[np.ndarray] = []
+    totals: List[np.ndarray] = []
+    stuntings: List[np.ndarray] = []
+    prob_sums: List[np.ndarray] = []
+    prob_counts: List[np.ndarray] = []
+    for buckets, _ in iter_composite_pages(STUNTING_INDEX, body, sources, sub_aggs, page_size=page_size):
+        keys.append(np.array([(b["key"]["kabupaten"], b["key"]["kecamatan"]) for b in buckets], dtype=object))
+        months.append(np.array([b["key"]["bulan"] for b in buckets], dtype="datetime64[ms]"))
+        totals.append(np.array([b["doc_count"] for b in buckets], dtype=np.int64))
+        stuntings.append(np.array([b["stunting_count"]["doc_count"] for b in buckets], dtype=np.int64))
+        prob_sums.append(np.array([b["prob"].get("sum") or 0.0 for b in buckets], dtype=float))
+        prob_counts.append(np.array([b["prob"].get("count") or 0 for b in buckets], dtype=np.int64))
+
+    if not keys:
+        empty = np.zeros((0, 0), dtype=np.int64)
+        return {"kabupaten": np.empty(0, dtype=object), "kecamatan": np.empty(0, dtype=object),
+                "months": pd.DatetimeIndex([]), "total": empty, "stunting": empty.copy(),
+                "prob_sum": np.zeros((0, 0)), "prob_count": empty.copy()}
+
+    pairs = np.concatenate(keys)
+    month_idx = np.concatenate(months).astype("datetime64[M]")
+    labels = np.array([f"{kab}\x1f{kec}" for kab, kec in pairs], dtype=object)
+    uniq, row = np.unique(labels, return_index=False, return_inverse=True)
+    first = month_idx.min()
+    col = (month_idx - first).astype(np.int64)
+    n_months = int(col.max()) + 1
+
+    total = np.zeros((len(uniq), n_months), dtype=np.int64)
+    stunting = np.zeros_like(total)
+    np.add.at(total, (row, col), np.concatenate(totals))
+    np.add.at(stunting, (row, col), np.concatenate(stuntings))
+    prob_sum = np.zeros(total.shape)
+    prob_count = np.zeros_like(total)
+    np.add.at(prob_sum, (row, col), np.concatenate(prob_sums))
+    np.add.at(prob_count, (row, col), np.concatenate(prob_counts))
+
+    split = np.array([u.split("\x1f", 1) for u in uniq], dtype=object)
+    return {
+        "kabupaten": split[:, 0],
+        "kecamatan": split[:, 1],
+        "months": pd.date_range(pd.Timestamp(first), periods=n_months, freq="MS"),
+        "total": total,
+        "stunting": stunting,
+        "prob_sum": prob_sum,
+        "prob_count": prob_count,
+    }
 
-    return pd.DataFrame(rows)
@@ -0,0 +1,203 @@
+# StuntLytics/src/entity_index.py
+# Indeks alias kabupaten/kota & kecamatan untuk deteksi entitas di pesan chat (InsightNow).
+# - Kamus alias dibangun SEKALI per versi data (satu composite aggregation kabupaten x kecamatan),
+#   dibangun malas saat pesan pertama — halaman tidak memanggil ES sebelum pengguna mengetik
+# - Deteksi memakai automaton Aho-Corasick atas alias ternormalisasi + batas kata:
+#   O(panjang pesan + jumlah kecocokan), bukan scan linear semua alias
+# - Kecocokan yang tumpang tindih diselesaikan leftmost-longest ("kota bandung" > "bandung");
+#   alias kabupaten/kota di dalam nama kecamatan ("bandung" di "bandung wetan") tidak dihitung
+
+import re
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from . import elastic_client as es
+
+VERSION_CHECK_SECONDS = 300  # seberapa sering versi data dicek ulang (hanya saat ada pesan)
+_PREFIXES = ("kab ", "kota ")
+
+
+def normalize(s: str) -> str:
+    s = (s or "").lower().strip()
+    s = re.sub(r"[^a-z0-9\s]", " ", s)
+    s = re.sub(r"\s+", " ", s)
+    repl = {"kabupaten ": "kab ", "kab. ": "kab ", "kota ": "kota ", "kab ": "kab "}
+    for k, v in repl.items():
+        s = s.replace(k, v)
+    return s
+
+
+class AhoCorasick:
+    """Automaton multi-pola atas alias ternormalisasi -> daftar nama resmi."""
+
+    def __init__(self, aliases: Dict[str, List[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[str]] = [[]]  # alias yang berakhir di state ini
+        self.aliases = aliases
+        for alias in aliases:
+            self._add(alias)
+        self._build()
+
+    def _add(self, pattern: str):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append(pattern)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                cand = self._goto[f].get(ch, 0)
+                self._fail[nxt] = cand if cand != nxt else 0
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """Semua kecocokan (start, end_exclusive, alias) yang dibatasi spasi/awal/akhir teks."""
+        hits = []
+        state = 0
+        n = len(text)
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for alias in self._out[state]:
+                start = i - len(alias) + 1
+                if (start == 0 or text[start - 1] == " ") and (i + 1 == n or text[i + 1] == " "):
+                    hits.append((start, i + 1, alias))
+        return hits
+
+    def spans(self, text: str) -> List[Tuple[int, int, str]]:
+        """Kecocokan leftmost-longest tanpa tumpang tindih atas teks yang SUDAH dinormalisasi, urut kemunculan."""
+        hits = sorted(self.find(text), key=lambda h: (h[0], -(h[1] - h[0])))
+        kept, end = [], -1
+        for start, stop, alias in hits:
+            if start < end:
+                continue
+            end = stop
+            kept.append((start, stop, alias))
+        return kept
+
+    def names(self, spans: Iterable[Tuple[int, int, str]]) -> List[str]:
+        """Nama resmi (unik, urut kemunculan) dari hasil spans()."""
+        names, seen = [], set()
+        for _, _, alias in spans:
+            for name in self.aliases[alias]:
+                if name not in seen:
+                    seen.add(name)
+                    names.append(name)
+        return names
+
+    def match(self, text: str) -> List[str]:
+        """Nama resmi dari kecocokan leftmost-longest tanpa tumpang tindih, urut kemunculan."""
+        return self.names(self.spans(normalize(text)))
+
+
+def _alias_map(names: Iterable[str], strip_prefix: bool = False) -> Dict[str, List[str]]:
+    aliases: Dict[str, List[str]] = {}
+    for name in names:
+        if not isinstance(name, str) or not name.strip():
+            continue
+        keys = {normalize(name)}
+        if strip_prefix:
+            for p in _PREFIXES:
+                if normalize(name).startswith(p):
+                    keys.add(normalize(name)[len(p):])  # "Bandung" -> Kab. & Kota Bandung
+        for key in keys:
+            if key and name not in aliases.setdefault(key, []):
+                aliases[key].append(name)
+    return aliases
+
+
+class EntityIndex:
+    def __init__(self, kec_to_wil: Dict[str, Set[str]], wilayah_names: Iterable[str], version: str):
+        self.version = version
+        self.kec_to_wil = kec_to_wil
+        self.wilayah = AhoCorasick(_alias_map(wilayah_names, strip_prefix=True))
+        self.kecamatan = AhoCorasick(_alias_map(kec_to_wil))
+
+    def detect_wilayah(self, text: str, max_matches: int = 3) -> List[str]:
+        """Kabupaten/kota di teks. Alias yang berada di dalam nama kecamatan yang lebih panjang diabaikan:
+        "kec Bandung Wetan" menyebut kecamatan, bukan Kab./Kota Bandung."""
+        norm = normalize(text)
+        kec = self.kecamatan.spans(norm)
+        wil = [
+            (start, stop, alias) for start, stop, alias in self.wilayah.spans(norm)
+            if not any(ks <= start and stop <= ke and ke - ks > stop - start for ks, ke, _ in kec)
+        ]
+        return self.wilayah.names(wil)[:max_matches]
+
+    def detect_kecamatan(self, text: str, max_matches: int = 5, within: Optional[List[str]] = None) -> List[str]:
+        """Kecamatan di teks; jika `within` (kabupaten filter aktif) diisi, hanya yang berada di sana."""
+        found = self.kecamatan.match(text)
+        if within:
+            allowed = set(within)
+            found = [k for k in found if self.kec_to_wil.get(k, set()) & allowed]
+        return found[:max_matches]
+
+    def wilayah_for(self, kecamatan: List[str], within: Optional[List[str]] = None) -> List[str]:
+        wil = set().union(*(self.kec_to_wil.get(k, set()) for k in kecamatan)) if kecamatan else set()
+        if within:
+            wil &= set(within)
+        return sorted(wil)
+
+
+def data_version() -> str:
+    """Versi data murah: jumlah dokumen + tanggal terakhir index stunting."""
+    body = {"size": 0, "track_total_hits": True, "aggs": {"last": {"max": {"field": "Tanggal"}}}}
+    data = es.search(body)
+    total = data.get("hits", {}).get("total", {})
+    total = total.get("value") if isinstance(total, dict) else total
+    return f"{total}:{data.get('aggregations', {}).get('last', {}).get('value')}"
+
+
+def build_entity_index(version: str = "") -> EntityIndex:
+    """Satu composite aggregation (kabupaten, kecamatan) -> peta kecamatan -> {kabupaten} + daftar kabupaten."""
+    sources = [
+        {"wil": {"terms": {"field": "nama_kabupaten_kota"}}},
+        {"kec": {"terms": {"field": "Kecamatan", "missing_bucket": True}}},
+    ]
+    kec_to_wil: Dict[str, Set[str]] = {}
+    wilayah: Set[str] = set()
+    for buckets, _ in es.iter_composite_pages(es.STUNTING_INDEX, {"query": {"match_all": {}}}, sources, page_size=5000):
+        for b in buckets:
+            wil, kec = b["key"]["wil"], b["key"]["kec"]
+            wilayah.add(wil)
+            if kec:
+                kec_to_wil.setdefault(kec, set()).add(wil)
+    if not wilayah:
+        wilayah = set(es.get_unique_field_values({}, "Wilayah", size=500))
+    return EntityIndex(kec_to_wil, sorted(wilayah), version)
+
+
+_LOCK = threading.Lock()
+_STATE: Dict[str, object] = {"index": None, "checked_at": 0.0}
+
+
+def get_entity_index() -> EntityIndex:
+    """Indeks entitas ter-cache per versi data; versi dicek paling sering tiap VERSION_CHECK_SECONDS."""
+    with _LOCK:
+        index: Optional[EntityIndex] = _STATE["index"]  # type: ignore[assignment]
+        if index is not None and time.time() - _STATE["checked_at"] < VERSION_CHECK_SECONDS:
+            return index
+        version = data_version()
+        if index is None or index.version != version:
+            index = build_entity_index(version)
+            _STATE["index"] = index
+        _STATE["checked_at"] = time.time()
+        return index
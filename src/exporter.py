@@ -0,0 +1,195 @@
+# StuntLytics/src/exporter.py
+# Ekspor streaming: chunk DataFrame -> file sementara di disk (CSV / JSON Lines / Parquet, opsional gzip).
+# Memori tetap datar berapapun jumlah barisnya karena hanya satu chunk yang dipegang sekaligus.
+
+import gzip
+import io
+import os
+import tempfile
+import time
+import pandas as pd
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:  # pyarrow opsional; format Parquet dinonaktifkan jika tidak terpasang
+    pa = None
+    pq = None
+
+EXPORT_PREFIX = "stuntlytics_export_"
+EXPORT_MAX_AGE_HOURS = float(os.getenv("EXPORT_MAX_AGE_HOURS", "6"))
+
+# nama format -> (ekstensi, mime)
+EXPORT_FORMATS: Dict[str, tuple] = {
+    "CSV": (".csv", "text/csv"),
+    "JSON Lines": (".jsonl", "application/x-ndjson"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+
+
+def available_formats() -> list:
+    return [f for f in EXPORT_FORMATS if f != "Parquet" or pq is not None]
+
+
+def _widen(field):
+    # Chunk pertama belum tentu mewakili: integer -> float64 (chunk berikutnya bisa berpecahan / NaN),
+    # null & boolean -> string (chunk berikutnya bisa berisi teks)
+    if pa.types.is_integer(field.type) or pa.types.is_floating(field.type):
+        return pa.field(field.name, pa.float64())
+    if pa.types.is_null(field.type) or pa.types.is_boolean(field.type):
+        return pa.field(field.name, pa.string())
+    return field
+
+
+def _parquet_schema(df: pd.DataFrame):
+    """Schema dari chunk pertama, dilebarkan agar tetap valid untuk chunk-chunk berikutnya."""
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    return pa.schema([_widen(f) for f in schema])
+
+
+def _conform(df: pd.DataFrame, schema) -> pd.DataFrame:
+    """Samakan tipe chunk dengan schema file."""
+    df = df.copy()
+    for f in schema:
+        if pa.types.is_string(f.type):
+            df[f.name] = df[f.name].astype("string")
+        elif pa.types.is_floating(f.type):
+            df[f.name] = pd.to_numeric(df[f.name], errors="coerce").astype("float64")
+    return df
+
+
+def stream_export(
+    chunks: Iterable[pd.DataFrame],
+    fmt: str = "CSV",
+    compress: bool = False,
+    total: Optional[int] = None,
+    progress: Optional[Callable[[int, Optional[int], float], Any]] = None,
+) -> Dict[str, Any]:
+    """Tulis chunk ke file sementara; progress(rows, total, rows_per_sec) dipanggil tiap chunk.
+
+    Return dict: path, file_name, mime, rows, seconds, rows_per_sec, bytes.
+    File sementara menjadi tanggung jawab pemanggil (hapus via discard_export); bila gagal di
+    tengah jalan, file dihapus di sini. File ekspor lama yang terbengkalai ikut dibersihkan.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Format ekspor tidak dikenal: {fmt}")
+    if fmt == "Parquet" and pq is None:
+        raise RuntimeError("Format Parquet membutuhkan paket 'pyarrow'.")
+
+    ext, mime = EXPORT_FORMATS[fmt]
+    # Parquet memakai kompresi internal (gzip codec) -> ekstensi tetap .parquet
+    if compress and fmt != "Parquet":
+        ext, mime = ext + ".gz", "application/gzip"
+
+    purge_stale()
+    tmp = tempfile.NamedTemporaryFile(prefix=EXPORT_PREFIX, suffix=ext, delete=False)
+    raw = tmp.file
+    stream = gzip.GzipFile(fileobj=raw, mode="wb") if compress and fmt != "Parquet" else raw
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="") if fmt != "Parquet" else None
+
+    started = time.perf_counter()
+    rows = 0
+    writer = None
+    schema = None
+    try:
+        for df in chunks:
+            if df.empty:
+                continue
+            if fmt == "CSV":
+                df.to_csv(text, header=(rows == 0), index=False)
+            elif fmt == "JSON Lines":
+                lines = df.to_json(orient="records", lines=True, force_ascii=False, date_format="iso")
+                text.write(lines if lines.endswith("\n") else lines + "\n")
+            else:
+                if writer is None:
+                    schema = _parquet_schema(df)
+                    writer = pq.ParquetWriter(
+                        raw, schema, compression="gzip" if compress else "snappy"
+                    )
+                writer.write_table(pa.Table.from_pandas(_conform(df, schema), schema=schema, preserve_index=False))
+
+            rows += len(df)
+            if progress is not None:
+                elapsed = max(time.perf_counter() - started, 1e-9)
+                progress(rows, total, rows / elapsed)
+    except BaseException:
+        _close_quietly(writer, text, stream, raw)
+        _remove(tmp.name)
+        raise
+    else:
+        if writer is not None:
+            writer.close()
+        if text is not None:
+            text.flush()
+            text.detach()
+        if stream is not raw:
+            stream.close()  # tulis trailer gzip; tidak menutup file dasar
+        raw.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "path": tmp.name,
+        "file_name": os.path.basename(tmp.name),
+        "mime": mime,
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds if seconds > 0 else 0.0,
+        "bytes": os.path.getsize(tmp.name),
+    }
+
+
+def _close_quietly(*handles):
+    for h in handles:
+        if h is None:
+            continue
+        try:
+            h.close()
+        except Exception:
+            pass
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def exists(export: Optional[Dict[str, Any]]) -> bool:
+    return bool(export) and os.path.exists(export["path"])
+
+
+def consume_export(export: Dict[str, Any]) -> BinaryIO:
+    """File ekspor yang dibuka untuk diunduh (sekali unduh); isinya dibaca dari handle, tidak disalin ke memori di sini.
+    Dipanggil on-demand (data callable st.download_button), bukan di setiap rerun.
+
+    Entri direktori langsung dihapus: di POSIX isi file tetap terbaca lewat handle dan ruang disk
+    dibebaskan begitu handle ditutup. Bila OS menolak menghapus file yang sedang terbuka (Windows),
+    file dibersihkan purge_stale setelah kedaluwarsa.
+    """
+    f = open(export["path"], "rb")
+    _remove(export["path"])
+    return f
+
+
+def discard_export(export: Optional[Dict[str, Any]]):
+    if export:
+        _remove(export["path"])
+
+
+def purge_stale(max_age_hours: float = EXPORT_MAX_AGE_HOURS):
+    """Hapus file ekspor yang tidak pernah diunduh (sesi ditutup / ditinggal)."""
+    cutoff = time.time() - max_age_hours * 3600
+    tmp_dir = tempfile.gettempdir()
+    try:
+        names = [n for n in os.listdir(tmp_dir) if n.startswith(EXPORT_PREFIX)]
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(tmp_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
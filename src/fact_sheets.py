@@ -0,0 +1,96 @@
+# StuntLytics/src/fact_sheets.py
+# Fact sheet per provinsi / kabupaten / kecamatan yang sudah dihitung di muka (jobs.build_fact_sheets).
+# - Disimpan lokal sebagai satu file JSON; dimuat ulang otomatis bila file berubah (mtime)
+# - InsightNow memakai sheet yang relevan (per kunci entitas) alih-alih menjalankan seluruh
+#   summary_for_filters ke ES saat chat — hanya bila filter chat bisa dilayani sheet
+#   (tanpa rentang tanggal / level risiko) dan file belum kedaluwarsa
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+SHEETS_PATH = os.getenv("FACT_SHEETS_PATH", "cache/fact_sheets.json")
+MAX_AGE_HOURS = float(os.getenv("FACT_SHEETS_MAX_AGE_HOURS", "48"))
+TREND_MONTHS = 24
+
+# Bagian sheet (format sama dengan summary_for_filters agar bisa dipadatkan dengan cara yang sama)
+SHEET_SECTIONS = ("indikator_utama", "stat_rerata", "risiko_pct", "percentiles", "trend_bulanan")
+
+_LOCK = threading.Lock()
+_STATE: Dict[str, Any] = {"path": None, "mtime": None, "data": None}
+
+
+def load(path: str = SHEETS_PATH) -> Optional[Dict[str, Any]]:
+    """Isi file fact sheet (di-cache per mtime); None bila belum dibuat / rusak."""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _LOCK:
+        if _STATE["path"] == path and _STATE["mtime"] == mtime:
+            return _STATE["data"]
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        _STATE.update(path=path, mtime=mtime, data=data)
+        return data
+
+
+def save(data: Dict[str, Any], path: str = SHEETS_PATH):
+    """Tulis atomik (file sementara + rename) agar pembaca tidak pernah melihat file setengah jadi."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"), default=str)
+    os.replace(tmp, path)
+
+
+def is_fresh(data: Optional[Dict[str, Any]], max_age_hours: float = MAX_AGE_HOURS) -> bool:
+    return bool(data) and time.time() - float(data.get("generated_at_ts", 0)) <= max_age_hours * 3600
+
+
+def applicable(filters: Dict[str, Any]) -> bool:
+    """Sheet dihitung atas seluruh data per entitas: filter tanggal/level risiko tidak bisa dilayani."""
+    return not any(filters.get(k) for k in ("date_from", "date_to", "risk_level"))
+
+
+def sheets_for(filters: Dict[str, Any], path: str = SHEETS_PATH) -> Optional[List[Dict[str, Any]]]:
+    """Sheet untuk target filter chat (kecamatan > kabupaten > provinsi); None -> pakai query live."""
+    if not applicable(filters):
+        return None
+    data = load(path)
+    if not is_fresh(data):
+        return None
+
+    wilayah = set(filters.get("wilayah") or [])
+    if filters.get("kecamatan"):
+        sheets = []
+        for kec in filters["kecamatan"]:
+            found = [s for s in data.get("kecamatan", {}).get(kec, []) if not wilayah or s["kabupaten"] in wilayah]
+            if not found:
+                return None
+            sheets.extend(found)
+        return sheets
+    if wilayah:
+        sheets = [data.get("kabupaten", {}).get(w) for w in sorted(wilayah)]
+        return None if any(s is None for s in sheets) else sheets
+    return [data["provinsi"]] if data.get("provinsi") else None
+
+
+def build_context(question: str, filters: Dict[str, Any], sheets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """context_json dari sheet (tanpa ES). Satu sheet -> bagian summary biasa; beberapa -> per entitas."""
+    from . import chat_context  # import lokal: chat_context menarik utils.es
+
+    generated = (load() or {}).get("generated_at")
+    if len(sheets) == 1:
+        summary: Dict[str, Any] = {k: sheets[0][k] for k in SHEET_SECTIONS if k in sheets[0]}
+        extra = chat_context.route_extra(question, summary, sheets[0].get("trend_bulanan", []))
+    else:
+        summary = {"fact_sheets": sheets}
+        extra = {}
+    summary["sumber_data"] = {"fact_sheet": generated}
+    return {"filters": filters, "summary": summary, "extra": extra}
@@ -0,0 +1,171 @@
+# StuntLytics/src/llm_cache.py
+# Cache respons LLM persisten (SQLite lokal), dipakai bersama InsightNow, explorer & korelasi/tren.
+# - Kunci: model + hash system prompt + pertanyaan ternormalisasi + fingerprint data konteks
+# - TTL per entri + eviksi berbasis ukuran (entri paling lama tidak diakses dibuang lebih dulu)
+# - Metrik hit rate per call site (stats())
+# - Aman lintas thread & proses (mode WAL); LLM_CACHE=0 mematikan cache
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_responses.sqlite3")
+CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(24 * 3600)))  # detik
+MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "50")) * 1024 * 1024)
+ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+EVICT_EVERY = 50  # cek ukuran tiap N penulisan
+
+_LOCK = threading.Lock()
+_STATE: Dict[str, Any] = {"conn": None, "path": None, "writes": 0}
+_STATS: Dict[str, Dict[str, int]] = {}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    site TEXT NOT NULL,
+    model TEXT NOT NULL,
+    text TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at);
+"""
+
+
+def _conn(path: str = CACHE_PATH) -> sqlite3.Connection:
+    if _STATE["conn"] is None or _STATE["path"] != path:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        _STATE.update(conn=conn, path=path)
+    return _STATE["conn"]
+
+
+def normalize_question(question: str) -> str:
+    q = (question or "").lower()
+    q = re.sub(r"[^\w\s]", " ", q)
+    return re.sub(r"\s+", " ", q).strip()
+
+
+def fingerprint(obj: Any) -> str:
+    """Hash stabil dari data konteks (urutan kunci tidak berpengaruh; tanggal dll. di-str-kan)."""
+    raw = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def make_key(model: str, system_prompt: str, question: str, context: Any) -> str:
+    parts = [
+        model,
+        hashlib.sha256((system_prompt or "").encode("utf-8")).hexdigest(),
+        normalize_question(question),
+        fingerprint(context),
+    ]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def _count(site: str, hit: bool):
+    s = _STATS.setdefault(site, {"hits": 0, "misses": 0})
+    s["hits" if hit else "misses"] += 1
+
+
+def get(key: str, site: str = "default") -> Optional[str]:
+    if not ENABLED:
+        return None
+    now = time.time()
+    with _LOCK:
+        try:
+            conn = _conn()
+            row = conn.execute("SELECT text, expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] < now:
+                conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                conn.commit()
+                row = None
+            if row is not None:
+                conn.execute("UPDATE responses SET accessed_at = ?, hits = hits + 1 WHERE key = ?", (now, key))
+                conn.commit()
+        except sqlite3.Error:
+            row = None
+        _count(site, row is not None)
+        return row[0] if row is not None else None
+
+
+def put(key: str, text: str, site: str = "default", model: str = "", ttl: float = CACHE_TTL):
+    if not ENABLED or not text:
+        return
+    now = time.time()
+    with _LOCK:
+        try:
+            conn = _conn()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, site, model, text, bytes, created_at, expires_at, accessed_at, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (key, site, model, text, len(text.encode("utf-8")), now, now + ttl, now),
+            )
+            conn.commit()
+            _STATE["writes"] += 1
+            if _STATE["writes"] % EVICT_EVERY == 0:
+                _evict(conn, now)
+        except sqlite3.Error:
+            pass
+
+
+def _evict(conn: sqlite3.Connection, now: float):
+    """Buang entri kedaluwarsa, lalu entri paling lama tidak diakses sampai total <= MAX_BYTES."""
+    conn.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+    total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM responses").fetchone()[0]
+    if total > MAX_BYTES:
+        excess = total - MAX_BYTES
+        rows = conn.execute("SELECT key, bytes FROM responses ORDER BY accessed_at").fetchall()
+        drop = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            drop.append((key,))
+            excess -= size
+        conn.executemany("DELETE FROM responses WHERE key = ?", drop)
+    conn.commit()
+
+
+def evict():
+    with _LOCK:
+        _evict(_conn(), time.time())
+
+
+def clear():
+    with _LOCK:
+        conn = _conn()
+        conn.execute("DELETE FROM responses")
+        conn.commit()
+        _STATS.clear()
+
+
+def stats() -> Dict[str, Any]:
+    """Hit rate per call site (proses ini) + jumlah & ukuran entri di disk."""
+    with _LOCK:
+        sites = {
+            site: {**s, "hit_rate": round(s["hits"] / (s["hits"] + s["misses"]), 3) if s["hits"] + s["misses"] else 0.0}
+            for site, s in _STATS.items()
+        }
+        try:
+            entries, size = _conn().execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM responses").fetchone()
+        except sqlite3.Error:
+            entries, size = 0, 0
+    hits = sum(s["hits"] for s in sites.values())
+    total = hits + sum(s["misses"] for s in sites.values())
+    return {
+        "sites": sites,
+        "hits": hits,
+        "misses": total - hits,
+        "hit_rate": round(hits / total, 3) if total else 0.0,
+        "entries": entries,
+        "bytes": size,
+    }
@@ -0,0 +1,189 @@
+# StuntLytics/src/llm_client.py
+# Client LLM bersama untuk semua halaman (InsightNow, explorer, korelasi/tren, prediksi).
+# - SATU instance OpenAI per (api key, base URL) per proses -> pool koneksi HTTP dipakai ulang
+# - Respons di-stream per token: UI bisa langsung menampilkan teks (st.write_stream)
+# - Metrik per call site: time-to-first-token (TTFT) & total waktu generate
+# - OPENAI_BASE_URL bisa diarahkan ke server lokal/stub yang kompatibel OpenAI untuk pengujian
+# - cache=True -> jawaban identik dilayani dari cache SQLite (src.llm_cache) tanpa memanggil API; kunci
+#   dibangun di sini dari model yang benar-benar dipakai + system prompt + pesan + parameter
+# - Semua request lewat src.llm_scheduler (konkurensi, TPM, retry 429, dedup, prioritas)
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from . import llm_cache, llm_scheduler
+
+DEFAULT_MODEL = os.getenv("LLM_MODEL_ID", "gpt-4.1-nano")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+MAX_RETRIES = 0  # retry/backoff ditangani llm_scheduler agar terkoordinasi lintas request
+METRICS_WINDOW = 200  # jumlah panggilan terakhir per call site yang disimpan
+
+_LOCK = threading.Lock()
+_CLIENTS: Dict[tuple, Any] = {}
+_METRICS: Dict[str, Dict[str, Any]] = {}
+
+
+def get_api_key() -> str:
+    """OPENAI_API_KEY dari env, lalu st.secrets (bila dijalankan di Streamlit)."""
+    env_key = os.getenv("OPENAI_API_KEY", "")
+    if env_key:
+        return env_key
+    try:
+        import streamlit as st
+
+        return st.secrets.get("OPENAI_API_KEY", "")
+    except Exception:
+        return ""
+
+
+def get_client(api_key: Optional[str] = None, base_url: Optional[str] = None):
+    """Client OpenAI bersama (thread-safe; httpx pool di dalamnya dipakai ulang antar panggilan)."""
+    api_key = api_key or get_api_key()
+    base_url = base_url or OPENAI_BASE_URL
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY belum diatur (env/secrets).")
+    key = (api_key, base_url)
+    with _LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            import openai
+
+            client = openai.OpenAI(api_key=api_key, base_url=base_url, max_retries=MAX_RETRIES)
+            _CLIENTS[key] = client
+        return client
+
+
+def _record(site: str, ttft: Optional[float], total: float, chars: int, ok: bool, cached: bool = False):
+    with _LOCK:
+        m = _METRICS.setdefault(site, {
+            "calls": 0, "errors": 0, "cached": 0, "chars": 0,
+            "ttft_ms": deque(maxlen=METRICS_WINDOW), "total_ms": deque(maxlen=METRICS_WINDOW),
+        })
+        m["calls"] += 1
+        m["errors"] += 0 if ok else 1
+        m["chars"] += chars
+        if cached:  # hit cache tidak ikut statistik latensi generate
+            m["cached"] += 1
+            return
+        if ttft is not None:
+            m["ttft_ms"].append(ttft * 1000)
+        m["total_ms"].append(total * 1000)
+
+
+def _cache_key(model: str, messages: List[Dict[str, str]], params: Dict[str, Any], question: Optional[str]) -> str:
+    """Kunci llm_cache dari seluruh pesan & parameter. Hanya `question` (bila ada di pesan terakhir) yang
+    dinormalisasi; sisa teks dibandingkan persis agar angka/tanda minus di data tidak tertukar."""
+    system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+    turns = [dict(m) for m in messages if m["role"] != "system"]
+    if question and turns and question in turns[-1]["content"]:
+        turns[-1]["content"] = turns[-1]["content"].replace(question, "\x00")
+    else:
+        question = ""
+    return llm_cache.make_key(model, system, question, {"turns": turns, "params": params})
+
+
+def stream_chat(
+    messages: List[Dict[str, str]],
+    site: str,
+    model: Optional[str] = None,
+    api_key: Optional[str] = None,
+    timeout: float = 60,
+    cache: bool = False,
+    cache_question: Optional[str] = None,
+    priority: int = llm_scheduler.INTERACTIVE,
+    **params: Any,
+) -> Iterator[str]:
+    """Yield potongan teks jawaban saat tiba. Error dilempar apa adanya (pemanggil yang membungkus).
+    cache: pakai cache persisten; messages harus memuat semua data yang menentukan jawaban.
+    cache_question: teks pertanyaan pengguna di pesan terakhir (huruf besar/tanda baca diabaikan di kunci).
+    priority: llm_scheduler.INTERACTIVE (chat/form) atau llm_scheduler.BACKGROUND (ringkasan otomatis).
+    """
+    started = time.perf_counter()
+    model = model or DEFAULT_MODEL
+    cache_key = _cache_key(model, messages, params, cache_question) if cache else None
+    if cache_key is not None:
+        cached = llm_cache.get(cache_key, site)
+        if cached is not None:
+            _record(site, None, time.perf_counter() - started, len(cached), True, cached=True)
+            yield cached
+            return
+    ttft, chars, ok = None, 0, False
+    parts: List[str] = []
+
+    def start() -> Iterator[str]:
+        stream = get_client(api_key).chat.completions.create(
+            model=model, messages=messages, stream=True, timeout=timeout, **params
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    try:
+        deltas = llm_scheduler.get_scheduler().stream(
+            start,
+            key=llm_scheduler.request_key(model, messages, params),
+            priority=priority,
+            tokens=llm_scheduler.estimate_tokens(messages, params.get("max_tokens")),
+        )
+        for delta in deltas:
+            if ttft is None:
+                ttft = time.perf_counter() - started
+            chars += len(delta)
+            parts.append(delta)
+            yield delta
+        ok = True
+        if cache_key is not None:
+            llm_cache.put(cache_key, "".join(parts), site=site, model=model)
+    finally:
+        _record(site, ttft, time.perf_counter() - started, chars, ok)
+
+
+def complete(
+    messages: List[Dict[str, str]],
+    site: str,
+    on_partial: Optional[Callable[[str], None]] = None,
+    **kwargs: Any,
+) -> str:
+    """Jawaban utuh (tetap via streaming); on_partial(teks_sejauh_ini) dipanggil tiap potongan tiba."""
+    parts: List[str] = []
+    for delta in stream_chat(messages, site, **kwargs):
+        parts.append(delta)
+        if on_partial is not None:
+            on_partial("".join(parts))
+    return "".join(parts)
+
+
+def metrics() -> Dict[str, Dict[str, Any]]:
+    """Ringkasan per call site: jumlah panggilan/error, TTFT & total (ms: mean, p50, p95)."""
+    def summary(values) -> Dict[str, float]:
+        if not values:
+            return {"mean": 0.0, "p50": 0.0, "p95": 0.0}
+        arr = np.asarray(values, dtype=float)
+        return {
+            "mean": round(float(arr.mean()), 1),
+            "p50": round(float(np.percentile(arr, 50)), 1),
+            "p95": round(float(np.percentile(arr, 95)), 1),
+        }
+
+    with _LOCK:
+        return {
+            site: {
+                "calls": m["calls"],
+                "errors": m["errors"],
+                "cached": m["cached"],
+                "chars": m["chars"],
+                "ttft_ms": summary(m["ttft_ms"]),
+                "total_ms": summary(m["total_ms"]),
+            }
+            for site, m in _METRICS.items()
+        }
+
+
+def reset_metrics():
+    with _LOCK:
+        _METRICS.clear()
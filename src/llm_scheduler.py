@@ -0,0 +1,256 @@
+# StuntLytics/src/llm_scheduler.py
+# Penjadwal request LLM process-wide (semua sesi Streamlit & worker AI berbagi satu antrean).
+# - Batas konkurensi (LLM_MAX_CONCURRENCY) dengan prioritas: chat interaktif didahulukan dari
+#   ringkasan background; dalam prioritas yang sama FIFO
+# - Anggaran tokens-per-minute (LLM_TPM_LIMIT) via token bucket (estimasi prompt + max_tokens),
+#   ditarik ulang pada setiap percobaan ulang
+# - 429 / 5xx / gangguan koneksi sebelum token pertama di-retry dengan exponential backoff + jitter
+#   (menghormati Retry-After); 429 juga menjeda seluruh antrean sesaat
+# - Prompt identik yang sedang berjalan tidak dikirim dua kali: peminta berikutnya ikut membaca
+#   stream peminta pertama
+
+import hashlib
+import heapq
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "200000"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+BACKOFF_BASE = 1.0  # detik
+BACKOFF_MAX = 30.0
+DEFAULT_MAX_TOKENS = 1000  # estimasi output bila max_tokens tidak diberikan
+
+INTERACTIVE = 0
+BACKGROUND = 10
+
+
+def estimate_tokens(messages: List[Dict[str, str]], max_tokens: Optional[int] = None) -> int:
+    prompt = sum(len(m.get("content") or "") for m in messages) // 4 + 4 * len(messages)
+    return prompt + (max_tokens or DEFAULT_MAX_TOKENS)
+
+
+def request_key(model: str, messages: List[Dict[str, str]], params: Dict[str, Any]) -> str:
+    raw = json.dumps([model, messages, params], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _status(exc: Exception) -> Optional[int]:
+    return getattr(exc, "status_code", None)
+
+
+def _is_retryable(exc: Exception) -> bool:
+    status = _status(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+class TokenBucket:
+    """Kapasitas = TPM, terisi ulang linear per detik. acquire() memblokir sampai token cukup."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, n: int):
+        n = min(float(n), self.capacity)  # request lebih besar dari kapasitas tetap bisa jalan
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                wait = (n - self.tokens) / self.rate
+            time.sleep(min(wait, 1.0))
+
+    def available(self) -> float:
+        with self._lock:
+            self._refill()
+            return self.tokens
+
+
+class _Shared:
+    """Stream milik satu request yang dibaca juga oleh peminta prompt identik."""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.cond = threading.Condition()
+
+    def publish(self, chunk: str):
+        with self.cond:
+            self.chunks.append(chunk)
+            self.cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self.cond:
+            self.done, self.error = True, error
+            self.cond.notify_all()
+
+    def follow(self) -> Iterator[str]:
+        i = 0
+        while True:
+            with self.cond:
+                while i >= len(self.chunks) and not self.done:
+                    self.cond.wait()
+                pending = self.chunks[i:]
+                done, error = self.done, self.error
+            for chunk in pending:
+                yield chunk
+            i += len(pending)
+            if done and i >= len(self.chunks):
+                if error is not None:
+                    raise error
+                return
+
+
+class Scheduler:
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, tpm: int = TPM_LIMIT, max_retries: int = MAX_RETRIES):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(tpm)
+        self._cond = threading.Condition()
+        self._queue: List[tuple] = []  # heap (prioritas, urutan)
+        self._seq = itertools.count()
+        self._active = 0
+        self._paused_until = 0.0
+        self._inflight: Dict[str, _Shared] = {}
+        self._stats = {"requests": 0, "deduplicated": 0, "retries": 0, "rate_limited": 0, "failed": 0, "wait_ms": 0.0}
+
+    # --- slot konkurensi berprioritas ---
+    def _acquire_slot(self, priority: int):
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if self._queue[0] == ticket and self._active < self.max_concurrency and pause <= 0:
+                    heapq.heappop(self._queue)
+                    self._active += 1
+                    self._cond.notify_all()
+                    return
+                self._cond.wait(timeout=pause if pause > 0 else None)
+
+    def _release_slot(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _pause(self, seconds: float):
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    # --- eksekusi ---
+    def stream(
+        self,
+        start: Callable[[], Iterable[str]],
+        key: str,
+        priority: int = INTERACTIVE,
+        tokens: int = DEFAULT_MAX_TOKENS,
+    ) -> Iterator[str]:
+        """Jalankan start() (-> iterator potongan teks) di bawah batas konkurensi, TPM & retry."""
+        with self._cond:
+            shared = self._inflight.get(key)
+            leader = shared is None
+            if leader:
+                shared = self._inflight[key] = _Shared()
+                self._stats["requests"] += 1
+            else:
+                self._stats["deduplicated"] += 1
+        if not leader:
+            yield from shared.follow()
+            return
+
+        queued = time.perf_counter()
+        error: Optional[BaseException] = None
+        self._acquire_slot(priority)
+        try:
+            self.bucket.acquire(tokens)
+            with self._cond:
+                self._stats["wait_ms"] += (time.perf_counter() - queued) * 1000
+            for attempt in itertools.count():
+                emitted = False
+                try:
+                    for chunk in start():
+                        emitted = True
+                        shared.publish(chunk)
+                        yield chunk
+                    break
+                except Exception as e:
+                    if emitted or attempt >= self.max_retries or not _is_retryable(e):
+                        raise
+                    delay = _retry_after(e) or min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+                    delay *= 1 + random.random() * 0.25
+                    with self._cond:
+                        self._stats["retries"] += 1
+                        if _status(e) == 429:
+                            self._stats["rate_limited"] += 1
+                    if _status(e) == 429:
+                        self._pause(delay)  # provider sedang membatasi: tahan request lain juga
+                    time.sleep(delay)
+                    self.bucket.acquire(tokens)  # percobaan ulang juga memakai anggaran TPM
+        except GeneratorExit:
+            error = RuntimeError("Permintaan LLM dibatalkan sebelum selesai.")
+            raise
+        except BaseException as e:
+            error = e
+            with self._cond:
+                self._stats["failed"] += 1
+            raise
+        finally:
+            self._release_slot()
+            with self._cond:
+                self._inflight.pop(key, None)
+            shared.finish(error)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            s = dict(self._stats)
+            s.update(
+                active=self._active,
+                queued=len(self._queue),
+                paused_s=round(max(0.0, self._paused_until - time.monotonic()), 1),
+                inflight=len(self._inflight),
+            )
+        s["wait_ms"] = round(s["wait_ms"], 1)
+        s["tokens_available"] = int(self.bucket.available())
+        return s
+
+
+_SCHEDULER: Optional[Scheduler] = None
+_INIT_LOCK = threading.Lock()
+
+
+def get_scheduler() -> Scheduler:
+    global _SCHEDULER
+    with _INIT_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = Scheduler()
+        return _SCHEDULER
+
+
+def stats() -> Dict[str, Any]:
+    return get_scheduler().stats()
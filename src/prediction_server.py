@@ -0,0 +1,213 @@
+# StuntLytics/src/prediction_server.py
+# Server prediksi lokal (HTTP, localhost) dengan micro-batching.
+# - Pipeline dimuat SEKALI per proses server (bukan per sesi Streamlit)
+# - Request baris tunggal yang datang bersamaan dikumpulkan dalam jendela latensi kecil,
+#   lalu diskor dengan satu predict_proba ter-vektorisasi per batch
+# - Baris divalidasi per request (prediction_service.prepare_batch) sebelum masuk antrean, sehingga
+#   satu request rusak ditolak 400 dan tidak menggagalkan batch milik request lain
+# - GET /metrics: ukuran batch & latensi antrean (rata-rata, p50, p95)
+#
+# Pemakaian:
+#   python -m src.prediction_server [--port 8765] [--window-ms 5] [--max-batch 256]
+#   lalu set PREDICTION_SERVER_URL=http://127.0.0.1:8765 untuk aplikasi Streamlit.
+
+import argparse
+import json
+import logging
+import queue
+import threading
+import time
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from src import prediction_service
+
+log = logging.getLogger("prediction_server")
+
+DEFAULT_PORT = 8765
+METRICS_WINDOW = 1000  # jumlah batch terakhir yang disimpan untuk statistik
+
+
+class MicroBatcher:
+    """Antrean request -> batch. Satu thread skor; tiap request menunggu Future hasilnya."""
+
+    def __init__(self, pipeline: Any, window_ms: float = 5.0, max_batch: int = 256):
+        self.pipeline = pipeline
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes: deque = deque(maxlen=METRICS_WINDOW)
+        self._queue_ms: deque = deque(maxlen=METRICS_WINDOW)
+        self._predict_ms: deque = deque(maxlen=METRICS_WINDOW)
+        self._requests = 0
+        self._rows = 0
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, rows: List[Dict[str, Any]]) -> Future:
+        fut: Future = Future()
+        self._queue.put((time.perf_counter(), rows, fut))
+        return fut
+
+    def _collect(self) -> List[tuple]:
+        batch = [self._queue.get()]
+        n_rows = len(batch[0][1])
+        deadline = time.perf_counter() + self.window
+        while n_rows < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            n_rows += len(item[1])
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            rows = [r for _, item_rows, _ in batch for r in item_rows]
+            try:
+                proba = self.pipeline.predict_proba(pd.DataFrame(rows))[:, 1]
+            except Exception as e:
+                log.warning("Batch %d baris gagal (%s); diskor per request", len(rows), e)
+                self._score_each(batch)
+                continue
+            done = time.perf_counter()
+
+            offset = 0
+            for _, item_rows, fut in batch:
+                fut.set_result(proba[offset:offset + len(item_rows)].tolist())
+                offset += len(item_rows)
+
+            with self._lock:
+                self._batch_sizes.append(len(rows))
+                self._queue_ms.extend((started - enq) * 1000 for enq, _, _ in batch)
+                self._predict_ms.append((done - started) * 1000)
+                self._requests += len(batch)
+                self._rows += len(rows)
+
+    def _score_each(self, batch: List[tuple]):
+        """Fallback saat batch gabungan gagal: hanya request yang bermasalah yang menerima error."""
+        for _, item_rows, fut in batch:
+            try:
+                fut.set_result(self.pipeline.predict_proba(pd.DataFrame(item_rows))[:, 1].tolist())
+            except Exception as e:
+                fut.set_exception(e)
+
+    def metrics(self) -> Dict[str, Any]:
+        def summary(values) -> Dict[str, float]:
+            if not values:
+                return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+            arr = np.asarray(values, dtype=float)
+            return {
+                "mean": round(float(arr.mean()), 3),
+                "p50": round(float(np.percentile(arr, 50)), 3),
+                "p95": round(float(np.percentile(arr, 95)), 3),
+                "max": round(float(arr.max()), 3),
+            }
+
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "rows": self._rows,
+                "batches": len(self._batch_sizes),
+                "queue_depth": self._queue.qsize(),
+                "batch_size": summary(self._batch_sizes),
+                "queue_latency_ms": summary(self._queue_ms),
+                "predict_ms": summary(self._predict_ms),
+            }
+
+
+def make_handler(batcher: MicroBatcher, timeout: float = 30.0):
+    class Handler(BaseHTTPRequestHandler):
+        def _send(self, status: int, payload: Dict[str, Any]):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, {"status": "ok"})
+            elif self.path == "/metrics":
+                self._send(200, batcher.metrics())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                rows = payload.get("rows")
+                if rows is None and "input" in payload:
+                    rows = [payload["input"]]
+                if not isinstance(rows, list) or not rows or not all(isinstance(r, dict) for r in rows):
+                    raise ValueError("Body harus berisi 'rows' (list of dict) atau 'input' (dict).")
+                prepared = prediction_service.prepare_batch(pd.DataFrame(rows))
+            except Exception as e:
+                self._send(400, {"error": str(e)})
+                return
+            invalid = ~prepared["valid"].to_numpy()
+            if invalid.any():
+                issues = prepared["issues"]
+                self._send(400, {
+                    "error": "Nilai fitur tidak valid.",
+                    "invalid_rows": {str(i): issues.iloc[i] for i in np.flatnonzero(invalid)},
+                })
+                return
+            try:
+                proba = batcher.submit(prepared["features"].to_dict(orient="records")).result(timeout=timeout)
+            except Exception as e:
+                self._send(500, {"error": str(e)})
+                return
+            self._send(200, {"probabilities": proba})
+
+        def log_message(self, fmt, *args):  # akses log per request terlalu ramai
+            log.debug(fmt, *args)
+
+    return Handler
+
+
+def serve(pipeline_path: str = prediction_service.PIPELINE_PATH, host: str = "127.0.0.1",
+          port: int = DEFAULT_PORT, window_ms: float = 5.0, max_batch: int = 256):
+    started = time.perf_counter()
+    pipeline, source = prediction_service.load_inference_pipeline(pipeline_path)
+    log.info("Pipeline %s dimuat (%s) dalam %.2f detik", pipeline_path, source, time.perf_counter() - started)
+    batcher = MicroBatcher(pipeline, window_ms=window_ms, max_batch=max_batch)
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    server.daemon_threads = True
+    log.info("Server prediksi di http://%s:%d (jendela %.1f ms, batch maks %d)", host, port, window_ms, max_batch)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server prediksi stunting lokal dengan micro-batching.")
+    parser.add_argument("--pipeline", default=prediction_service.PIPELINE_PATH)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--window-ms", type=float, default=5.0, help="jendela pengumpulan batch")
+    parser.add_argument("--max-batch", type=int, default=256, help="baris maksimum per batch")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    serve(args.pipeline, args.host, args.port, args.window_ms, args.max_batch)
+
+
+if __name__ == "__main__":
+    main()
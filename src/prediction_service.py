@@ -1,28 +1,359 @@
 import pandas as pd
+import numpy as np
 import joblib
+import re
+import requests
 import streamlit as st
+import hashlib
+import json
+import logging
 import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from src import compiled_pipeline
+
+log = logging.getLogger("prediction_service")
 
 PIPELINE_PATH = "models/stunting_pipeline.joblib"
+RISK_THRESHOLD = 0.5
+# Salinan tanpa kompresi untuk joblib mmap_mode="r": array NumPy dipetakan dari disk, bukan disalin
+MMAP_PIPELINE_PATH = os.getenv("MMAP_PIPELINE_PATH", "models/stunting_pipeline.mmap.joblib")
+# Inferensi lewat src/compiled_pipeline (NumPy murni, terverifikasi) bila pipeline didukung
+COMPILED_INFERENCE = os.getenv("COMPILED_INFERENCE", "1") not in ("0", "false", "False")
+# Jika diisi (mis. http://127.0.0.1:8765), skor dikirim ke src/prediction_server (micro-batching)
+PREDICTION_SERVER_URL = os.getenv("PREDICTION_SERVER_URL", "").rstrip("/")
+
+# Skema input pipeline (sama dengan form di halaman prediksi):
+# numeric -> rentang valid; category -> nilai kanonik; flag -> 0/1 (menerima Ya/Tidak)
+FEATURE_SCHEMA: Dict[str, Dict[str, Any]] = {
+    "tinggi_badan_ibu_cm": {"type": "numeric", "min": 130, "max": 200},
+    "lila_saat_hamil_cm": {"type": "numeric", "min": 15.0, "max": 40.0},
+    "bmi_pra_hamil": {"type": "numeric", "min": 10.0, "max": 40.0},
+    "hb_g_dl": {"type": "numeric", "min": 5.0, "max": 20.0},
+    "kenaikan_bb_hamil_kg": {"type": "numeric", "min": 0, "max": 30},
+    "usia_ibu_saat_hamil_tahun": {"type": "numeric", "min": 15, "max": 50},
+    "jarak_kehamilan_sebelumnya_bulan": {"type": "numeric", "min": 0, "max": 120},
+    "kunjungan_anc_x": {"type": "numeric", "min": 0, "max": 20},
+    "jumlah_anak": {"type": "numeric", "min": 0, "max": 15},
+    "kepatuhan_ttd": {"type": "category", "values": ["Rutin", "Tidak Rutin"]},
+    "pendidikan_ibu": {
+        "type": "category",
+        "values": ["SD", "SMP", "SMA", "Diploma", "S1", "S2/S3", "Tidak Sekolah"],
+    },
+    "jenis_pekerjaan_orang_tua": {
+        "type": "category",
+        "values": ["Buruh", "Lainnya", "Nelayan", "PNS/TNI/Polri", "Petani/Buruh Tani", "TKI/TKW", "Wiraswasta"],
+    },
+    "status_pernikahan": {"type": "category", "values": ["Menikah", "Cerai"]},
+    "kepesertaan_program_bantuan": {"type": "category", "values": ["Ya", "Tidak"]},
+    "akses_air_bersih": {"type": "category", "values": ["Ya", "Tidak"]},
+    "paparan_asap_rokok": {"type": "category", "values": ["Ya", "Tidak"]},
+    "hipertensi_ibu": {"type": "flag"},
+    "diabetes_ibu": {"type": "flag"},
+}
+FEATURE_COLUMNS = list(FEATURE_SCHEMA)
+_FLAG_VALUES = {"1": 1, "ya": 1, "true": 1, "y": 1, "0": 0, "tidak": 0, "false": 0, "n": 0}
+
+
+class RemotePipeline:
+    """Klien server prediksi lokal dengan antarmuka predict_proba seperti pipeline sklearn."""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def health(self) -> bool:
+        try:
+            return self._session.get(f"{self.url}/health", timeout=2).status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def metrics(self) -> Dict[str, Any]:
+        r = self._session.get(f"{self.url}/metrics", timeout=5)
+        r.raise_for_status()
+        return r.json()
+
+    def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
+        rows = json.loads(X.to_json(orient="records"))
+        r = self._session.post(f"{self.url}/predict", json={"rows": rows}, timeout=self.timeout)
+        if r.status_code != 200:
+            raise RuntimeError(r.json().get("error", f"HTTP {r.status_code}"))
+        p = np.asarray(r.json()["probabilities"], dtype=float)
+        return np.column_stack([1 - p, p])
+
+
+def export_mmap_artifact(src: str = PIPELINE_PATH, dst: str = MMAP_PIPELINE_PATH, pipeline: Any = None) -> str:
+    """Simpan ulang pipeline tanpa kompresi agar bisa dimuat dengan mmap_mode="r"."""
+    if pipeline is None:
+        pipeline = joblib.load(src)
+    tmp = dst + ".tmp"
+    joblib.dump(pipeline, tmp, compress=0)
+    os.replace(tmp, dst)
+    return dst
+
+
+def mmap_path(path: str = PIPELINE_PATH) -> str:
+    return MMAP_PIPELINE_PATH if path == PIPELINE_PATH else os.path.splitext(path)[0] + ".mmap.joblib"
+
+
+def load_pipeline_file(path: str = PIPELINE_PATH) -> tuple:
+    """Muat pipeline dari disk; pakai artefak mmap bila ada & tidak lebih tua dari file sumber.
+    Hanya membaca — artefak dibuat dengan `python -m src.compiled_pipeline`. Return (pipeline, sumber).
+    """
+    artifact = mmap_path(path)
+    try:
+        if os.path.getmtime(artifact) >= os.path.getmtime(path):
+            return joblib.load(artifact, mmap_mode="r"), "mmap"
+    except Exception:
+        pass  # artefak belum ada / rusak / tidak kompatibel -> muat dari sumber
+    return joblib.load(path), "joblib"
+
+
+def compiled_path(path: str = PIPELINE_PATH) -> str:
+    return os.path.splitext(path)[0] + compiled_pipeline.COMPILED_SUFFIX
+
+
+def verification_sample(n: int = 200, seed: int = 0) -> pd.DataFrame:
+    """Baris acak sesuai FEATURE_SCHEMA (+ SAMPLE_INPUT) untuk memverifikasi pipeline terkompilasi."""
+    rng = np.random.default_rng(seed)
+    data: Dict[str, Any] = {}
+    for name, spec in FEATURE_SCHEMA.items():
+        if spec["type"] == "numeric":
+            data[name] = rng.uniform(spec["min"], spec["max"], n)
+        elif spec["type"] == "category":
+            data[name] = rng.choice(spec["values"], n).astype(object)
+        else:
+            data[name] = rng.integers(0, 2, n)
+    sample = pd.DataFrame(data)
+    return pd.concat([pd.DataFrame([SAMPLE_INPUT]), sample], ignore_index=True)
+
+
+def load_inference_pipeline(path: str = PIPELINE_PATH) -> tuple:
+    """Pipeline untuk inferensi: versi terkompilasi NumPy bila didukung & lolos verifikasi,
+    selain itu pipeline sklearn asli. Artefak <pipeline>.compiled.joblib (dari
+    `python -m src.compiled_pipeline`) dipakai bila mutakhir; selain itu dikompilasi di memori.
+    Return (pipeline, sumber).
+    """
+    pipeline, source = load_pipeline_file(path)
+    if not COMPILED_INFERENCE:
+        return pipeline, source
+    cpath = compiled_path(path)
+    try:
+        if os.path.exists(cpath) and os.path.getmtime(cpath) >= os.path.getmtime(path):
+            compiled = joblib.load(cpath, mmap_mode="r")
+            compiled_pipeline.verify(compiled, pipeline, verification_sample(50))
+        else:
+            compiled = compiled_pipeline.compile_verified(pipeline, verification_sample())
+    except compiled_pipeline.UnsupportedPipeline:
+        return pipeline, source  # komponen tak didukung -> pipeline asli
+    except Exception as e:
+        log.warning("Pipeline terkompilasi tidak dipakai: %s", e)
+        return pipeline, source  # artefak rusak / hasil menyimpang -> pipeline asli
+    compiled.fallback = pipeline  # batch besar tetap lewat sklearn (lihat compiled_pipeline.FALLBACK_CELLS)
+    return compiled, f"{source}+compiled"
+
+
+# ------------------- Singleton pipeline per proses + warm-up -------------------
+# Contoh input representatif (nilai default form) untuk prediksi pemanasan
+SAMPLE_INPUT: Dict[str, Any] = {
+    "tinggi_badan_ibu_cm": 155,
+    "lila_saat_hamil_cm": 25.0,
+    "bmi_pra_hamil": 22.0,
+    "hb_g_dl": 11.0,
+    "kenaikan_bb_hamil_kg": 12,
+    "usia_ibu_saat_hamil_tahun": 28,
+    "jarak_kehamilan_sebelumnya_bulan": 24,
+    "kunjungan_anc_x": 4,
+    "jumlah_anak": 1,
+    "kepatuhan_ttd": "Rutin",
+    "pendidikan_ibu": "SD",
+    "jenis_pekerjaan_orang_tua": "Buruh",
+    "status_pernikahan": "Menikah",
+    "kepesertaan_program_bantuan": "Ya",
+    "akses_air_bersih": "Ya",
+    "paparan_asap_rokok": "Ya",
+    "hipertensi_ibu": 0,
+    "diabetes_ibu": 0,
+}
+
+_PIPELINE: Any = None
+_PIPELINE_LOCK = threading.Lock()
+_WARM_UP_LOCK = threading.Lock()
+_WARM_UP_STARTED = False
+_TIMINGS: Dict[str, Any] = {}
+
+
+def get_pipeline() -> Any:
+    """Pipeline lokal, dimuat sekali per proses (thread-safe). Raise jika file tidak ada/gagal dimuat."""
+    global _PIPELINE
+    if _PIPELINE is not None:
+        return _PIPELINE
+    with _PIPELINE_LOCK:
+        if _PIPELINE is None:
+            if not os.path.exists(PIPELINE_PATH):
+                raise FileNotFoundError(f"File pipeline tidak ditemukan. Pastikan '{PIPELINE_PATH}' ada.")
+            started = time.perf_counter()
+            pipeline, source = load_inference_pipeline(PIPELINE_PATH)
+            _TIMINGS.update({"load_seconds": time.perf_counter() - started, "source": source})
+            _PIPELINE = pipeline
+    return _PIPELINE
+
+
+def warm_up() -> Dict[str, Any]:
+    """Muat pipeline & jalankan satu prediksi agar inisialisasi malas tidak dibayar pengguna pertama."""
+    try:
+        pipeline = get_pipeline()
+        started = time.perf_counter()
+        pipeline.predict_proba(pd.DataFrame([SAMPLE_INPUT]))
+        _TIMINGS["first_predict_seconds"] = time.perf_counter() - started
+    except Exception as e:
+        _TIMINGS["error"] = str(e)
+    return timings()
+
+
+def start_warm_up():
+    """Jalankan warm_up di thread background (sekali per proses); aman dipanggil tiap rerun."""
+    global _WARM_UP_STARTED
+    if PREDICTION_SERVER_URL or _WARM_UP_STARTED:
+        return
+    # Lock terpisah dari _PIPELINE_LOCK: rerun tidak boleh menunggu pemuatan pipeline yang sedang berjalan
+    with _WARM_UP_LOCK:
+        if _WARM_UP_STARTED:
+            return
+        _WARM_UP_STARTED = True
+    threading.Thread(target=warm_up, name="pipeline-warm-up", daemon=True).start()
+
+
+def timings() -> Dict[str, Any]:
+    """load_seconds, source (mmap/joblib), first_predict_seconds, error — yang sudah tersedia."""
+    return dict(_TIMINGS)
 
 
 @st.cache_resource(show_spinner="Memuat pipeline prediksi...")
 def load_pipeline():
     """
-    Memuat pipeline lengkap dari satu file .joblib.
+    Memuat pipeline lengkap (singleton per proses, biasanya sudah dipanaskan saat app start).
+    Jika PREDICTION_SERVER_URL diisi dan server aktif, kembalikan klien server (tanpa memuat model lokal).
     """
+    if PREDICTION_SERVER_URL:
+        remote = RemotePipeline(PREDICTION_SERVER_URL)
+        if remote.health():
+            return remote
+        st.warning(f"Server prediksi {PREDICTION_SERVER_URL} tidak merespons; memakai pipeline lokal.")
     try:
-        if not os.path.exists(PIPELINE_PATH):
-            st.error(f"File pipeline tidak ditemukan. Pastikan '{PIPELINE_PATH}' ada.")
-            return None
-
-        pipeline = joblib.load(PIPELINE_PATH)
-        return pipeline
+        return get_pipeline()
+    except FileNotFoundError as e:
+        st.error(str(e))
+        return None
     except Exception as e:
         st.error(f"Gagal memuat pipeline: {e}")
         return None
 
 
+def categorize(probability: float) -> str:
+    return "Risiko Stunting" if probability > RISK_THRESHOLD else "Risiko Rendah"
+
+
+def _normalize_header(name: Any) -> str:
+    return re.sub(r"[^0-9a-z]+", "_", str(name).strip().lower()).strip("_")
+
+
+def prepare_batch(raw: pd.DataFrame) -> Dict[str, Any]:
+    """Validasi & koersi tabel unggahan ke skema pipeline.
+    Header dicocokkan setelah dinormalisasi (huruf kecil, non-alfanumerik -> '_').
+    Return dict: features (DataFrame kolom FEATURE_COLUMNS), valid (mask bool), issues (Series teks per baris).
+    Raise ValueError jika ada kolom wajib yang tidak ditemukan.
+    """
+    by_norm = {_normalize_header(c): c for c in raw.columns}
+    missing = [f for f in FEATURE_COLUMNS if f not in by_norm]
+    if missing:
+        raise ValueError("Kolom wajib tidak ditemukan: " + ", ".join(missing))
+
+    features = pd.DataFrame(index=raw.index)
+    problems = pd.DataFrame(index=raw.index)
+    for name, spec in FEATURE_SCHEMA.items():
+        col = raw[by_norm[name]]
+        if spec["type"] == "numeric":
+            values = pd.to_numeric(col, errors="coerce")
+            bad = values.isna() | (values < spec["min"]) | (values > spec["max"])
+        else:
+            text = col.astype("string").str.strip()
+            if spec["type"] == "flag":
+                values = text.str.lower().map(_FLAG_VALUES)
+            else:
+                canon = {v.lower(): v for v in spec["values"]}
+                values = text.str.lower().map(canon)
+            bad = values.isna()
+        features[name] = values
+        problems[name] = bad
+
+    issues = problems.apply(lambda row: ", ".join(row.index[row.to_numpy(dtype=bool)]), axis=1)
+    valid = ~problems.any(axis=1)
+    for name, spec in FEATURE_SCHEMA.items():
+        if spec["type"] == "flag":
+            features[name] = features[name].fillna(0).astype(int)
+        elif spec["type"] == "category":
+            features[name] = features[name].astype(object)
+    return {"features": features, "valid": valid, "issues": issues.where(~valid, "")}
+
+
+def predict_batch_proba(pipeline: object, features: pd.DataFrame, chunk_size: int = 5000,
+                        progress: Optional[Callable[[int, int], Any]] = None) -> np.ndarray:
+    """predict_proba (kelas positif) per chunk ter-vektorisasi; progress(selesai, total) per chunk."""
+    n = len(features)
+    out = np.empty(n, dtype=float)
+    for start in range(0, n, chunk_size):
+        chunk = features.iloc[start:start + chunk_size]
+        out[start:start + len(chunk)] = pipeline.predict_proba(chunk)[:, 1]
+        if progress is not None:
+            progress(start + len(chunk), n)
+    return out
+
+
+def run_batch_prediction(pipeline: object, raw: pd.DataFrame, chunk_size: int = 5000,
+                         progress: Optional[Callable[[int, int], Any]] = None) -> Dict[str, Any]:
+    """Skor seluruh baris valid pada tabel unggahan.
+    Return dict: result (tabel asli + Probabilitas Risiko (%), Kategori, Catatan Validasi),
+    rows, scored, invalid, seconds, rows_per_sec, error.
+    """
+    if not pipeline:
+        return {"error": "Pipeline tidak berhasil dimuat."}
+    try:
+        prepared = prepare_batch(raw)
+    except ValueError as e:
+        return {"error": str(e)}
+
+    valid = prepared["valid"].to_numpy()
+    started = time.perf_counter()
+    try:
+        proba = predict_batch_proba(pipeline, prepared["features"][valid], chunk_size, progress)
+    except Exception as e:
+        return {"error": str(e)}
+    seconds = time.perf_counter() - started
+
+    result = raw.copy()
+    prob_col = np.full(len(raw), np.nan)
+    prob_col[valid] = proba
+    result["Probabilitas Risiko (%)"] = np.round(prob_col * 100, 2)
+    result["Kategori"] = [categorize(p) if not np.isnan(p) else "Tidak Valid" for p in prob_col]
+    result["Catatan Validasi"] = prepared["issues"].map(lambda s: f"Tidak valid: {s}" if s else "").to_numpy()
+
+    scored = int(valid.sum())
+    return {
+        "result": result,
+        "rows": len(raw),
+        "scored": scored,
+        "invalid": len(raw) - scored,
+        "seconds": seconds,
+        "rows_per_sec": scored / seconds if seconds > 0 else 0.0,
+        "error": None,
+    }
+
+
 def run_prediction(pipeline: object, input_data: dict) -> dict:
     """
     Menjalankan prediksi menggunakan pipeline yang sudah dimuat.
@@ -32,14 +363,16 @@ def run_prediction(pipeline: object, input_data: dict) -> dict:
         return {"error": "Pipeline tidak berhasil dimuat."}
 
     try:
-        # Konversi dictionary input menjadi DataFrame dengan satu baris
-        input_df = pd.DataFrame([input_data])
+        if hasattr(pipeline, "predict_one"):
+            # Jalur terkompilasi: langsung dari dict, tanpa DataFrame
+            prediction_proba_raw = pipeline.predict_one(input_data)
+        else:
+            # Konversi dictionary input menjadi DataFrame dengan satu baris
+            input_df = pd.DataFrame([input_data])
 
-        # Pipeline akan menangani semua preprocessing (scaling, encoding) secara otomatis
-        prediction_proba_raw = pipeline.predict_proba(input_df)[0][1]
-        prediction_result = (
-            "Risiko Stunting" if prediction_proba_raw > 0.5 else "Risiko Rendah"
-        )
+            # Pipeline akan menangani semua preprocessing (scaling, encoding) secara otomatis
+            prediction_proba_raw = pipeline.predict_proba(input_df)[0][1]
+        prediction_result = categorize(prediction_proba_raw)
 
         return {
             "probability": prediction_proba_raw * 100,
@@ -48,3 +381,115 @@ def run_prediction(pipeline: object, input_data: dict) -> dict:
         }
     except Exception as e:
         return {"probability": 0, "result": "Gagal Prediksi", "error": str(e)}
+
+
+# ------------------- Analisis what-if (sensitivitas) -------------------
+# Faktor yang bisa diintervensi: numerik disapu sepanjang rentang form, kategorikal di-toggle
+SWEEP_NUMERIC = ["hb_g_dl", "lila_saat_hamil_cm", "bmi_pra_hamil", "kunjungan_anc_x", "kenaikan_bb_hamil_kg"]
+SWEEP_CATEGORICAL = ["kepatuhan_ttd", "akses_air_bersih", "paparan_asap_rokok", "kepesertaan_program_bantuan"]
+
+
+def sensitivity_sweep(pipeline: object, input_data: dict, points: int = 25,
+                      numeric: Optional[list] = None, categorical: Optional[list] = None) -> Dict[str, Any]:
+    """Skor semua variasi input (satu faktor diubah per baris) dalam SATU panggilan predict_proba.
+    Return dict: numeric (DataFrame faktor, nilai, probabilitas %), categorical (idem),
+    baseline (% input asli), scenarios, seconds.
+    """
+    numeric = SWEEP_NUMERIC if numeric is None else numeric
+    categorical = SWEEP_CATEGORICAL if categorical is None else categorical
+
+    rows, meta = [dict(input_data)], [("__baseline__", None, "baseline")]
+    for name in numeric:
+        spec = FEATURE_SCHEMA[name]
+        grid = np.linspace(spec["min"], spec["max"], points)
+        if isinstance(spec["min"], int) and isinstance(spec["max"], int):
+            grid = np.unique(np.round(grid).astype(int))
+        for v in grid:
+            rows.append({**input_data, name: v.item()})
+            meta.append((name, v.item(), "numeric"))
+    for name in categorical:
+        for v in FEATURE_SCHEMA[name]["values"]:
+            rows.append({**input_data, name: v})
+            meta.append((name, v, "categorical"))
+
+    started = time.perf_counter()
+    proba = pipeline.predict_proba(pd.DataFrame(rows, columns=list(input_data)))[:, 1] * 100
+    seconds = time.perf_counter() - started
+
+    df = pd.DataFrame(meta, columns=["faktor", "nilai", "jenis"])
+    df["probabilitas"] = proba
+    return {
+        "baseline": float(proba[0]),
+        "numeric": df[df["jenis"] == "numeric"].drop(columns="jenis").astype({"nilai": float}).reset_index(drop=True),
+        "categorical": df[df["jenis"] == "categorical"].drop(columns="jenis").reset_index(drop=True),
+        "scenarios": len(rows),
+        "seconds": seconds,
+    }
+
+
+# ------------------- Cache hasil prediksi (LRU, per proses) -------------------
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "256"))
+
+_RESULT_CACHE: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_RESULT_LOCK = threading.Lock()
+_MODEL_HASHES: Dict[tuple, str] = {}
+
+
+def model_hash(path: str = PIPELINE_PATH) -> str:
+    """Hash isi file pipeline (12 hex); di-memo per (path, mtime, ukuran) agar tidak dibaca ulang."""
+    st_ = os.stat(path)
+    memo_key = (path, st_.st_mtime_ns, st_.st_size)
+    if memo_key not in _MODEL_HASHES:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        _MODEL_HASHES[memo_key] = h.hexdigest()[:12]
+    return _MODEL_HASHES[memo_key]
+
+
+def normalize_input(input_data: dict) -> Dict[str, Any]:
+    """Bentuk kanonik input form: angka -> float dibulatkan, kategori -> ejaan skema, flag -> 0/1."""
+    out: Dict[str, Any] = {}
+    for name, spec in FEATURE_SCHEMA.items():
+        v = input_data.get(name)
+        if spec["type"] == "numeric":
+            out[name] = round(float(v), 4) if v is not None else None
+        elif spec["type"] == "flag":
+            out[name] = _FLAG_VALUES.get(str(v).strip().lower(), v)
+        else:
+            canon = {c.lower(): c for c in spec["values"]}
+            out[name] = canon.get(str(v).strip().lower(), v)
+    return out
+
+
+def cache_key(input_data: dict) -> str:
+    """Kunci cache = input ternormalisasi + versi model (hash file, atau URL server prediksi)."""
+    try:
+        version = model_hash()
+    except OSError:
+        version = PREDICTION_SERVER_URL or "unknown"
+    raw = json.dumps([version, normalize_input(input_data)], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def cached_result(key: str) -> Optional[Dict[str, Any]]:
+    """Salinan entri cache (probability, result, recommendation bila ada) atau None."""
+    with _RESULT_LOCK:
+        hit = _RESULT_CACHE.get(key)
+        if hit is None:
+            return None
+        _RESULT_CACHE.move_to_end(key)
+        return dict(hit)
+
+
+def store_result(key: str, **fields: Any):
+    """Gabungkan field ke entri cache (mis. prediksi dulu, rekomendasi menyusul)."""
+    with _RESULT_LOCK:
+        entry = _RESULT_CACHE.get(key, {})
+        entry.update(fields)
+        _RESULT_CACHE[key] = entry
+        _RESULT_CACHE.move_to_end(key)
+        while len(_RESULT_CACHE) > PREDICTION_CACHE_SIZE:
+            _RESULT_CACHE.popitem(last=False)
+
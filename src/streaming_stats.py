@@ -0,0 +1,200 @@
+# StuntLytics/src/streaming_stats.py
+# Statistik eksak satu-lintasan (mean/kovarians/korelasi) atas SELURUH dokumen terfilter.
+# Dipakai untuk variabel yang tidak bisa ditangani matrix_stats (kategorikal ter-encode / turunan).
+# - Dokumen dialirkan per halaman via PIT + search_after (elastic_client.iter_pit_pages)
+# - Tiap halaman di-update dengan merge batch Chan/Welford (stabil numerik) di NumPy
+# - Partisi (mis. per kabupaten) dihitung paralel lalu digabung dengan rumus merge yang sama
+
+import copy
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from . import elastic_client as es
+
+# ------------------- Encoder variabel kategorikal / turunan -------------------
+_PENDIDIKAN_ORDINAL = {
+    "tidak sekolah": 0,
+    "sd": 1,
+    "smp": 2,
+    "sma": 3,
+    "smk": 3,
+    "d3": 4,
+    "diploma": 4,
+    "s1": 5,
+    "s1+": 5,
+    "s2": 6,
+    "s3": 6,
+    "s2/s3": 6,
+}
+_YA = {"ya", "true", "1", "layak", "ada", "bersih", "aman", "lengkap"}
+_TIDAK = {"tidak", "false", "0", "tidak layak", "tidak ada", "tidak lengkap"}
+
+
+def _map_values(series: pd.Series, mapping: Dict[str, float]) -> pd.Series:
+    return series.astype("string").str.strip().str.lower().map(mapping).astype(float)
+
+
+def _binary(series: pd.Series) -> pd.Series:
+    mapping = {**{k: 1.0 for k in _YA}, **{k: 0.0 for k in _TIDAK}}
+    return _map_values(series, mapping)
+
+
+# nama variabel -> (field sumber ES, fungsi encode Series -> float)
+ENCODED_VARIABLES: Dict[str, tuple] = {
+    "Pendidikan Ibu (ordinal)": ("Pendidikan Ibu", lambda s: _map_values(s, _PENDIDIKAN_ORDINAL)),
+    "ASI Eksklusif (Ya=1)": ("ASI Eksklusif", _binary),
+    "Akses Air Bersih (Layak=1)": ("Akses Air Bersih", _binary),
+    "BBLR (<2500 g)": ("Berat Lahir (gram)", lambda s: (pd.to_numeric(s, errors="coerce") < 2500).astype(float).where(s.notna())),
+}
+
+
+def encode_frame(df: pd.DataFrame, numeric_fields: List[str], encoded: List[str]) -> np.ndarray:
+    """Satu halaman _source -> matriks float (kolom = numeric_fields + encoded); nilai hilang = NaN."""
+    cols = []
+    for field in numeric_fields:
+        cols.append(pd.to_numeric(df[field], errors="coerce") if field in df else pd.Series(np.nan, index=df.index))
+    for name in encoded:
+        source, fn = ENCODED_VARIABLES[name]
+        cols.append(fn(df[source]) if source in df else pd.Series(np.nan, index=df.index))
+    if not cols:
+        return np.empty((len(df), 0))
+    return np.column_stack([c.to_numpy(dtype=float, na_value=np.nan) for c in cols])
+
+
+# ------------------- Akumulator kovarians (Chan et al.) -------------------
+class CovarianceAccumulator:
+    """Mean & co-moment (M2) berjalan per PASANGAN kolom; update per batch dan merge antar partisi eksak.
+
+    Pairwise-complete (seperti DataFrame.corr): tiap pasangan memakai semua baris yang kedua nilainya
+    ada, jadi satu field yang jarang terisi / tidak ada di index tidak mengosongkan pasangan lain.
+    Matriks (k x k): n[i, j] = jumlah baris, mean[i, j] = rerata kolom i pada baris pasangan (i, j),
+    m2[i, j] = co-moment pasangan, var_m2[i, j] = M2 kolom i pada baris pasangan (i, j).
+    """
+
+    def __init__(self, columns: List[str]):
+        self.columns = list(columns)
+        k = len(self.columns)
+        self.n = np.zeros((k, k), dtype=np.int64)
+        self.mean = np.zeros((k, k))
+        self.m2 = np.zeros((k, k))
+        self.var_m2 = np.zeros((k, k))
+
+    def _merge_moments(self, n_b: np.ndarray, mean_b: np.ndarray, m2_b: np.ndarray, var_m2_b: np.ndarray):
+        n = self.n + n_b
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weight = np.where(n > 0, n_b / n, 0.0)
+            cross = np.where(n > 0, self.n * n_b / n, 0.0)
+        delta = mean_b - self.mean
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + m2_b + delta * delta.T * cross
+        self.var_m2 = self.var_m2 + var_m2_b + delta * delta * cross
+        self.n = n
+
+    def update(self, x: np.ndarray) -> "CovarianceAccumulator":
+        x = np.asarray(x, dtype=float)
+        if x.ndim != 2 or x.shape[0] == 0:
+            return self
+        present = ~np.isnan(x)
+        mask = present.astype(float)
+        # geser per kolom (rerata nilai yang ada) agar sum(x_i x_j) - n mean_i mean_j tidak kehilangan presisi
+        counts = mask.sum(axis=0)
+        shift = np.where(counts > 0, np.where(present, x, 0.0).sum(axis=0) / np.maximum(counts, 1), 0.0)
+        xs = np.where(present, x - shift, 0.0)
+        n_b = (mask.T @ mask).round().astype(np.int64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean_s = np.where(n_b > 0, (xs.T @ mask) / n_b, 0.0)  # [i, j] = rerata kolom i di baris (i, j)
+        m2_b = xs.T @ xs - n_b * mean_s * mean_s.T
+        var_m2_b = (xs * xs).T @ mask - n_b * mean_s * mean_s
+        mean_b = np.where(n_b > 0, mean_s + shift[:, None], 0.0)
+        self._merge_moments(n_b, mean_b, m2_b, np.maximum(var_m2_b, 0.0))
+        return self
+
+    def merge(self, other: "CovarianceAccumulator") -> "CovarianceAccumulator":
+        if other.columns != self.columns:
+            raise ValueError("Kolom akumulator berbeda; tidak bisa digabung.")
+        self._merge_moments(other.n, other.mean, other.m2, other.var_m2)
+        return self
+
+    def covariance(self, ddof: int = 1) -> pd.DataFrame:
+        denom = self.n - ddof
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cov = np.where(denom > 0, self.m2 / denom, np.nan)
+        return pd.DataFrame(cov, index=self.columns, columns=self.columns)
+
+    def correlation(self) -> pd.DataFrame:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corr = self.m2 / np.sqrt(self.var_m2 * self.var_m2.T)
+        corr[(self.n < 2) | ~np.isfinite(corr)] = np.nan
+        np.fill_diagonal(corr, np.where((np.diag(self.n) >= 2) & (np.diag(self.var_m2) > 0), 1.0, np.nan))
+        return pd.DataFrame(np.clip(corr, -1.0, 1.0), index=self.columns, columns=self.columns)
+
+
+# ------------------- Streaming dari Elasticsearch -------------------
+def _with_clause(body: Dict[str, Any], clause: Dict[str, Any]) -> Dict[str, Any]:
+    body = copy.deepcopy(body)
+    if "match_all" in body["query"]:
+        body["query"] = {"bool": {"must": []}}
+    body["query"]["bool"].setdefault("must", []).append(clause)
+    return body
+
+
+def _accumulate(body: Dict[str, Any], numeric_fields: List[str], encoded: List[str], batch_size: int) -> CovarianceAccumulator:
+    acc = CovarianceAccumulator(numeric_fields + encoded)
+    for hits in es.iter_pit_pages(body, batch_size=batch_size):
+        df = pd.DataFrame([h.get("_source", {}) for h in hits])
+        acc.update(encode_frame(df, numeric_fields, encoded))
+    return acc
+
+
+def stream_covariance(
+    filters: Dict[str, Any],
+    numeric_fields: Optional[List[str]] = None,
+    encoded: Optional[List[str]] = None,
+    partition_field: Optional[str] = "nama_kabupaten_kota",
+    batch_size: int = 5000,
+    max_workers: int = 4,
+    on_partition_done: Optional[Callable[[int, int], Any]] = None,
+) -> CovarianceAccumulator:
+    """Akumulator penuh atas semua dokumen terfilter.
+    Jika partition_field diisi, tiap nilai (mis. kabupaten) dialirkan paralel dengan PIT sendiri,
+    ditambah satu partisi untuk dokumen tanpa field tersebut; hasil partisi digabung (eksak).
+    """
+    numeric_fields = list(numeric_fields if numeric_fields is not None else es.CORR_NUMERIC_FIELDS)
+    encoded = list(encoded if encoded is not None else ENCODED_VARIABLES)
+    sources = sorted(set(numeric_fields) | {ENCODED_VARIABLES[n][0] for n in encoded})
+
+    body = es.build_query(filters)
+    body["_source"] = sources
+
+    if partition_field:
+        values = es.get_unique_field_values(filters, partition_field, size=500)
+        bodies = [_with_clause(body, {"term": {partition_field: v}}) for v in values]
+        bodies.append(_with_clause(body, {"bool": {"must_not": {"exists": {"field": partition_field}}}}))
+    else:
+        bodies = [body]
+
+    total = CovarianceAccumulator(numeric_fields + encoded)
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(bodies)))) as pool:
+        futures = [pool.submit(_accumulate, b, numeric_fields, encoded, batch_size) for b in bodies]
+        for done, fut in enumerate(futures, start=1):
+            total.merge(fut.result())
+            if on_partition_done is not None:
+                on_partition_done(done, len(futures))
+    return total
+
+
+def stream_zscore_correlations(
+    filters: Dict[str, Any],
+    target: str = es.CORR_TARGET_FIELD,
+    numeric_fields: Optional[List[str]] = None,
+    encoded: Optional[List[str]] = None,
+    **kwargs: Any,
+) -> pd.Series:
+    """Seperti es.get_zscore_correlations, tetapi termasuk variabel ter-encode (populasi penuh, streaming)."""
+    acc = stream_covariance(filters, numeric_fields, encoded, **kwargs)
+    corr = acc.correlation()
+    if target not in corr.columns:
+        return pd.Series(dtype=float)
+    return corr[target].drop(target, errors="ignore").dropna()
@@ -0,0 +1,275 @@
+# StuntLytics/src/trend_service.py
+# Layanan tren multi-granularitas dengan cache bucket dasar (harian/bulanan) per filter.
+# - Bucket dasar (total, stunting, jumlah & n probabilitas) di-cache per filter TANPA tanggal
+# - Tampilan mingguan/bulanan/triwulan/tahunan diturunkan di klien (resample), tanpa query baru
+# - Jika rentang tanggal melebar, hanya periode yang belum tercakup yang diambil dari ES
+# - avg_prob memakai es.RISK_PROB_FIELD (sama dengan filter zona risiko)
+
+import copy
+import json
+import threading
+import time
+import numpy as np
+import pandas as pd
+from typing import Any, Dict, List, Optional, Tuple
+
+from . import elastic_client as es
+
+BASE_INTERVALS = ("day", "month")
+# nama tampilan -> aturan resample pandas (label = awal periode)
+VIEWS: Dict[str, str] = {
+    "day": "D",
+    "week": "W-MON",
+    "month": "MS",
+    "quarter": "QS",
+    "year": "YS",
+}
+VIEW_LABELS: Dict[str, str] = {
+    "week": "Mingguan",
+    "month": "Bulanan",
+    "quarter": "Triwulan",
+    "year": "Tahunan",
+}
+CACHE_TTL = 600  # detik; bucket periode berjalan bisa bertambah seiring ingest
+MAX_ENTRIES = 64
+
+_COLUMNS = ["total", "stunting", "prob_sum", "prob_n"]
+_LOCK = threading.Lock()
+# signature -> {"frame": DataFrame, "lo": Timestamp|None, "hi": Timestamp|None, "expires": float}
+_CACHE: Dict[str, Dict[str, Any]] = {}
+
+
+def _signature(filters: Dict[str, Any], base: str) -> str:
+    rest = {k: v for k, v in (filters or {}).items() if k not in ("date_from", "date_to")}
+    return json.dumps([base, rest], sort_keys=True, default=str)
+
+
+def _to_ts(value: Any) -> Optional[pd.Timestamp]:
+    if value is None or value == "":
+        return None
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return ts.normalize()
+
+
+def _bounds(filters: Dict[str, Any], base: str) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+    """Rentang hari inklusif yang diminta; base bulanan dibulatkan ke bulan penuh."""
+    lo, hi = _to_ts(filters.get("date_from")), _to_ts(filters.get("date_to"))
+    if base == "month":
+        lo = lo.replace(day=1) if lo is not None else None
+        hi = (hi + pd.offsets.MonthEnd(0)) if hi is not None else None
+    return lo, hi
+
+
+def _empty_frame() -> pd.DataFrame:
+    return pd.DataFrame(columns=_COLUMNS, index=pd.DatetimeIndex([], name="periode"), dtype=float)
+
+
+def _fetch(filters: Dict[str, Any], lo: Optional[pd.Timestamp], hi: Optional[pd.Timestamp], base: str) -> pd.DataFrame:
+    """Bucket dasar untuk rentang [lo, hi] (hari inklusif, None = tak terbatas)."""
+    f = copy.deepcopy(filters)
+    f["date_from"] = lo.strftime("%Y-%m-%d") if lo is not None else None
+    f["date_to"] = hi.strftime("%Y-%m-%d") if hi is not None else None
+    body = es.build_query(f)
+    body.update({
+        "size": 0,
+        "aggs": {
+            "per_period": {
+                "date_histogram": {"field": "Tanggal", "calendar_interval": base, "min_doc_count": 1},
+                "aggs": {
+                    "stunting_any": {"filter": es.stunting_any_filter()},
+                    "prob": {"stats": {"field": es.RISK_PROB_FIELD}},
+                },
+            }
+        },
+    })
+    res = es.search(body)
+    rows = [
+        {
+            "periode": pd.Timestamp(b["key"], unit="ms"),
+            "total": b["doc_count"],
+            "stunting": b["stunting_any"]["doc_count"],
+            "prob_sum": b["prob"].get("sum") or 0.0,
+            "prob_n": b["prob"].get("count") or 0,
+        }
+        for b in res.get("aggregations", {}).get("per_period", {}).get("buckets", [])
+    ]
+    if not rows:
+        return _empty_frame()
+    return pd.DataFrame(rows).set_index("periode").astype(float)
+
+
+def _missing_spans(lo, hi, cached_lo, cached_hi) -> List[Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]]:
+    """Bagian [lo, hi] yang belum tercakup [cached_lo, cached_hi] (None = tak terbatas)."""
+    spans = []
+    if cached_lo is not None and (lo is None or lo < cached_lo):
+        spans.append((lo, cached_lo - pd.Timedelta(days=1)))
+    if cached_hi is not None and (hi is None or hi > cached_hi):
+        spans.append((cached_hi + pd.Timedelta(days=1), hi))
+    return spans
+
+
+def _union(a, b, pick):
+    return None if a is None or b is None else pick(a, b)
+
+
+def base_buckets(filters: Dict[str, Any], base: str = "day") -> pd.DataFrame:
+    """Bucket dasar untuk filter (termasuk rentang tanggalnya), dari cache bila tercakup."""
+    if base not in BASE_INTERVALS:
+        raise ValueError(f"Interval dasar tidak dikenal: {base}")
+    filters = filters or {}
+    sig = _signature(filters, base)
+    lo, hi = _bounds(filters, base)
+
+    with _LOCK:
+        entry = _CACHE.get(sig)
+        if entry is not None and entry["expires"] < time.time():
+            entry = None
+            del _CACHE[sig]
+
+    if entry is None:
+        frame = _fetch(filters, lo, hi, base)
+        entry = {"frame": frame, "lo": lo, "hi": hi, "expires": time.time() + CACHE_TTL}
+    else:
+        spans = _missing_spans(lo, hi, entry["lo"], entry["hi"])
+        if spans:
+            parts = [entry["frame"]] + [_fetch(filters, s, e, base) for s, e in spans]
+            frame = pd.concat([p for p in parts if not p.empty] or [_empty_frame()]).sort_index()
+            frame = frame[~frame.index.duplicated(keep="last")]
+            entry = {
+                "frame": frame,
+                "lo": _union(lo, entry["lo"], min),
+                "hi": _union(hi, entry["hi"], max),
+                "expires": entry["expires"],
+            }
+
+    with _LOCK:
+        _CACHE[sig] = entry
+        while len(_CACHE) > MAX_ENTRIES:
+            _CACHE.pop(next(iter(_CACHE)))
+
+    frame = entry["frame"]
+    if lo is not None:
+        frame = frame[frame.index >= lo]
+    if hi is not None:
+        frame = frame[frame.index <= hi]
+    return frame
+
+
+def get_trend(filters: Dict[str, Any], view: str = "month", base: str = "day") -> pd.DataFrame:
+    """Seri waktu per periode `view`: total, stunting, stunting_pct (0..100), avg_prob.
+    Index = awal periode (DatetimeIndex bernama 'periode').
+    """
+    if view not in VIEWS:
+        raise ValueError(f"Granularitas tidak dikenal: {view}")
+    if base == "month" and view in ("day", "week"):
+        raise ValueError("Tampilan harian/mingguan membutuhkan bucket dasar harian.")
+    frame = base_buckets(filters, base)
+    if frame.empty:
+        out = _empty_frame()
+    else:
+        out = frame.resample(VIEWS[view]).sum()
+    out = out.copy()
+    out["stunting_pct"] = (out["stunting"] / out["total"] * 100).where(out["total"] > 0, 0.0).round(2)
+    out["avg_prob"] = (out["prob_sum"] / out["prob_n"]).where(out["prob_n"] > 0)
+    out[["total", "stunting"]] = out[["total", "stunting"]].astype(int)
+    out.index.name = "periode"
+    return out[["total", "stunting", "stunting_pct", "avg_prob"]]
+
+
+def stunting_percent(filters: Dict[str, Any], view: str = "month") -> pd.DataFrame:
+    """Bentuk untuk grafik: index periode, satu kolom 'Stunting %'."""
+    return get_trend(filters, view)[["stunting_pct"]].rename(columns={"stunting_pct": "Stunting %"})
+
+
+def trend_records(filters: Dict[str, Any], view: str = "month") -> List[Dict[str, Any]]:
+    """Bentuk list-of-dict (periode, total, stunting, stunting_pct, avg_prob) untuk konteks LLM."""
+    df = get_trend(filters, view)
+    fmt = {"day": "%Y-%m-%d", "week": "%Y-%m-%d", "month": "%Y-%m", "quarter": None, "year": "%Y"}[view]
+    out = []
+    for ts, row in df.iterrows():
+        periode = f"{ts.year}-Q{ts.quarter}" if fmt is None else ts.strftime(fmt)
+        out.append({
+            "periode": periode,
+            "total": int(row["total"]),
+            "stunting": int(row["stunting"]),
+            "stunting_pct": float(row["stunting_pct"]),
+            "avg_prob": None if pd.isna(row["avg_prob"]) else float(row["avg_prob"]),
+        })
+    return out
+
+
+# ------------------- Analisis matriks kecamatan x bulan -------------------
+def _row_slope(y: np.ndarray) -> np.ndarray:
+    """Kemiringan OLS per baris terhadap indeks bulan; sel NaN diabaikan (vektorisasi penuh)."""
+    x = np.arange(y.shape[1], dtype=float)
+    w = ~np.isnan(y)
+    n = w.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_mean = (w * x).sum(axis=1) / n
+        y_mean = np.nansum(y, axis=1) / n
+        dx = np.where(w, x - x_mean[:, None], 0.0)
+        dy = np.where(w, y - y_mean[:, None], 0.0)
+        slope = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+    slope[n < 2] = np.nan
+    return slope
+
+
+def _rolling_rate(stunting: np.ndarray, total: np.ndarray, window: int) -> np.ndarray:
+    """% stunting bergulir (pooled: jumlah kasus / jumlah anak dalam jendela) untuk semua baris sekaligus."""
+    pad = ((0, 0), (1, 0))
+    cs = np.cumsum(np.pad(stunting, pad), axis=1)
+    ct = np.cumsum(np.pad(total, pad), axis=1)
+    s_win = cs[:, window:] - cs[:, :-window]
+    t_win = ct[:, window:] - ct[:, :-window]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(t_win > 0, s_win / t_win * 100, np.nan)
+
+
+def kecamatan_trend_stats(matrix: Dict[str, Any], window: int = 3, min_total: int = 30) -> pd.DataFrame:
+    """Statistik tren per kecamatan dari es.get_kecamatan_month_matrix:
+    slope (poin persen/bulan), perubahan bulan-ke-bulan terakhir, dan % bergulir `window` bulan
+    (terakhir vs jendela sebelumnya). Kecamatan dengan total anak < min_total dibuang.
+    """
+    total = matrix["total"]
+    stunting = matrix["stunting"]
+    if total.size == 0:
+        return pd.DataFrame()
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(total > 0, stunting / total * 100, np.nan)
+    slope = _row_slope(pct)
+    mom = pct[:, -1] - pct[:, -2] if pct.shape[1] >= 2 else np.full(len(pct), np.nan)
+
+    window = max(1, min(window, pct.shape[1]))
+    rolling = _rolling_rate(stunting, total, window)
+    roll_last = rolling[:, -1]
+    roll_prev = rolling[:, -1 - window] if rolling.shape[1] > window else np.full(len(pct), np.nan)
+
+    df = pd.DataFrame({
+        "Kabupaten/Kota": matrix["kabupaten"],
+        "Kecamatan": matrix["kecamatan"],
+        "Total Anak": total.sum(axis=1),
+        "Bulan Berdata": (total > 0).sum(axis=1),
+        "Slope (pp/bulan)": slope,
+        "Perubahan MoM (pp)": mom,
+        f"Rata-rata {window} Bln Terakhir (%)": roll_last,
+        f"Perubahan vs {window} Bln Sebelumnya (pp)": roll_last - roll_prev,
+    })
+    return df[df["Total Anak"] >= min_total].reset_index(drop=True)
+
+
+def fastest_rising(filters: Dict[str, Any], top_n: int = 15, window: int = 3, min_total: int = 30) -> pd.DataFrame:
+    """Peringkat kecamatan dengan kenaikan % stunting tercepat (slope terbesar)."""
+    stats = kecamatan_trend_stats(es.get_kecamatan_month_matrix(filters), window=window, min_total=min_total)
+    if stats.empty:
+        return stats
+    ranked = stats.dropna(subset=["Slope (pp/bulan)"])
+    ranked = ranked[ranked["Slope (pp/bulan)"] > 0]
+    return ranked.nlargest(top_n, "Slope (pp/bulan)").round(2).reset_index(drop=True)
+
+
+def clear_cache():
+    with _LOCK:
+        _CACHE.clear()
@@ -0,0 +1,98 @@
+# StuntLytics/tests/openai_stub.py
+# Server stub kompatibel OpenAI (POST /v1/chat/completions, stream SSE) untuk menguji src.llm_client
+# & src.llm_scheduler tanpa memanggil API sungguhan.
+# - chunks: potongan teks yang dikirim satu per satu, dengan jeda first_delay lalu chunk_delay
+# - fail_with: daftar status HTTP (mis. [429]) untuk request pertama, berurutan, sebelum sukses
+# - retry_after: header Retry-After (detik) untuk respons 429
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+
+
+class OpenAIStub:
+    def __init__(self, chunks: List[str], first_delay: float = 0.0, chunk_delay: float = 0.0,
+                 fail_with: Optional[List[int]] = None, retry_after: Optional[float] = None):
+        self.chunks = chunks
+        self.first_delay = first_delay
+        self.chunk_delay = chunk_delay
+        self.fail_with = list(fail_with or [])
+        self.retry_after = retry_after
+        self.requests: List[dict] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    def __enter__(self) -> "OpenAIStub":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _next_failure(self, body: dict) -> Optional[int]:
+        with self._lock:
+            self.requests.append(body)
+            return self.fail_with.pop(0) if self.fail_with else None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _json(self, status: int, payload: dict, headers: Optional[dict] = None):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _event(self, payload):
+                data = payload if isinstance(payload, str) else json.dumps(payload)
+                raw = f"data: {data}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(raw):X}\r\n".encode("ascii") + raw + b"\r\n")
+                self.wfile.flush()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                status = stub._next_failure(body)
+                if status is not None:
+                    headers = {"retry-after": str(stub.retry_after)} if stub.retry_after is not None else {}
+                    self._json(status, {"error": {"message": f"stub {status}", "type": "stub"}}, headers)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                time.sleep(stub.first_delay)
+                for i, text in enumerate(stub.chunks):
+                    if i:
+                        time.sleep(stub.chunk_delay)
+                    self._event({
+                        "id": "chatcmpl-stub",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": body.get("model", ""),
+                        "choices": [{"index": 0, "delta": {"content": text}, "finish_reason": None}],
+                    })
+                self._event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def log_message(self, fmt, *args):
+                pass
+
+        return Handler
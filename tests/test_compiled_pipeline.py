@@ -0,0 +1,69 @@
+import pickle
+
+import numpy as np
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.impute import SimpleImputer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.tree import DecisionTreeClassifier
+
+from src import compiled_pipeline as cp
+from src import prediction_service as ps
+
+NUMERIC = [n for n, s in ps.FEATURE_SCHEMA.items() if s["type"] != "category"]
+CATEGORY = [n for n, s in ps.FEATURE_SCHEMA.items() if s["type"] == "category"]
+
+
+def _pipeline(model):
+    pre = ColumnTransformer([
+        ("num", Pipeline([("imp", SimpleImputer(strategy="median")), ("sc", StandardScaler())]), NUMERIC),
+        ("cat", Pipeline([("imp", SimpleImputer(strategy="most_frequent")),
+                          ("oh", OneHotEncoder(handle_unknown="ignore"))]), CATEGORY),
+    ])
+    X = ps.verification_sample(400, seed=1)
+    y = (X[NUMERIC[0]].rank(pct=True) + (X[CATEGORY[0]] == X[CATEGORY[0]].iloc[0]) * 0.5 > 0.8).astype(int)
+    return Pipeline([("pre", pre), ("model", model)]).fit(X, y)
+
+
+def _sample_with_gaps():
+    X = ps.verification_sample(300, seed=7)
+    X.loc[::5, NUMERIC[1]] = np.nan
+    X.loc[::7, CATEGORY[0]] = None
+    X.loc[::11, CATEGORY[1]] = "kategori-baru"  # tidak dikenal -> semua nol (handle_unknown="ignore")
+    return X
+
+
+@pytest.mark.parametrize("model", [
+    LogisticRegression(max_iter=1000),
+    DecisionTreeClassifier(max_depth=6, random_state=0),
+    RandomForestClassifier(n_estimators=20, random_state=0),
+    GradientBoostingClassifier(n_estimators=30, random_state=0),
+], ids=["lr", "tree", "forest", "gbdt"])
+def test_compiled_matches_sklearn(model):
+    pipeline = _pipeline(model)
+    compiled = cp.compile_pipeline(pipeline)
+    X = _sample_with_gaps()
+
+    expected = pipeline.predict_proba(X)
+    np.testing.assert_allclose(compiled.predict_proba(X), expected, rtol=0, atol=1e-9)
+    single = [compiled.predict_one(r) for r in X.head(25).to_dict("records")]
+    np.testing.assert_allclose(single, expected[:25, 1], rtol=0, atol=1e-9)
+
+
+def test_large_batches_use_fallback_and_fallback_is_not_pickled():
+    pipeline = _pipeline(RandomForestClassifier(n_estimators=20, random_state=0))
+    compiled = cp.compile_pipeline(pipeline)
+    compiled.fallback = pipeline
+    X = ps.verification_sample(cp.FALLBACK_CELLS // compiled._batch_cells(1) + 1, seed=3)
+
+    calls = []
+    original = pipeline.predict_proba
+    pipeline.predict_proba = lambda df: calls.append(len(df)) or original(df)
+    compiled.predict_proba(X.head(5))
+    compiled.predict_proba(X)
+    assert calls == [len(X)]
+
+    assert pickle.loads(pickle.dumps(compiled)).fallback is None
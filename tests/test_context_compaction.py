@@ -0,0 +1,57 @@
+import json
+
+from src import context_compaction as cc
+
+
+def _context():
+    trend = [{"periode": f"2024-{m:02d}", "total": 1000 + m, "stunting": 100 + m,
+              "stunting_pct": 10.0 + m / 10, "avg_prob": 0.3} for m in range(1, 13)]
+    summary = {
+        "indikator_utama": {"total_lahir": 12000, "total_stunting": 1300, "rasio_stunting": 0.108},
+        "stat_rerata": {"avg_prob": 0.31, "avg_bmi": 21.4},
+        "trend_bulanan": trend,
+    }
+    return {"filters": {"wilayah": ["KOTA BANDUNG"]}, "summary": summary, "extra": {}}
+
+
+def _payload_json(payload: str) -> dict:
+    return json.loads(payload.split("context_json:\n", 1)[1])
+
+
+def test_referenced_sections_are_visible_in_kept_history():
+    """Bagian yang dikirim sebagai referensi (sama_dengan_sebelumnya) harus ada datanya di riwayat
+    yang masih dikirim — juga setelah pesan lama yang memuat data itu terpangkas."""
+    context = _context()
+    history = []
+    answers = ["Singkat.", "Panjang " * 125, "Singkat lagi."]
+    for turn, answer in enumerate(answers + ["-"], start=1):
+        question = "Bagaimana tren bulanan?"
+        messages, sent = cc.build_messages("sistem", question, context, history, budget=1000)
+        referenced = _payload_json(sent["payload"]).get("sama_dengan_sebelumnya", [])
+        kept = [_payload_json(m["content"]) for m in messages[1:-1] if m["content"].startswith("Pertanyaan:")]
+        for name in referenced:
+            assert any(name in p["summary"] for p in kept), f"giliran {turn}: {name} dirujuk tanpa data"
+        history += [
+            {"role": "user", "content": question, "payload": sent["payload"], "ctx_hashes": sent["ctx_hashes"]},
+            {"role": "assistant", "content": answer},
+        ]
+
+
+def test_second_turn_references_identical_section():
+    context = _context()
+    messages, sent = cc.build_messages("sistem", "tren bulanan?", context, [], budget=3000)
+    history = [{"role": "user", "content": "tren bulanan?", "payload": sent["payload"], "ctx_hashes": sent["ctx_hashes"]},
+               {"role": "assistant", "content": "ok"}]
+    _, sent2 = cc.build_messages("sistem", "tren bulanan?", context, history, budget=3000)
+
+    payload = _payload_json(sent2["payload"])
+    assert "trend_bulanan" in payload["sama_dengan_sebelumnya"]
+    assert "trend_bulanan" not in payload["summary"]
+    assert "trend_bulanan" not in sent2["ctx_hashes"]  # hanya bagian yang datanya dikirim
+
+
+def test_compact_context_fits_budget_by_trimming_trends():
+    context = _context()
+    context["summary"]["trend_bulanan"] = context["summary"]["trend_bulanan"] * 4
+    text, _ = cc.compact_context("tren bulanan", context, budget=150)
+    assert cc.estimate_tokens(text) <= 150
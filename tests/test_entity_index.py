@@ -0,0 +1,27 @@
+from src import entity_index
+
+
+def _index():
+    kec_to_wil = {
+        "BANDUNG WETAN": {"KOTA BANDUNG"},
+        "BANDUNG KIDUL": {"KOTA BANDUNG"},
+        "SOREANG": {"KABUPATEN BANDUNG"},
+        "NGAMPRAH": {"KABUPATEN BANDUNG BARAT"},
+    }
+    wilayah = ["KABUPATEN BANDUNG", "KABUPATEN BANDUNG BARAT", "KOTA BANDUNG", "KOTA BOGOR"]
+    return entity_index.EntityIndex(kec_to_wil, wilayah, "v1")
+
+
+def test_wilayah_alias_inside_kecamatan_name_is_ignored():
+    idx = _index()
+    assert idx.detect_wilayah("Bagaimana stunting di kec Bandung Wetan?") == []
+    assert idx.detect_kecamatan("Bagaimana stunting di kec Bandung Wetan?") == ["BANDUNG WETAN"]
+    assert idx.wilayah_for(["BANDUNG WETAN"]) == ["KOTA BANDUNG"]
+
+
+def test_wilayah_next_to_kecamatan_is_still_detected():
+    idx = _index()
+    assert idx.detect_wilayah("Kota Bandung, khususnya kec Bandung Kidul") == ["KOTA BANDUNG"]
+    assert idx.detect_wilayah("bandung dan kab bandung barat") == [
+        "KABUPATEN BANDUNG", "KOTA BANDUNG", "KABUPATEN BANDUNG BARAT",
+    ]
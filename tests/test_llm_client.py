@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from src import llm_client, llm_scheduler
+from tests.openai_stub import OpenAIStub
+
+
+@pytest.fixture
+def stub_env(monkeypatch):
+    """Scheduler baru & metrik bersih per test; base URL diarahkan ke stub oleh test."""
+    monkeypatch.setattr(llm_scheduler, "_SCHEDULER", llm_scheduler.Scheduler(max_concurrency=2, tpm=100_000))
+    llm_client.reset_metrics()
+    yield monkeypatch
+    llm_client.reset_metrics()
+
+
+def test_stream_chat_yields_chunks_as_they_arrive(stub_env):
+    with OpenAIStub(["Halo", ", ", "dunia"], first_delay=0.2, chunk_delay=0.2) as stub:
+        stub_env.setattr(llm_client, "OPENAI_BASE_URL", stub.base_url)
+        started = time.perf_counter()
+        arrivals = []
+        for delta in llm_client.stream_chat([{"role": "user", "content": "tes"}], site="stub", api_key="sk-test"):
+            arrivals.append((delta, time.perf_counter() - started))
+
+    assert "".join(d for d, _ in arrivals) == "Halo, dunia"
+    assert stub.requests[0]["stream"] is True
+    assert stub.requests[0]["model"] == llm_client.DEFAULT_MODEL
+    # potongan pertama tiba sebelum stream selesai (bukan di-buffer sampai akhir)
+    assert arrivals[-1][1] - arrivals[0][1] >= 0.3
+
+
+def test_metrics_record_ttft_and_total(stub_env):
+    with OpenAIStub(["a", "b"], first_delay=0.3, chunk_delay=0.2) as stub:
+        stub_env.setattr(llm_client, "OPENAI_BASE_URL", stub.base_url)
+        text = llm_client.complete([{"role": "user", "content": "tes"}], site="stub", api_key="sk-test")
+
+    m = llm_client.metrics()["stub"]
+    assert text == "ab"
+    assert m["calls"] == 1 and m["errors"] == 0 and m["chars"] == 2
+    assert 250 <= m["ttft_ms"]["mean"] < m["total_ms"]["mean"]
+    assert m["total_ms"]["mean"] - m["ttft_ms"]["mean"] >= 150
+
+
+def test_429_is_retried_after_retry_after_and_charges_tpm_again(stub_env):
+    scheduler = llm_scheduler.Scheduler(max_concurrency=1, tpm=600, max_retries=2)
+    stub_env.setattr(llm_scheduler, "_SCHEDULER", scheduler)
+    messages = [{"role": "user", "content": "tes"}]
+    cost = llm_scheduler.estimate_tokens(messages, 100)
+    with OpenAIStub(["ok"], fail_with=[429], retry_after=0.2) as stub:
+        stub_env.setattr(llm_client, "OPENAI_BASE_URL", stub.base_url)
+        started = time.perf_counter()
+        text = llm_client.complete(messages, site="stub", api_key="sk-test", max_tokens=100)
+        elapsed = time.perf_counter() - started
+
+    stats = scheduler.stats()
+    since_start = time.perf_counter() - started
+    assert text == "ok"
+    assert len(stub.requests) == 2
+    assert elapsed >= 0.2  # Retry-After dihormati
+    assert stats["retries"] == 1 and stats["rate_limited"] == 1 and stats["failed"] == 0
+    # dua percobaan -> dua kali estimasi token ditarik dari bucket (isi ulang 10 token/detik)
+    assert stats["tokens_available"] <= 600 - 2 * cost + 10 * since_start + 1
+
+
+def test_429_exhausting_retries_raises(stub_env):
+    stub_env.setattr(llm_scheduler, "_SCHEDULER", llm_scheduler.Scheduler(max_concurrency=1, max_retries=1))
+    with OpenAIStub(["ok"], fail_with=[429, 429], retry_after=0.05) as stub:
+        stub_env.setattr(llm_client, "OPENAI_BASE_URL", stub.base_url)
+        with pytest.raises(Exception) as exc:
+            llm_client.complete([{"role": "user", "content": "tes"}], site="stub", api_key="sk-test")
+
+    assert getattr(exc.value, "status_code", None) == 429
+    assert len(stub.requests) == 2
+    assert llm_client.metrics()["stub"]["errors"] == 1
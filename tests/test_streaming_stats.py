@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from src.streaming_stats import CovarianceAccumulator
+
+
+def _frame(seed: int = 1, n: int = 4000) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n, 4))
+    x[:, 1] = 3000 + 400 * (0.6 * x[:, 0] + x[:, 1])  # skala besar (mis. berat lahir gram)
+    x[rng.random(n) < 0.3, 2] = np.nan  # field jarang terisi
+    x[rng.random(n) < 0.1, 0] = np.nan
+    x[:, 3] = np.nan  # field tidak ada di index
+    return pd.DataFrame(x, columns=["z", "berat", "jarang", "kosong"])
+
+
+def _accumulate(df: pd.DataFrame, chunks: int = 13, partitions: int = 3) -> CovarianceAccumulator:
+    parts = [CovarianceAccumulator(list(df.columns)) for _ in range(partitions)]
+    for i, chunk in enumerate(np.array_split(df.to_numpy(), chunks)):
+        parts[i % partitions].update(chunk)
+    total = CovarianceAccumulator(list(df.columns))
+    for part in parts:
+        total.merge(part)
+    return total
+
+
+def test_pairwise_matches_pandas_with_sparse_and_empty_fields():
+    df = _frame()
+    acc = _accumulate(df)
+    np.testing.assert_allclose(acc.correlation().to_numpy(), df.corr().to_numpy(), atol=1e-10, equal_nan=True)
+    np.testing.assert_allclose(acc.covariance().to_numpy(), df.cov().to_numpy(), rtol=1e-9, equal_nan=True)
+
+
+def test_empty_field_does_not_drop_other_pairs():
+    corr = _accumulate(_frame()).correlation()
+    assert corr.loc["z", "berat"] > 0.4
+    assert np.isfinite(corr.loc["z", "jarang"])
+    assert corr["kosong"].isna().all()
@@ -16,6 +16,8 @@ ES_URL = os.getenv("ES_URL", "http://localhost:9200")
 STUNTING_INDEX = os.getenv("STUNTING_INDEX", "stunting-data")
 BALITA_INDEX = os.getenv("BALITA_INDEX", "jabar-balita-desa")
 NUTRITION_INDEX = os.getenv("NUTRITION_INDEX", "jabar-tenaga-gizi")
+# Field probabilitas untuk filter zona risiko & rerata avg_prob (selaras dengan src/elastic_client.py)
+RISK_PROB_FIELD = os.getenv("RISK_PROB_FIELD", "Probabilitas Stunting (simulasi)")
 
 
 # ------------------- HTTP helpers -------------------
@@ -74,13 +76,13 @@ def build_query(filters: Dict[str, Any]) -> Dict[str, Any]:
         ranges = []
         for rl in filters["risk_level"]:
             if rl == "Zona 3 (>=0.70)":
-                ranges.append({"range": {"Probabilitas Stunting (simulasi)": {"gte": 0.70}}})
+                ranges.append({"range": {RISK_PROB_FIELD: {"gte": 0.70}}})
             elif rl == "Zona 2 (0.40-<0.70)":
-                ranges.append({"range": {"Probabilitas Stunting (simulasi)": {"gte": 0.40, "lt": 0.70}}})
+                ranges.append({"range": {RISK_PROB_FIELD: {"gte": 0.40, "lt": 0.70}}})
             elif rl == "Zona 1 (0.10-<0.40)":
-                ranges.append({"range": {"Probabilitas Stunting (simulasi)": {"gte": 0.10, "lt": 0.40}}})
+                ranges.append({"range": {RISK_PROB_FIELD: {"gte": 0.10, "lt": 0.40}}})
             elif rl == "Zona 0 (<0.10)":
-                ranges.append({"range": {"Probabilitas Stunting (simulasi)": {"lt": 0.10}}})
+                ranges.append({"range": {RISK_PROB_FIELD: {"lt": 0.10}}})
         if ranges:
             must.append({"bool": {"should": ranges, "minimum_should_match": 1}})
     return {"query": {"bool": {"must": must}}}
@@ -175,44 +177,6 @@ def jumlah_nakes(filters: Dict[str, Any]) -> int:
     return int(round(data["aggregations"]["sum_nakes"]["value"] or 0))
 
 
-def trend_monthly(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """
-    Seri waktu bulanan: total dokumen, jumlah stunting, % stunting, avg probabilitas.
-    Menghormati semua filter yang aktif.
-    """
-    body = build_query(filters)
-    body.update({
-        "size": 0,
-        "aggs": {
-            "per_month": {
-                "date_histogram": {"field": "Tanggal", "calendar_interval": "month"},
-                "aggs": {
-                    "stunting_any": {"filter": {"bool": {"should": [
-                        {"terms": {"Status Stunting (Biner)": ["Stunting","Ya","YA","ya","1","true","TRUE","True"]}},
-                        {"terms": {"Status Stunting (Stunting / Berisiko / Normal)": ["Stunting","stunting"]}},
-                        {"range": {"Z-Score TB/U": {"lte": -2.0}}}
-                    ], "minimum_should_match": 1}}},
-                    "tot": {"filter": {"match_all": {}}},
-                    "avg_prob": {"avg": {"field": "Probabilitas Stunting (simulasi)"}}
-                }
-            }
-        }
-    })
-    res = _es_post(STUNTING_INDEX, "/_search", body)
-    out = []
-    for b in res["aggregations"]["per_month"]["buckets"]:
-        tot = b["tot"]["doc_count"]
-        stg = b["stunting_any"]["doc_count"]
-        pct = (stg / tot * 100) if tot else 0.0
-        out.append({
-            "periode": b["key_as_string"][:7],
-            "total": tot,
-            "stunting": stg,
-            "stunting_pct": round(pct, 2),
-            "avg_prob": b["avg_prob"]["value"],
-        })
-    return out
-
 # ------------------- agregasi level wilayah/kecamatan -------------------
 def _agg_terms(level_field: str, filters: Dict[str, Any], size: int = 2000) -> pd.DataFrame:
     body = build_query(filters)
@@ -291,7 +255,7 @@ def kecamatan_table(filters: Dict[str, Any], min_n: int = 20) -> pd.DataFrame:
             "kec": {
                 "terms": {"field": "Kecamatan", "size": 5000},  # << tanpa .keyword
                 "aggs": {
-                    "avg_prob": {"avg": {"field": "Probabilitas Stunting (simulasi)"}},
+                    "avg_prob": {"avg": {"field": RISK_PROB_FIELD}},
                     "stunting": {"filter": {"bool": {"should": [
                         {"terms": {"Status Stunting (Biner)": ["Stunting","Ya","YA","ya","1","true","TRUE","True"]}},
                         {"terms": {"Status Stunting (Stunting / Berisiko / Normal)": ["Stunting","stunting"]}},
@@ -335,19 +299,25 @@ def kecamatan_table(filters: Dict[str, Any], min_n: int = 20) -> pd.DataFrame:
     return df
 
 
-def summary_for_filters(filters: Dict[str, Any], min_n_kec: int = 30) -> Dict[str, Any]:
-    """Ringkasan padat untuk InsightNow & panel lain — setara pola di beta.py."""
-    # inti
-    cards = count_stunting_and_total(filters)
-    imun  = coverage_immunization(filters)
-    air   = coverage_safe_water(filters)
+# Faktor risiko biner: kunci risiko_count/risiko_pct -> (nama agregasi, filter)
+RISK_AGGS: Dict[str, Tuple[str, Dict[str, Any]]] = {
+    "bblr_lt_2500":    ("risk_bblr",      {"range": {"Berat Lahir (gram)": {"lt": 2500}}}),
+    "anemia_hb_lt_11": ("risk_anemia",    {"range": {"Hb (g/dL)": {"lt": 11.0}}}),
+    "lila_lt_23_5":    ("risk_lila",      {"range": {"LiLA saat Hamil (cm)": {"lt": 23.5}}}),
+    "bmi_lt_18_5":     ("risk_bmi_low",   {"range": {"BMI Pra-Hamil": {"lt": 18.5}}}),
+    "anc_le_2":        ("risk_anc_low",   {"range": {"Kunjungan ANC (x)": {"lte": 2}}}),
+    "zscore_stunting": ("risk_z_stunt",   {"range": {"Z-Score TB/U": {"lte": -2.0}}}),
+    "asi_eks_tidak":   ("risk_asi_tidak", {"terms": {"ASI Eksklusif": ["Tidak","tidak","No","no"]}}),
+}
+
 
-    # agregat & distribusi
+def summary_aggs(filters: Dict[str, Any]) -> Dict[str, Any]:
+    """Satu query agregasi untuk rerata, persentil, distribusi, risiko biner & histogram."""
     body = build_query(filters)
     body.update({
         "size": 0,
         "aggs": {
-            "avg_prob": {"avg": {"field": "Probabilitas Stunting (simulasi)"}},
+            "avg_prob": {"avg": {"field": RISK_PROB_FIELD}},
             "avg_bmi":  {"avg": {"field": "BMI Pra-Hamil"}},
             "avg_lila": {"avg": {"field": "LiLA saat Hamil (cm)"}},
             "avg_hb":   {"avg": {"field": "Hb (g/dL)"}},
@@ -367,20 +337,46 @@ def summary_for_filters(filters: Dict[str, Any], min_n_kec: int = 30) -> Dict[st
             "asi":        {"terms": {"field": "ASI Eksklusif", "size": 10}},
             "pekerjaan":  {"terms": {"field": "Jenis Pekerjaan Orang Tua", "size": 15}},
             # risiko biner
-            "risk_bblr":      {"filter": {"range": {"Berat Lahir (gram)": {"lt": 2500}}}},
-            "risk_anemia":    {"filter": {"range": {"Hb (g/dL)": {"lt": 11.0}}}},
-            "risk_lila":      {"filter": {"range": {"LiLA saat Hamil (cm)": {"lt": 23.5}}}},
-            "risk_bmi_low":   {"filter": {"range": {"BMI Pra-Hamil": {"lt": 18.5}}}},
-            "risk_anc_low":   {"filter": {"range": {"Kunjungan ANC (x)": {"lte": 2}}}},
-            "risk_z_stunt":   {"filter": {"range": {"Z-Score TB/U": {"lte": -2.0}}}},
-            "risk_asi_tidak": {"filter": {"terms": {"ASI Eksklusif": ["Tidak","tidak","No","no"]}}},
+            **{name: {"filter": flt} for name, flt in RISK_AGGS.values()},
             # histogram
             "usia_anak": {"histogram": {"field": "Usia Anak (bulan)", "interval": 6}},
             "usia_ibu":  {"histogram": {"field": "Usia Ibu saat Hamil (tahun)", "interval": 5}},
         }
     })
-    data = _es_post(STUNTING_INDEX, "/_search", body)
-    agg = data["aggregations"]
+    return _es_post(STUNTING_INDEX, "/_search", body)["aggregations"]
+
+
+def _kecamatan_rank(filters: Dict[str, Any], min_n_kec: int) -> Optional[pd.DataFrame]:
+    try:
+        return kecamatan_table(filters, min_n=min_n_kec)
+    except Exception:
+        return None
+
+
+# Bagian-bagian ringkasan yang saling independen (boleh dihitung paralel / di-cache pemanggil)
+SUMMARY_PARTS = {
+    "cards":   lambda f, n: count_stunting_and_total(f),
+    "imun":    lambda f, n: coverage_immunization(f),
+    "air":     lambda f, n: coverage_safe_water(f),
+    "nakes":   lambda f, n: jumlah_nakes(f),
+    "aggs":    lambda f, n: summary_aggs(f),
+    "kec":     _kecamatan_rank,
+    "top_kab": lambda f, n: top_counts("Wilayah", f, size=10).to_dict("records"),
+    "top_kec": lambda f, n: top_counts("Kecamatan", f, size=10).to_dict("records"),
+}
+
+
+def summary_for_filters(filters: Dict[str, Any], trend: List[Dict[str, Any]], min_n_kec: int = 30,
+                        parts: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Ringkasan padat untuk InsightNow & panel lain — setara pola di beta.py.
+    `parts` (hasil SUMMARY_PARTS yang sudah dihitung) dipakai apa adanya; sisanya dihitung di sini.
+    `trend` wajib diisi pemanggil (tren bulanan dari src.trend_service) karena modul ini tidak menghitungnya.
+    """
+    parts = dict(parts or {})
+    for name, fn in SUMMARY_PARTS.items():
+        if name not in parts:
+            parts[name] = fn(filters, min_n_kec)
+    cards, agg = parts["cards"], parts["aggs"]
 
     # helper
     total = max(1, int(cards["total"]))
@@ -392,22 +388,18 @@ def summary_for_filters(filters: Dict[str, Any], min_n_kec: int = 30) -> Dict[st
         return [{"key": b["key"], "count": b["doc_count"], "pct": pct(b["doc_count"])} for b in bkts]
 
     # rangkum kecamatan (top/bottom) berdasarkan % stunting
-    try:
-        df_kec = kecamatan_table(filters, min_n=min_n_kec)
+    df_kec = parts["kec"]
+    if df_kec is not None:
         top = df_kec.nlargest(5, "stunting_pct")[["Wilayah","Kecamatan","n","stunting_pct","avg_prob"]].to_dict("records")
         bot = df_kec.nsmallest(5, "stunting_pct")[["Wilayah","Kecamatan","n","stunting_pct","avg_prob"]].to_dict("records")
         kec_summary = {"min_n": min_n_kec, "considered": int(df_kec.shape[0]), "top": top, "bottom": bot}
-    except Exception:
+    else:
         kec_summary = {"min_n": min_n_kec, "considered": 0, "top": [], "bottom": []}
 
     avg_upah, avg_ump = agg["avg_upah"]["value"], agg["avg_ump"]["value"]
     rasio_upah_ump = (avg_upah / avg_ump) if (avg_upah and avg_ump and avg_ump != 0) else None
 
-    trend = []
-    try:
-        trend = trend_monthly(filters)[-24:]  # ambil 24 bulan terakhir
-    except Exception:
-        trend = []
+    trend = list(trend)[-24:]  # ambil 24 bulan terakhir
 
     return {
         "filters": filters,
@@ -415,9 +407,9 @@ def summary_for_filters(filters: Dict[str, Any], min_n_kec: int = 30) -> Dict[st
             "total_lahir": cards["total"],
             "total_stunting": cards["stunting"],
             "rasio_stunting": cards["ratio"],    # 0..1
-            "cakupan_imunisasi": coverage_immunization(filters),
-            "akses_air_layak": coverage_safe_water(filters),
-            "jumlah_nakes_gizi": jumlah_nakes(filters),
+            "cakupan_imunisasi": parts["imun"],
+            "akses_air_layak": parts["air"],
+            "jumlah_nakes_gizi": parts["nakes"],
         },
         "stat_rerata": {
             "avg_prob": agg["avg_prob"]["value"],
@@ -445,31 +437,15 @@ def summary_for_filters(filters: Dict[str, Any], min_n_kec: int = 30) -> Dict[st
             "asi":          dist(agg["asi"]["buckets"]),
             "pekerjaan":    dist(agg["pekerjaan"]["buckets"]),
         },
-        "risiko_count": {
-            "bblr_lt_2500":    agg["risk_bblr"]["doc_count"],
-            "anemia_hb_lt_11": agg["risk_anemia"]["doc_count"],
-            "lila_lt_23_5":    agg["risk_lila"]["doc_count"],
-            "bmi_lt_18_5":     agg["risk_bmi_low"]["doc_count"],
-            "anc_le_2":        agg["risk_anc_low"]["doc_count"],
-            "zscore_stunting": agg["risk_z_stunt"]["doc_count"],
-            "asi_eks_tidak":   agg["risk_asi_tidak"]["doc_count"],
-        },
-        "risiko_pct": {
-            "bblr_lt_2500":    pct(agg["risk_bblr"]["doc_count"]),
-            "anemia_hb_lt_11": pct(agg["risk_anemia"]["doc_count"]),
-            "lila_lt_23_5":    pct(agg["risk_lila"]["doc_count"]),
-            "bmi_lt_18_5":     pct(agg["risk_bmi_low"]["doc_count"]),
-            "anc_le_2":        pct(agg["risk_anc_low"]["doc_count"]),
-            "zscore_stunting": pct(agg["risk_z_stunt"]["doc_count"]),
-            "asi_eks_tidak":   pct(agg["risk_asi_tidak"]["doc_count"]),
-        },
+        "risiko_count": {k: agg[name]["doc_count"] for k, (name, _) in RISK_AGGS.items()},
+        "risiko_pct": {k: pct(agg[name]["doc_count"]) for k, (name, _) in RISK_AGGS.items()},
         "histogram": {
             "usia_anak_6_bulanan": [{"bin_start": b["key"], "count": b["doc_count"], "pct": pct(b["doc_count"])} for b in agg["usia_anak"]["buckets"]],
             "usia_ibu_5_tahunan":  [{"bin_start": b["key"], "count": b["doc_count"], "pct": pct(b["doc_count"])} for b in agg["usia_ibu"]["buckets"]],
         },
         "kecamatan_rank": kec_summary,
-        "top10_kabupaten": top_counts("Wilayah", filters, size=10).to_dict("records"),
-        "top10_kecamatan": top_counts("Kecamatan", filters, size=10).to_dict("records"),
+        "top10_kabupaten": parts["top_kab"],
+        "top10_kecamatan": parts["top_kec"],
         "trend_bulanan": trend,  # <<— BARU
 
 